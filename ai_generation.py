@@ -0,0 +1,1759 @@
+"""
+KI-Generierung (Google Gemini) für den Amazon Listing Editor.
+
+Wie listing_io kommt dieses Modul ohne Streamlit aus: app.py hält den Client prozessweit
+(st.cache_resource) und zeigt Fehler an, hier liegt nur die Logik.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from listing_io import FIELD_BYTE_LIMITS
+
+# Optional: Google Gemini SDK
+# pip install google-generativeai
+try:
+    import google.generativeai as genai
+    _HAS_GEMINI = True
+except Exception:
+    _HAS_GEMINI = False
+
+# Bevorzugte Modelle (von bevorzugt zu weniger bevorzugt), falls kein Modell vorgegeben ist
+PREFERRED_GEMINI_MODELS = [
+    "gemini-1.5-pro-002",
+    "gemini-1.5-pro",
+    "gemini-1.5-flash",
+    "gemini-pro",
+    "gemini-1.0-pro",
+]
+
+# So lange gilt ein per list_models() ermitteltes Modell, bevor erneut gesucht wird
+MODEL_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+SYSTEM_PROMPT = "Du bist ein hilfreicher, präziser Assistent."
+
+# Standard-Limits für die Batch-Generierung (überschreibbar über secrets/Umgebung, siehe app.py)
+GEMINI_MAX_WORKERS = 4
+GEMINI_REQUESTS_PER_MINUTE = 60
+GEMINI_TOKENS_PER_MINUTE = 1_000_000
+
+# Zeitlimit je API-Anfrage im asyncio-Pfad (ohne Wartezeit im RateLimiter)
+GEMINI_REQUEST_TIMEOUT_SECONDS = 120
+
+# Takt, in dem ein wartender Aufrufer `poll` aufruft (siehe AsyncGenerationRunner)
+RUNNER_POLL_INTERVAL_SECONDS = 0.5
+
+# Wiederholungen bei vorübergehenden Fehlern (429, 5xx, Zeitüberschreitung)
+GEMINI_MAX_RETRIES = 4
+RETRY_BASE_DELAY_SECONDS = 2.0
+RETRY_MAX_DELAY_SECONDS = 60.0
+
+# Antwort-Cache: Gültigkeit und maximale Anzahl Einträge
+RESPONSE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
+# Listenpreise in USD je 1 Mio. Tokens (Eingabe, Ausgabe) für Prompts bis 128k Tokens.
+# Zuordnung über das längste passende Präfix des Modellnamens - bei Preisänderungen hier anpassen.
+GEMINI_PRICES_PER_MILLION = {
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.0-pro": (0.50, 1.50),
+    "gemini-pro": (0.50, 1.50),
+}
+
+# Protokoll ohne Datenbank: JSONL-Datei und Anzahl Einträge, die im Speicher bzw. in der Datei
+# gehalten werden (die Datei wird beim Doppelten auf die neuesten Einträge gekürzt)
+GENERATION_LOG_PATH = "generation_log.jsonl"
+GENERATION_LOG_MAX_ENTRIES = 10000
+
+# So oft werden zu lange Felder höchstens zum Kürzen zurückgeschickt (0 = nie)
+BYTE_REPAIR_MAX_ROUNDS = 2
+
+# Grobe Schätzung der Antwortlänge eines kompletten Listings (Titel, 5 Bullets, Description, Search Terms)
+EXPECTED_OUTPUT_TOKENS = 1500
+
+
+def pick_gemini_model(models, preferred=PREFERRED_GEMINI_MODELS):
+    """
+    Wählt aus dem Ergebnis von list_models() ein Modell, das generateContent unterstützt.
+
+    Bevorzugte Modelle zuerst, sonst das erste verfügbare. None, wenn keines passt.
+    """
+    available = []
+    for model in models:
+        if "generateContent" in model.supported_generation_methods:
+            available.append(model.name.replace("models/", ""))
+    for model_name in preferred:
+        if model_name in available:
+            return model_name
+    return available[0] if available else None
+
+
+def is_model_not_found(error):
+    """Erkennt Fehler, die bedeuten, dass das Modell (nicht mehr) existiert (HTTP 404 / NotFound)"""
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            code = None
+    if code == 404 or getattr(code, "value", None) == 404 or type(error).__name__ == "NotFound":
+        return True
+    message = str(error).lower()
+    return "not found" in message and "model" in message
+
+
+def is_structured_output_unsupported(error):
+    """Erkennt Fehler, mit denen ein Modell die strukturierte JSON-Ausgabe (response_schema) ablehnt"""
+    message = str(error).lower()
+    return any(hint in message for hint in ("response_mime_type", "response_schema", "json mode",
+                                            "structured output"))
+
+
+def response_usage(response):
+    """
+    Token-Verbrauch laut usage_metadata einer Antwort.
+
+    Returns:
+        dict: {"prompt_tokens", "response_tokens", "total_tokens"} - None, wo die API nichts angibt
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    usage = {}
+    for key, attribute in (("prompt_tokens", "prompt_token_count"), ("response_tokens", "candidates_token_count"),
+                           ("total_tokens", "total_token_count")):
+        value = getattr(metadata, attribute, None)
+        usage[key] = int(value) if value else None
+    if usage["total_tokens"] is None and usage["prompt_tokens"] and usage["response_tokens"]:
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["response_tokens"]
+    return usage
+
+
+def response_token_count(response):
+    """Gesamtzahl Tokens laut usage_metadata einer Antwort (None, wenn nicht vorhanden)"""
+    return response_usage(response)["total_tokens"]
+
+
+def chunk_text(chunk):
+    """Text eines Stream-Stücks ("" für Stücke ohne Text, z.B. das abschließende mit usage_metadata)"""
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+def estimate_tokens(prompt_text, fields=None):
+    """
+    Schätzt den Token-Bedarf eines Aufrufs (ca. 4 Zeichen pro Token + erwartete Antwort).
+
+    Mit `fields` (z.B. beim Kürzen einzelner Felder) wird nur deren Anteil der Antwort angesetzt.
+    """
+    expected = EXPECTED_OUTPUT_TOKENS
+    if fields is not None:
+        expected = EXPECTED_OUTPUT_TOKENS * len(fields) // len(LISTING_RESPONSE_FIELDS)
+    return len(prompt_text) // 4 + expected
+
+
+# ============ ANTWORT PARSEN ============
+
+# Felder, die das Modell als JSON liefern soll (siehe Prompt in app.py)
+LISTING_RESPONSE_FIELDS = ["Titel", "Bullet1", "Bullet2", "Bullet3", "Bullet4", "Bullet5", "Description", "SearchTerms"]
+
+
+def listing_generation_config(fields=None):
+    """
+    generation_config für strukturierte Ausgabe: das Modell antwortet direkt mit JSON, das
+    genau `fields` enthält (Standard: alle LISTING_RESPONSE_FIELDS)
+    """
+    fields = list(fields or LISTING_RESPONSE_FIELDS)
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": {
+            "type": "OBJECT",
+            "properties": {field: {"type": "STRING"} for field in fields},
+            "required": fields,
+        },
+    }
+
+
+LISTING_GENERATION_CONFIG = listing_generation_config()
+LISTING_RESPONSE_SCHEMA = LISTING_GENERATION_CONFIG["response_schema"]
+
+
+def _field_key(name):
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+# Schreibweisen, unter denen Modelle die Felder gelegentlich liefern
+_FIELD_BY_KEY = {_field_key(field): field for field in LISTING_RESPONSE_FIELDS}
+_FIELD_BY_KEY.update({"title": "Titel", "beschreibung": "Description", "searchterm": "SearchTerms",
+                      "suchbegriffe": "SearchTerms"})
+_FIELD_BY_KEY.update({f"bulletpoint{i}": f"Bullet{i}" for i in range(1, 6)})
+
+
+def _listing_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "\n".join(_listing_value(item) for item in value)
+    return value if isinstance(value, str) else str(value)
+
+
+def canonical_listing_fields(data):
+    """Bringt Schlüssel auf die kanonischen Feldnamen (Titel, Bullet1..5, ...) und Werte auf Text"""
+    result = {}
+    for key, value in data.items():
+        field_key = _field_key(key)
+        if field_key in ("bullets", "bulletpoints") and isinstance(value, list):
+            for i, item in enumerate(value[:5], start=1):
+                result[f"Bullet{i}"] = _listing_value(item)
+            continue
+        result[_FIELD_BY_KEY.get(field_key, key)] = _listing_value(value)
+    return result
+
+
+# Längere "Schlüssel" nach einem Anführungszeichen im Text sind Teil des Textes
+_MAX_KEY_LENGTH = 40
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/", "\\": "\\", '"': '"', "'": "'"}
+
+
+class ListingJsonParser:
+    """
+    Toleranter, inkrementeller Parser für die Listing-Antwort (flaches JSON-Objekt mit Texten).
+
+    Verträgt Text oder Code-Fences um das Objekt, fehlende oder überzählige Kommas, unmaskierte
+    Zeilenumbrüche und Anführungszeichen in Werten sowie Schlüssel ohne Anführungszeichen.
+    Ein Anführungszeichen beendet einen Wert nur, wenn danach , } oder ein neuer Schlüssel
+    ("Feld":) folgt - sonst gehört es zum Text. Die Antwort kann stückweise über feed() kommen
+    (Streaming); current() liefert jederzeit den bisherigen Stand einschließlich des gerade
+    entstehenden Werts. `complete` wird erst mit der schließenden Klammer wahr - eine
+    abgeschnittene Antwort bleibt also erkennbar.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.complete = False
+        self._state = "start"
+        self._quote = '"'
+        self._buffer = []
+        self._pending = []
+        self._candidate = []
+        self._escape = None
+        self._key = None
+        self._depth = 0
+
+    def feed(self, chunk):
+        """Verarbeitet das nächste Stück der Antwort und gibt current() zurück"""
+        for char in chunk:
+            self._step(char)
+        return self.current()
+
+    def close(self):
+        """Schließt offene Strings/Werte am Ende der Antwort ab und gibt current() zurück"""
+        if self._state in ("string", "string_end", "maybe_key", "maybe_key_end", "bare", "array"):
+            self._commit()
+        self._state = "done"
+        return self.current()
+
+    def current(self):
+        data = dict(self.fields)
+        if self._state in ("string", "string_end", "maybe_key", "maybe_key_end") and self._key is not None:
+            data[self._key] = "".join(self._buffer)
+        return canonical_listing_fields(data)
+
+    def _commit(self):
+        raw = "".join(self._buffer)
+        if self._state == "bare":
+            raw = raw.strip()
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                value = raw
+        elif self._state == "array":
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                value = raw.strip("[]").strip()
+        else:
+            value = raw
+        if self._key is not None:
+            self.fields[self._key] = value
+        self._key = None
+        self._buffer = []
+        self._pending = []
+        self._candidate = []
+
+    def _reject_key(self, char=None):
+        """
+        Nach einem Anführungszeichen folgte kein Schlüssel: das vorige Anführungszeichen gehört
+        zum Text, alles danach wird erneut gelesen (das neue kann den Wert beenden)
+        """
+        replay = self._candidate + ([char] if char is not None else [])
+        self._buffer.append(self._quote)
+        self._buffer.extend(self._pending)
+        self._pending, self._candidate = [], []
+        self._state = "string"
+        for replayed in replay:
+            self._step(replayed)
+
+    def _read_string_char(self, char):
+        """Zeichen innerhalb eines Strings; gibt True zurück, wenn es das schließende Anführungszeichen ist"""
+        if self._escape is not None:
+            if self._escape.startswith("u"):
+                self._escape += char
+                if len(self._escape) == 5:
+                    try:
+                        self._buffer.append(chr(int(self._escape[1:], 16)))
+                    except ValueError:
+                        self._buffer.append("\\" + self._escape)
+                    self._escape = None
+            elif char == "u":
+                self._escape = "u"
+            else:
+                self._buffer.append(_ESCAPES.get(char, char))
+                self._escape = None
+            return False
+        if char == "\\":
+            self._escape = ""
+            return False
+        if char == self._quote:
+            return True
+        self._buffer.append(char)
+        return False
+
+    def _step(self, char):
+        state = self._state
+        if state == "start":
+            if char == "{":
+                self._state = "key_wait"
+        elif state == "key_wait":
+            if char in "\"'":
+                self._quote = char
+                self._state = "key"
+            elif char == "}":
+                self._state = "done"
+                self.complete = True
+            elif not char.isspace() and char != ",":
+                self._buffer = [char]
+                self._state = "key_bare"
+        elif state == "key":
+            if self._read_string_char(char):
+                self._key = "".join(self._buffer)
+                self._buffer = []
+                self._state = "colon"
+        elif state == "key_bare":
+            if char == ":":
+                self._key = "".join(self._buffer).strip()
+                self._buffer = []
+                self._state = "value_wait"
+            else:
+                self._buffer.append(char)
+        elif state == "colon":
+            if char == ":":
+                self._state = "value_wait"
+            elif char in "\"'":
+                # Doppelpunkt fehlt: direkt den Wert lesen
+                self._quote = char
+                self._state = "string"
+        elif state == "value_wait":
+            if char in "\"'":
+                self._quote = char
+                self._state = "string"
+            elif char == "[":
+                self._buffer = [char]
+                self._depth = 1
+                self._state = "array"
+            elif char == "}":
+                self._state = "done"
+                self.complete = True
+            elif not char.isspace():
+                self._buffer = [char]
+                self._state = "bare"
+        elif state == "string":
+            if self._read_string_char(char):
+                self._pending = []
+                self._state = "string_end"
+        elif state == "string_end":
+            # Ein Anführungszeichen beendet den Wert nur, wenn danach , } oder ein neuer
+            # Schlüssel ("Feld":, auch ohne Komma davor) folgt - sonst war es Teil des Textes
+            if char.isspace():
+                self._pending.append(char)
+            elif char == ",":
+                self._commit()
+                self._state = "key_wait"
+            elif char == "}":
+                self._commit()
+                self._state = "done"
+                self.complete = True
+            elif char in "\"'":
+                self._candidate = [char]
+                self._state = "maybe_key"
+            else:
+                self._buffer.append(self._quote)
+                self._buffer.extend(self._pending)
+                self._pending = []
+                self._state = "string"
+                if self._read_string_char(char):
+                    self._state = "string_end"
+        elif state == "maybe_key":
+            self._candidate.append(char)
+            if char == self._candidate[0]:
+                self._state = "maybe_key_end"
+            elif len(self._candidate) > _MAX_KEY_LENGTH:
+                self._reject_key()
+        elif state == "maybe_key_end":
+            if char.isspace():
+                self._candidate.append(char)
+            elif char == ":":
+                key = "".join(self._candidate).strip()[1:-1]
+                self._commit()
+                self._key = key
+                self._state = "value_wait"
+            else:
+                self._reject_key(char)
+        elif state == "bare":
+            if char in ",}\n":
+                self._commit()
+                self._state = "key_wait"
+                if char == "}":
+                    self._state = "done"
+                    self.complete = True
+            else:
+                self._buffer.append(char)
+        elif state == "array":
+            self._buffer.append(char)
+            if char == "[":
+                self._depth += 1
+            elif char == "]":
+                self._depth -= 1
+                if not self._depth:
+                    self._commit()
+                    self._state = "key_wait"
+
+
+def parse_listing_json(text, required=None):
+    """
+    Liest das Listing-JSON aus einer Modell-Antwort.
+
+    Gültiges JSON (strukturierte Ausgabe) wird direkt übernommen; alles andere repariert
+    ListingJsonParser lokal, statt einen neuen API-Aufruf zu brauchen. Abgeschnittene oder
+    unvollständige Antworten werden nicht repariert, sondern abgelehnt - sie sollen weder
+    gecacht noch als fertig übernommen werden.
+
+    Args:
+        required: Felder, die die Antwort enthalten muss (Standard: LISTING_RESPONSE_FIELDS)
+
+    Raises:
+        ValueError: Wenn die Antwort kein JSON-Objekt enthält, abgeschnitten ist oder Felder fehlen
+    """
+    required = LISTING_RESPONSE_FIELDS if required is None else required
+    text = (text or "").strip()
+    data = None
+    try:
+        loaded = json.loads(text)
+        if isinstance(loaded, dict):
+            data = canonical_listing_fields(loaded)
+    except ValueError:
+        pass
+    if data is None:
+        parser = ListingJsonParser()
+        parser.feed(text)
+        data = parser.close()
+        if not data:
+            raise ValueError("Konnte kein JSON aus der Antwort extrahieren.")
+        if not parser.complete:
+            raise ValueError("Antwort ist unvollständig (JSON-Objekt nicht abgeschlossen).")
+    missing = [field for field in required if field not in data]
+    if missing:
+        raise ValueError(f"Antwort ist unvollständig, es fehlen: {', '.join(missing)}")
+    return data
+
+
+# ============ GEMINI-CLIENT ============
+
+class GenaiBackend:
+    """Dünne Schicht um google.generativeai, damit GeminiClient auch mit anderen Backends arbeitet"""
+
+    def __init__(self, api_key):
+        if not _HAS_GEMINI:
+            raise ImportError("Google Gemini SDK nicht installiert (pip install google-generativeai).")
+        # configure() legt den globalen Client an - einmal pro Prozess statt pro Aufruf
+        genai.configure(api_key=api_key)
+
+    def list_models(self):
+        return genai.list_models()
+
+    def generative_model(self, model_name):
+        return genai.GenerativeModel(model_name)
+
+
+class GeminiClient:
+    """
+    Prozessweiter Gemini-Client.
+
+    - Das Modell wird einmal ermittelt (list_models) und für `ttl` Sekunden gemerkt;
+      ein fest eingestelltes Modell (`model_override`) überspringt die Suche ganz.
+    - GenerativeModel-Instanzen (und damit ihre Verbindung) werden wiederverwendet.
+    - Meldet die API, dass das Modell nicht existiert, wird einmal neu gesucht und wiederholt.
+    - Mit `structured_output` antwortet das Modell als JSON nach listing_generation_config()
+      (je Aufruf nur mit den angefragten Feldern); Modelle, die das ablehnen, werden ohne
+      Schema erneut angefragt (und gemerkt).
+
+    Thread-sicher, damit mehrere Sessions/Worker denselben Client nutzen können.
+    """
+
+    def __init__(self, backend, model_override=None, ttl=MODEL_CACHE_TTL_SECONDS, structured_output=True):
+        self.backend = backend
+        self.model_override = model_override or None
+        self.ttl = ttl
+        self.structured_output = structured_output
+        self.stats = {"requests": 0, "discoveries": 0, "rediscoveries": 0}
+        self._lock = threading.Lock()
+        self._model_name = None
+        self._resolved_at = 0.0
+        self._models = {}
+        self._plain_models = set()
+
+    def model_name(self, refresh=False):
+        """Name des zu verwendenden Modells (None, wenn keines verfügbar ist)"""
+        with self._lock:
+            if self.model_override and not refresh:
+                return self.model_override
+            fresh = time.monotonic() - self._resolved_at < self.ttl
+            if self._model_name and fresh and not refresh:
+                return self._model_name
+            self.stats["discoveries"] += 1
+            self._model_name = pick_gemini_model(self.backend.list_models())
+            self._resolved_at = time.monotonic()
+            return self._model_name
+
+    def model(self, model_name):
+        """Wiederverwendbare GenerativeModel-Instanz für `model_name`"""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = self.backend.generative_model(model_name)
+                self._models[model_name] = model
+            return model
+
+    def generation_config(self, model_name, fields=None):
+        """generation_config für einen Aufruf (None: ohne Schema, z.B. wenn das Modell es ablehnt)"""
+        if not self.structured_output or model_name in self._plain_models:
+            return None
+        return listing_generation_config(fields)
+
+    def _forget(self, model_name):
+        """Verwirft ein nicht (mehr) vorhandenes Modell; ein ungültiges Override wird aufgegeben"""
+        with self._lock:
+            self._models.pop(model_name, None)
+            if model_name == self.model_override:
+                self.model_override = None
+            if model_name == self._model_name:
+                self._model_name = None
+
+    def _recover(self, model_name, error):
+        """
+        Entscheidet nach einem API-Fehler, ob sich eine Wiederholung lohnt.
+
+        Returns:
+            str oder None: "plain" (ohne JSON-Schema erneut), "rediscover" (Modell neu suchen)
+            oder None (Fehler weiterreichen)
+        """
+        if self.structured_output and model_name not in self._plain_models and is_structured_output_unsupported(error):
+            with self._lock:
+                self._plain_models.add(model_name)
+            return "plain"
+        if is_model_not_found(error):
+            self._forget(model_name)
+            self.stats["rediscoveries"] += 1
+            return "rediscover"
+        return None
+
+    def generate_text(self, prompt_text):
+        """Schickt `prompt_text` (mit System-Prompt) an Gemini und gibt den Antworttext zurück"""
+        return self.generate(prompt_text)[0]
+
+    def generate(self, prompt_text, fields=None):
+        """
+        Wie generate_text, liefert zusätzlich den Token-Verbrauch.
+
+        `fields` begrenzt das JSON-Schema der Antwort auf diese Felder (z.B. beim Kürzen).
+
+        Returns:
+            tuple: (Antworttext, response_usage() der Antwort)
+
+        Raises:
+            RuntimeError: Wenn kein Modell mit generateContent verfügbar ist
+            Exception: Fehler der API werden durchgereicht
+        """
+        full_prompt = f"{SYSTEM_PROMPT}\n\n{prompt_text}"
+        model_name = self.model_name()
+        recovered = set()
+        while True:
+            if not model_name:
+                raise RuntimeError("Kein verfügbares Gemini-Modell gefunden, das generateContent unterstützt.")
+            self.stats["requests"] += 1
+            try:
+                response = self.model(model_name).generate_content(
+                    full_prompt, generation_config=self.generation_config(model_name, fields)
+                )
+                return response.text.strip(), response_usage(response)
+            except Exception as e:
+                recovery = self._recover(model_name, e)
+                if recovery is None or recovery in recovered:
+                    raise
+                recovered.add(recovery)
+                if recovery == "rediscover":
+                    # Modell wurde entfernt/umbenannt: einmal neu suchen und wiederholen
+                    model_name = self.model_name(refresh=True)
+
+    def stream(self, prompt_text, fields=None):
+        """
+        Wie generate, aber mit stream=True: liefert die Antwort stückweise, sobald sie eintrifft.
+
+        Fehler vor dem ersten Stück werden wie in generate behandelt (Modell neu suchen bzw.
+        ohne JSON-Schema wiederholen); danach werden sie durchgereicht.
+
+        Yields:
+            tuple: (Text-Stück, response_usage() des Stücks)
+        """
+        full_prompt = f"{SYSTEM_PROMPT}\n\n{prompt_text}"
+        model_name = self.model_name()
+        recovered = set()
+        while True:
+            if not model_name:
+                raise RuntimeError("Kein verfügbares Gemini-Modell gefunden, das generateContent unterstützt.")
+            self.stats["requests"] += 1
+            received = False
+            try:
+                config = self.generation_config(model_name, fields)
+                for chunk in self.model(model_name).generate_content(full_prompt, stream=True, generation_config=config):
+                    received = True
+                    yield chunk_text(chunk), response_usage(chunk)
+                return
+            except Exception as e:
+                recovery = None if received else self._recover(model_name, e)
+                if recovery is None or recovery in recovered:
+                    raise
+                recovered.add(recovery)
+                if recovery == "rediscover":
+                    model_name = self.model_name(refresh=True)
+
+    async def generate_async(self, prompt_text, fields=None):
+        """
+        Wie generate, aber über generate_content_async (asyncio).
+
+        Die Modellsuche (list_models) läuft in einem Thread, damit sie die Event-Loop nicht
+        blockiert. Backends ohne Async-API werden ebenfalls in einem Thread aufgerufen.
+        """
+        full_prompt = f"{SYSTEM_PROMPT}\n\n{prompt_text}"
+        model_name = await asyncio.to_thread(self.model_name)
+        recovered = set()
+        while True:
+            if not model_name:
+                raise RuntimeError("Kein verfügbares Gemini-Modell gefunden, das generateContent unterstützt.")
+            self.stats["requests"] += 1
+            model = self.model(model_name)
+            config = self.generation_config(model_name, fields)
+            try:
+                if hasattr(model, "generate_content_async"):
+                    response = await model.generate_content_async(full_prompt, generation_config=config)
+                else:
+                    response = await asyncio.to_thread(model.generate_content, full_prompt, generation_config=config)
+                return response.text.strip(), response_usage(response)
+            except Exception as e:
+                recovery = self._recover(model_name, e)
+                if recovery is None or recovery in recovered:
+                    raise
+                recovered.add(recovery)
+                if recovery == "rediscover":
+                    model_name = await asyncio.to_thread(self.model_name, True)
+
+
+# ============ FEHLERBEHANDLUNG & WIEDERHOLUNGEN ============
+
+# Fehlerklassen für classify_gemini_error
+ERROR_RATE_LIMIT = "rate_limit"        # 429 / Kontingent erschöpft - wiederholen, ganzen Pool bremsen
+ERROR_TRANSIENT = "transient"          # 5xx, Zeitüberschreitung, Verbindungsfehler - wiederholen
+ERROR_INVALID_RESPONSE = "invalid"     # Antwort ohne reparierbares JSON - einmal wiederholen
+ERROR_FATAL = "fatal"                  # z.B. ungültiger Key, unzulässige Anfrage - nicht wiederholen
+
+_RATE_LIMIT_STATUS = {429}
+_TRANSIENT_STATUS = {408, 500, 502, 503, 504}
+_RATE_LIMIT_NAMES = {"TooManyRequests", "ResourceExhausted"}
+_TRANSIENT_NAMES = {
+    "ServiceUnavailable", "InternalServerError", "BadGateway", "GatewayTimeout",
+    "DeadlineExceeded", "Aborted", "Unknown",
+}
+
+
+# Statuscode in Fehlermeldungen: am Anfang ("429 Resource has been exhausted") oder als
+# "status 503", "code: 429", "HTTP 503" - nicht irgendeine Ziffernfolge im Text
+_MESSAGE_STATUS_PATTERN = re.compile(
+    r"^\s*([1-5]\d\d)\b(?![.\d])|\b(?:status(?:[ _]?code)?|code|http(?:/\d(?:\.\d)?)?)\s*[:=]?\s*([1-5]\d\d)\b(?![.\d])",
+    re.I,
+)
+
+
+def _message_status(error):
+    """HTTP-Status, den nur die Fehlermeldung nennt (None, wenn keiner erkennbar ist)"""
+    match = _MESSAGE_STATUS_PATTERN.search(str(error))
+    return int(match.group(1) or match.group(2)) if match else None
+
+
+def _error_status(error):
+    """HTTP-Status eines API-Fehlers (google.api_core: .code, andere Clients: .status_code)"""
+    for attribute in ("code", "status_code"):
+        code = getattr(error, attribute, None)
+        if callable(code):
+            try:
+                code = code()
+            except Exception:
+                code = None
+        code = getattr(code, "value", code)
+        if isinstance(code, int):
+            return code
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_gemini_error(error):
+    """Ordnet einen Fehler einer der ERROR_*-Klassen zu"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return ERROR_TRANSIENT
+    if isinstance(error, (ValueError, json.JSONDecodeError)) and _error_status(error) is None:
+        return ERROR_INVALID_RESPONSE
+    status = _error_status(error)
+    if status is None:
+        status = _message_status(error)
+    name = type(error).__name__
+    if status in _RATE_LIMIT_STATUS or name in _RATE_LIMIT_NAMES:
+        return ERROR_RATE_LIMIT
+    if status in _TRANSIENT_STATUS or name in _TRANSIENT_NAMES:
+        return ERROR_TRANSIENT
+    message = str(error).lower()
+    if "quota" in message or "rate limit" in message or "resource exhausted" in message:
+        return ERROR_RATE_LIMIT
+    if "unavailable" in message or "overloaded" in message or "timed out" in message:
+        return ERROR_TRANSIENT
+    return ERROR_FATAL
+
+
+_RETRY_AFTER_PATTERNS = [
+    re.compile(r"retry[ _-]?(?:after|in)\D{0,10}?(\d+(?:\.\d+)?)\s*(ms|s|sec|seconds?)?", re.I),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.I),
+]
+
+
+def retry_after_seconds(error):
+    """
+    Wartezeit, die die API selbst vorgibt (None, wenn keine angegeben ist).
+
+    Ausgewertet werden ein Attribut `retry_after`, der HTTP-Header Retry-After, RetryInfo aus
+    den gRPC-Details (retry_delay) und entsprechende Angaben in der Fehlermeldung.
+    """
+    value = getattr(error, "retry_after", None)
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        header = headers.get("Retry-After") or headers.get("retry-after")
+    except Exception:
+        header = None
+    if header:
+        try:
+            return max(float(header), 0.0)
+        except ValueError:
+            try:
+                from email.utils import parsedate_to_datetime
+                return max((parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+            except Exception:
+                pass
+
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+
+    message = str(error)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            seconds = float(match.group(1))
+            unit = match.group(2) if match.lastindex and match.lastindex >= 2 else None
+            return seconds / 1000 if unit and unit.lower() == "ms" else seconds
+    return None
+
+
+class RetryPolicy:
+    """
+    Wann und wie lange vor einer Wiederholung gewartet wird.
+
+    Exponentielles Backoff mit "Full Jitter" (zufällig zwischen 0 und base * 2^Versuch,
+    höchstens max_delay); gibt die API eine Wartezeit vor, wird diese verwendet.
+    Antworten ohne gültiges JSON werden nur einmal wiederholt, fatale Fehler nie.
+    `rng` ist austauschbar, damit sich das Verhalten deterministisch prüfen lässt.
+    """
+
+    def __init__(self, max_retries=GEMINI_MAX_RETRIES, base_delay=RETRY_BASE_DELAY_SECONDS,
+                 max_delay=RETRY_MAX_DELAY_SECONDS, max_invalid_retries=1, rng=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_invalid_retries = max_invalid_retries
+        self.rng = rng or random.Random()
+
+    def delay(self, error, retries_so_far):
+        """Wartezeit in Sekunden vor dem nächsten Versuch oder None, wenn nicht wiederholt wird"""
+        kind = classify_gemini_error(error)
+        if kind == ERROR_FATAL or retries_so_far >= self.max_retries:
+            return None
+        if kind == ERROR_INVALID_RESPONSE:
+            return 0.0 if retries_so_far < self.max_invalid_retries else None
+        hinted = retry_after_seconds(error)
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** retries_so_far))
+
+
+# ============ ANTWORT-CACHE ============
+
+def response_cache_key(prompt_text, model_name):
+    """Cache-Schlüssel einer Anfrage: SHA-256 über Modell, System-Prompt und Prompt"""
+    payload = f"{model_name}\n{SYSTEM_PROMPT}\n\n{prompt_text}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache für Modell-Antworten mit TTL und Größenlimit (älteste Nutzung fliegt zuerst).
+
+    Standardmäßig im Speicher; Unterklassen ersetzen _load/_store/_evict, um z.B. in der
+    Datenbank zu speichern (siehe DbResponseCache in app.py). Zählt Treffer und Fehlgriffe.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL_SECONDS, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Gespeicherte Antwort oder None"""
+        text = self._load(key)
+        self._count(text is not None)
+        return text
+
+    def lookup(self, key, parse):
+        """
+        Gespeicherte Antwort und ihr geparster Inhalt als (Antwort, parse(Antwort)).
+
+        Nur ein Eintrag, den `parse` annimmt (nicht None), zählt als Treffer; ein unbrauchbarer
+        (z.B. abgeschnittener) Eintrag zählt als Fehlgriff und liefert (None, None).
+        """
+        text = self._load(key)
+        data = parse(text) if text is not None else None
+        self._count(data is not None)
+        return (text, data) if data is not None else (None, None)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key, text, model_name=None, tokens=None):
+        self._store(key, text, model_name, tokens)
+        self._evict()
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, text = entry
+            if time.monotonic() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def _store(self, key, text, model_name, tokens):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), text)
+            self._entries.move_to_end(key)
+
+    def _evict(self):
+        with self._lock:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# ============ PROTOKOLL & KOSTEN ============
+
+def new_batch_id():
+    """Kurze, eindeutige Kennung, unter der alle Aufrufe eines Batches protokolliert werden"""
+    return uuid.uuid4().hex[:12]
+
+
+def estimate_cost(model_name, prompt_tokens, response_tokens, prices=GEMINI_PRICES_PER_MILLION):
+    """Kosten eines Aufrufs in USD (None, wenn für das Modell kein Preis hinterlegt ist)"""
+    matches = [prefix for prefix in prices if str(model_name or "").startswith(prefix)]
+    if not matches:
+        return None
+    input_price, output_price = prices[max(matches, key=len)]
+    return ((prompt_tokens or 0) * input_price + (response_tokens or 0) * output_price) / 1_000_000
+
+
+def log_entry(result, kind="listing", batch_id=None):
+    """Protokollzeile für ein GenerationResult"""
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "batch_id": batch_id,
+        "kind": kind,
+        "model": result.model_name,
+        "prompt_tokens": result.prompt_tokens,
+        "response_tokens": result.response_tokens,
+        "total_tokens": result.tokens,
+        "latency_ms": int(result.api_seconds * 1000),
+        "total_ms": int(result.seconds * 1000),
+        "attempts": result.attempts,
+        "cached": result.cached,
+        "ok": result.ok,
+        "error": None if result.ok else str(result.error)[:500],
+    }
+
+
+def _within_days(entries, days):
+    if not days:
+        return entries
+    cutoff = datetime.now(timezone.utc).timestamp() - days * 24 * 60 * 60
+    return [entry for entry in entries if datetime.fromisoformat(entry["created_at"]).timestamp() >= cutoff]
+
+
+class GenerationLog:
+    """
+    Protokoll aller Gemini-Aufrufe (Tokens, Latenz, Modell, Wiederholungen, Cache-Treffer).
+
+    Diese Basisklasse hält die letzten `max_entries` Einträge im Speicher; Unterklassen
+    schreiben über `_write` und lesen über `_read` (JSONL-Datei, Datenbank in app.py).
+    Fehler beim Protokollieren werden verschluckt - sie dürfen keine Generierung abbrechen.
+    """
+
+    def __init__(self, max_entries=GENERATION_LOG_MAX_ENTRIES):
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def record(self, result, kind="listing", batch_id=None):
+        try:
+            self._write(log_entry(result, kind, batch_id))
+        except Exception:
+            pass
+
+    def entries(self, days=None):
+        """Protokollierte Einträge (optional nur die der letzten `days` Tage), älteste zuerst"""
+        return self._read(days)
+
+    def for_batch(self, batch_id):
+        """Protokoll, das alle Einträge unter `batch_id` schreibt (für die Aufrufe eines Batches)"""
+        return BatchGenerationLog(self, batch_id)
+
+    def _write(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def _read(self, days):
+        with self._lock:
+            return _within_days(list(self._entries), days)
+
+
+class BatchGenerationLog:
+    """Sicht auf ein GenerationLog, die jeden Eintrag einem Batch zuordnet"""
+
+    def __init__(self, log, batch_id):
+        self.log = log
+        self.batch_id = batch_id
+
+    def record(self, result, kind="listing"):
+        self.log.record(result, kind, self.batch_id)
+
+
+class JsonlGenerationLog(GenerationLog):
+    """
+    GenerationLog als JSONL-Datei (eine Zeile je Aufruf) - für den Betrieb ohne Datenbank.
+
+    Wächst die Datei auf mehr als 2 * `max_entries` Zeilen, wird sie auf die neuesten
+    `max_entries` gekürzt (über eine temporäre Datei, damit nie ein halber Stand entsteht).
+    """
+
+    def __init__(self, path=GENERATION_LOG_PATH, max_entries=GENERATION_LOG_MAX_ENTRIES):
+        super().__init__(max_entries)
+        self.path = path
+        self._lines = None  # Zeilen in der Datei, beim ersten Schreiben gezählt
+
+    def _write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            if self._lines is None:
+                self._lines = self._count_lines()
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+            self._lines += 1
+            if self._lines > 2 * self._entries.maxlen:
+                self._truncate()
+
+    def _count_lines(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding="utf-8") as file:
+            return sum(1 for _ in file)
+
+    def _truncate(self):
+        with open(self.path, encoding="utf-8") as file:
+            newest = deque(file, maxlen=self._entries.maxlen)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.writelines(newest)
+        os.replace(temp_path, self.path)
+        self._lines = len(newest)
+
+    def _read(self, days):
+        if not os.path.exists(self.path):
+            return []
+        entries = deque(maxlen=self._entries.maxlen)
+        with self._lock, open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return _within_days(list(entries), days)
+
+
+def _percentile(q):
+    def percentile(values):
+        values = values.dropna()
+        return float(values.quantile(q)) if len(values) else None
+    percentile.__name__ = f"p{int(q * 100)}"
+    return percentile
+
+
+def summarize_generation_log(entries, prices=GEMINI_PRICES_PER_MILLION):
+    """
+    Wertet Protokolleinträge aus.
+
+    Returns:
+        tuple: (DataFrame je Modell mit Latenz-Perzentilen (nur echte API-Aufrufe), Tokens,
+        Wiederholungen und Kosten; DataFrame je Batch mit Aufrufen, Cache-Treffern, Tokens,
+        Latenz (ebenfalls ohne Cache-Treffer), Dauer und Kosten)
+    """
+    df = pd.DataFrame(entries)
+    if df.empty:
+        return df, df
+    df["created_at"] = pd.to_datetime(df["created_at"], utc=True, format="ISO8601")
+    df["cached"] = df["cached"].fillna(False).astype(bool)
+    df["ok"] = df["ok"].fillna(False).astype(bool)
+    df["retries"] = (df["attempts"].fillna(0) - 1).clip(lower=0)
+    df["cost_usd"] = [
+        estimate_cost(model, prompt_tokens, response_tokens, prices)
+        for model, prompt_tokens, response_tokens in zip(df["model"], df["prompt_tokens"], df["response_tokens"])
+    ]
+    df["cost_usd"] = pd.to_numeric(df["cost_usd"])
+
+    # Latenz nur für echte API-Aufrufe - Cache-Treffer würden die Perzentile nach unten ziehen
+    df["api_latency_ms"] = df["latency_ms"].where(~df["cached"])
+    api_calls = df[~df["cached"]]
+    by_model = api_calls.groupby("model", dropna=False).agg(
+        calls=("ok", "size"),
+        errors=("ok", lambda ok: int((~ok).sum())),
+        latency_p50_ms=("latency_ms", _percentile(0.5)),
+        latency_p90_ms=("latency_ms", _percentile(0.9)),
+        latency_p99_ms=("latency_ms", _percentile(0.99)),
+        prompt_tokens_avg=("prompt_tokens", "mean"),
+        response_tokens_avg=("response_tokens", "mean"),
+        retries=("retries", "sum"),
+        cost_usd=("cost_usd", "sum"),
+    ).reset_index()
+
+    batches = df[df["batch_id"].notna()]
+    by_batch = batches.groupby("batch_id").agg(
+        started=("created_at", "min"),
+        finished=("created_at", "max"),
+        calls=("ok", "size"),
+        cache_hits=("cached", "sum"),
+        repairs=("kind", lambda kind: int((kind == "repair").sum())),
+        errors=("ok", lambda ok: int((~ok).sum())),
+        prompt_tokens=("prompt_tokens", "sum"),
+        response_tokens=("response_tokens", "sum"),
+        latency_p90_ms=("api_latency_ms", _percentile(0.9)),
+        cost_usd=("cost_usd", "sum"),
+    ).reset_index().sort_values("started", ascending=False)
+    return by_model, by_batch
+
+
+# ============ BATCH-GENERIERUNG ============
+
+class TokenBucket:
+    """
+    Thread-sicherer Token-Bucket: füllt sich mit `per_minute` Einheiten pro Minute auf,
+    höchstens bis `capacity` (Standard: eine Minute Vorrat).
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, amount):
+        """Entnimmt `amount`, falls verfügbar (gibt 0 zurück), sonst die voraussichtliche Wartezeit"""
+        # Mehr als die Kapazität kann nie verfügbar sein - dann auf volle Kapazität warten
+        amount = min(amount, self.capacity)
+        self._refill()
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount=1):
+        """Blockiert, bis `amount` Einheiten verfügbar sind, und entnimmt sie"""
+        with self._cond:
+            while True:
+                wait = self._take(amount)
+                if not wait:
+                    return
+                self._cond.wait(timeout=min(wait, 1.0))
+
+    async def acquire_async(self, amount=1):
+        """Wie acquire, wartet aber per asyncio.sleep, ohne die Event-Loop zu blockieren"""
+        while True:
+            with self._cond:
+                wait = self._take(amount)
+            if not wait:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def adjust(self, amount):
+        """Bucht nachträglich `amount` Einheiten ab (negativ: Gutschrift); der Stand darf ins Minus gehen"""
+        with self._cond:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """
+    Begrenzt Anfragen und Tokens pro Minute (je ein TokenBucket, 0/None = unbegrenzt).
+
+    Zusätzlich gibt es eine gemeinsame Abkühlphase: Meldet die API für einen Worker
+    "Kontingent erschöpft" (429), wartet über pause() der ganze Pool, statt dass jeder
+    Worker weiter anfragt.
+    """
+
+    def __init__(self, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE, tokens_per_minute=GEMINI_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._pause_lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hält alle Anfragen für (mindestens) `seconds` Sekunden an"""
+        with self._pause_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @property
+    def cooldown_remaining(self):
+        return max(self._paused_until - time.monotonic(), 0.0)
+
+    def acquire(self, estimated_tokens):
+        """Wartet eine laufende Abkühlphase ab, dann auf einen Anfrage-Slot und das Token-Budget"""
+        while self.cooldown_remaining:
+            time.sleep(self.cooldown_remaining)
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens:
+            self.tokens.acquire(estimated_tokens)
+
+    async def acquire_async(self, estimated_tokens):
+        """Wie acquire, für den asyncio-Pfad"""
+        while self.cooldown_remaining:
+            await asyncio.sleep(self.cooldown_remaining)
+        if self.requests:
+            await self.requests.acquire_async(1)
+        if self.tokens:
+            await self.tokens.acquire_async(estimated_tokens)
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Gleicht die Schätzung mit dem tatsächlichen Verbrauch ab"""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+
+class GenerationResult:
+    """Ergebnis einer Generierung (einzeln oder eine Zeile eines Batches)"""
+
+    def __init__(self, index=None, data=None, text=None, error=None, tokens=None, seconds=0.0, cached=False,
+                 attempts=0, model_name=None, repair=None, prompt_tokens=None, response_tokens=None,
+                 api_seconds=0.0):
+        self.index = index
+        self.data = data
+        self.text = text
+        self.error = error
+        self.tokens = tokens
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        # seconds: gesamt inkl. Warten auf den RateLimiter und Wiederholungen; api_seconds: nur API-Aufrufe
+        self.seconds = seconds
+        self.api_seconds = api_seconds
+        self.cached = cached
+        self.attempts = attempts
+        self.model_name = model_name
+        self.repair = repair
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def retries(self):
+        return max(self.attempts - 1, 0)
+
+    def set_usage(self, usage):
+        """Übernimmt response_usage() der erfolgreichen Antwort"""
+        self.tokens = usage["total_tokens"]
+        self.prompt_tokens = usage["prompt_tokens"]
+        self.response_tokens = usage["response_tokens"]
+
+
+def _next_retry_delay(retry, limiter, error, retries_so_far):
+    """Wartezeit vor der nächsten Wiederholung (None = aufgeben); bei 429 pausiert der ganze Pool"""
+    if retry is None:
+        return None
+    delay = retry.delay(error, retries_so_far)
+    if delay is not None and limiter and classify_gemini_error(error) == ERROR_RATE_LIMIT:
+        limiter.pause(delay)
+    return delay
+
+
+def _parse_cached(text, fields=None):
+    """Parst eine gecachte Antwort; unbrauchbare (z.B. unvollständige) Einträge gelten als Fehltreffer"""
+    if text is None:
+        return None
+    try:
+        return parse_listing_json(text, fields)
+    except ValueError:
+        return None
+
+
+def generate_listing(client, prompt_text, limiter=None, cache=None, force=False, retry=None, sleep=time.sleep,
+                     log=None, kind="listing", fields=None):
+    """
+    Generiert und parst ein Listing (gedrosselt über `limiter`, Wiederholungen nach `retry`).
+
+    `fields` fragt nur diese Felder an (Schema und Token-Schätzung), z.B. beim Kürzen.
+
+    Mit `cache` wird eine gespeicherte Antwort für denselben Prompt und dasselbe Modell
+    wiederverwendet; `force` überspringt das Nachschlagen (die neue Antwort wird gespeichert).
+    Mit `log` (GenerationLog) wird der Aufruf als `kind` protokolliert, auch Cache-Treffer.
+
+    Returns:
+        GenerationResult - Fehler stehen in result.error, statt geworfen zu werden
+    """
+    started = time.perf_counter()
+    result = GenerationResult()
+    try:
+        result.model_name = client.model_name()
+        cache_key = response_cache_key(prompt_text, result.model_name) if cache is not None else None
+        if cache_key and not force:
+            text, data = cache.lookup(cache_key, lambda cached: _parse_cached(cached, fields))
+            if data is not None:
+                result.data, result.text, result.tokens, result.cached = data, text, 0, True
+                return result
+        estimated = estimate_tokens(prompt_text, fields)
+        while True:
+            result.attempts += 1
+            try:
+                if limiter:
+                    limiter.acquire(estimated)
+                call_started = time.perf_counter()
+                try:
+                    text, usage = client.generate(prompt_text, fields)
+                finally:
+                    result.api_seconds += time.perf_counter() - call_started
+                if limiter:
+                    limiter.settle(estimated, usage["total_tokens"])
+                result.set_usage(usage)
+                result.data, result.text = parse_listing_json(text, fields), text
+                break
+            except Exception as e:
+                delay = _next_retry_delay(retry, limiter, e, result.attempts - 1)
+                if delay is None:
+                    raise
+                sleep(delay)
+        if cache_key:
+            cache.put(cache_key, result.text, result.model_name, result.tokens)
+    except Exception as e:
+        result.error = e
+    finally:
+        result.seconds = time.perf_counter() - started
+        if log is not None:
+            log.record(result, kind)
+    return result
+
+
+# ============ BYTE-LIMITS ============
+
+def over_limit_fields(data, limits=None):
+    """Felder, deren UTF-8-Länge das Limit überschreitet: {Feld: (Bytes, Limit)}"""
+    limits = FIELD_BYTE_LIMITS if limits is None else limits
+    over = {}
+    for field, limit in limits.items():
+        size = len(str(data.get(field) or "").encode("utf-8"))
+        if size > limit:
+            over[field] = (size, limit)
+    return over
+
+
+def build_shortening_prompt(data, over):
+    """Kompakter Prompt, der nur die zu langen Felder mit ihrem exakten Byte-Budget zurückschickt"""
+    lines = [
+        "Kürze die folgenden Amazon-Listing-Felder so, dass jedes höchstens die angegebene Anzahl "
+        "Bytes (UTF-8) hat. Umlaute und ß zählen 2 Bytes, Leerzeichen 1 Byte. Inhalt, Keywords und "
+        "Tonalität beibehalten, nichts hinzufügen. Antworte ausschließlich als JSON mit genau diesen Feldern.",
+        "",
+    ]
+    for field, (size, limit) in over.items():
+        lines.append(f"{field} (max. {limit} Bytes, aktuell {size}): {json.dumps(data.get(field, ''), ensure_ascii=False)}")
+    return "\n".join(lines)
+
+
+def _apply_shortened(data, over, shortened):
+    """Übernimmt gekürzte Felder, sofern sie tatsächlich kürzer geworden sind"""
+    for field, (size, _) in over.items():
+        value = str(shortened.get(field) or "").strip()
+        if value and len(value.encode("utf-8")) < size:
+            data[field] = value
+
+
+def _repair_report(data, initial, limits):
+    remaining = over_limit_fields(data, limits)
+    return {
+        "rounds": 0, "tokens": 0, "error": None,
+        "fixed": [field for field in initial if field not in remaining],
+        "remaining": remaining,
+    }
+
+
+def repair_byte_limits(client, data, limits=None, max_rounds=BYTE_REPAIR_MAX_ROUNDS, limiter=None, cache=None,
+                       retry=None, sleep=time.sleep, log=None):
+    """
+    Kürzt zu lange Felder gezielt nach: nur die betroffenen Felder gehen mit ihrem exakten
+    Byte-Budget an das Modell zurück, höchstens `max_rounds` Mal.
+
+    Returns:
+        tuple: (Listing mit gekürzten Feldern, Bericht {"rounds", "tokens", "fixed",
+        "remaining": {Feld: (Bytes, Limit)}, "error"})
+    """
+    data = dict(data)
+    initial = over_limit_fields(data, limits)
+    rounds, tokens, error = 0, 0, None
+    over = initial
+    while over and rounds < max_rounds:
+        rounds += 1
+        result = generate_listing(client, build_shortening_prompt(data, over), limiter, cache, retry=retry, sleep=sleep,
+                                  log=log, kind="repair", fields=list(over))
+        tokens += result.tokens or 0
+        if not result.ok:
+            error = result.error
+            break
+        _apply_shortened(data, over, result.data)
+        over = over_limit_fields(data, limits)
+    report = _repair_report(data, initial, limits)
+    report.update(rounds=rounds, tokens=tokens, error=error)
+    return data, report
+
+
+# ============ ASYNCIO-PFAD ============
+
+async def generate_listing_async(client, prompt_text, limiter=None, timeout=GEMINI_REQUEST_TIMEOUT_SECONDS,
+                                 cache=None, force=False, retry=None, log=None, kind="listing", fields=None):
+    """
+    Wie generate_listing, aber als Coroutine mit Zeitlimit je Anfrage.
+
+    Cache-Zugriffe (ggf. Datenbank) laufen in einem Thread, um die Event-Loop nicht zu blockieren.
+    Eine Zeitüberschreitung zählt als vorübergehender Fehler und wird nach `retry` wiederholt.
+
+    Returns:
+        GenerationResult - Fehler stehen in result.error, statt geworfen zu werden
+    """
+    started = time.perf_counter()
+    result = GenerationResult()
+    try:
+        result.model_name = await asyncio.to_thread(client.model_name)
+        cache_key = response_cache_key(prompt_text, result.model_name) if cache is not None else None
+        if cache_key and not force:
+            text, data = await asyncio.to_thread(cache.lookup, cache_key, lambda cached: _parse_cached(cached, fields))
+            if data is not None:
+                result.data, result.text, result.tokens, result.cached = data, text, 0, True
+                return result
+        estimated = estimate_tokens(prompt_text, fields)
+        while True:
+            result.attempts += 1
+            try:
+                if limiter:
+                    await limiter.acquire_async(estimated)
+                call_started = time.perf_counter()
+                try:
+                    text, usage = await asyncio.wait_for(client.generate_async(prompt_text, fields), timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Keine Antwort von Gemini innerhalb von {timeout} s") from None
+                finally:
+                    result.api_seconds += time.perf_counter() - call_started
+                if limiter:
+                    limiter.settle(estimated, usage["total_tokens"])
+                result.set_usage(usage)
+                result.data, result.text = parse_listing_json(text, fields), text
+                break
+            except Exception as e:
+                delay = _next_retry_delay(retry, limiter, e, result.attempts - 1)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+        if cache_key:
+            await asyncio.to_thread(cache.put, cache_key, result.text, result.model_name, result.tokens)
+    except Exception as e:
+        result.error = e
+    finally:
+        result.seconds = time.perf_counter() - started
+        if log is not None:
+            # Das Protokoll kann in der Datenbank liegen - nicht auf der Event-Loop schreiben
+            await asyncio.to_thread(log.record, result, kind)
+    return result
+
+
+async def repair_byte_limits_async(client, data, limits=None, max_rounds=BYTE_REPAIR_MAX_ROUNDS, limiter=None,
+                                   timeout=GEMINI_REQUEST_TIMEOUT_SECONDS, cache=None, retry=None, log=None):
+    """Wie repair_byte_limits, als Coroutine"""
+    data = dict(data)
+    initial = over_limit_fields(data, limits)
+    rounds, tokens, error = 0, 0, None
+    over = initial
+    while over and rounds < max_rounds:
+        rounds += 1
+        prompt_text = build_shortening_prompt(data, over)
+        result = await generate_listing_async(client, prompt_text, limiter, timeout, cache, False, retry, log, "repair",
+                                              list(over))
+        tokens += result.tokens or 0
+        if not result.ok:
+            error = result.error
+            break
+        _apply_shortened(data, over, result.data)
+        over = over_limit_fields(data, limits)
+    report = _repair_report(data, initial, limits)
+    report.update(rounds=rounds, tokens=tokens, error=error)
+    return data, report
+
+
+async def _generate_and_repair_async(client, prompt_text, limiter, timeout, cache, force, retry, repair_rounds,
+                                     log=None):
+    """generate_listing_async, danach (bei Erfolg) repair_byte_limits_async mit `repair_rounds` Runden"""
+    result = await generate_listing_async(client, prompt_text, limiter, timeout, cache, force, retry, log)
+    if result.ok and repair_rounds:
+        result.data, result.repair = await repair_byte_limits_async(
+            client, result.data, max_rounds=repair_rounds, limiter=limiter, timeout=timeout, cache=cache,
+            retry=retry, log=log
+        )
+    return result
+
+
+async def _generate_result_async(index, semaphore, *args):
+    """Eine Zeile eines Batches (höchstens so viele gleichzeitig, wie `semaphore` zulässt)"""
+    async with semaphore:
+        result = await _generate_and_repair_async(*args)
+    result.index = index
+    return result
+
+
+class AsyncGenerationRunner:
+    """
+    Prozessweite Event-Loop in einem eigenen Thread für die asyncio-Generierung.
+
+    Streamlit führt jede Session in einem eigenen Script-Thread aus; diese reichen ihre
+    Coroutines hier ein und warten nur auf ihre eigenen Ergebnisse. Anfragen mehrerer
+    Sessions laufen so gleichzeitig auf derselben Loop, ohne sich gegenseitig zu blockieren.
+
+    Während des Wartens wird alle RUNNER_POLL_INTERVAL_SECONDS `poll(vergangene_sekunden)`
+    aufgerufen. Wirft `poll` (in Streamlit löst jede st-Ausgabe nach einem Klick den
+    Rerun/Stop des Scripts aus), werden die noch offenen Anfragen auf der Loop abgebrochen.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="gemini-async", daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine):
+        """Plant `coroutine` auf der Loop ein und gibt ein concurrent.futures.Future zurück"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    @staticmethod
+    def _wait(future, poll=None, started=None):
+        """Wartet auf `future` und ruft dabei regelmäßig `poll` auf (ohne `poll`: blockierend)"""
+        if poll is None:
+            return future.result()
+        started = time.perf_counter() if started is None else started
+        while True:
+            try:
+                return future.result(timeout=RUNNER_POLL_INTERVAL_SECONDS)
+            except FuturesTimeoutError:
+                poll(time.perf_counter() - started)
+
+    def generate(self, client, prompt_text, limiter=None, timeout=GEMINI_REQUEST_TIMEOUT_SECONDS,
+                 cache=None, force=False, retry=None, repair_rounds=0, log=None, poll=None):
+        """
+        Generiert ein Listing und wartet (nur im aufrufenden Thread) auf das Ergebnis.
+
+        Mit `repair_rounds` werden zu lange Felder anschließend gezielt gekürzt (result.repair).
+
+        Returns:
+            GenerationResult
+        """
+        future = self.submit(_generate_and_repair_async(
+            client, prompt_text, limiter, timeout, cache, force, retry, repair_rounds, log
+        ))
+        try:
+            return self._wait(future, poll)
+        finally:
+            # Hat `poll` abgebrochen (z.B. Streamlit-Rerun), die Anfrage auf der Loop mit abbrechen
+            future.cancel()
+
+    def generate_many(self, client, prompts, concurrency=GEMINI_MAX_WORKERS, limiter=None,
+                      timeout=GEMINI_REQUEST_TIMEOUT_SECONDS, cache=None, force=False, retry=None,
+                      repair_rounds=0, log=None, poll=None):
+        """
+        Generiert mehrere Listings gleichzeitig; höchstens `concurrency` Anfragen sind offen.
+
+        Die Ergebnisse werden in Eingabereihenfolge geliefert, sobald sie (und alle vorherigen)
+        fertig sind - der Aufrufer kann sie z.B. speichern, während die nächsten Zeilen noch
+        generiert werden. Fehler einzelner Zeilen landen im Ergebnis, statt den Batch abzubrechen.
+        Wird der Generator vorzeitig beendet oder wirft `poll` (Abbruch, Rerun), werden alle
+        offenen Anfragen abgebrochen. Zeilen mit gespeicherter Antwort (`cache`) kosten keinen
+        API-Aufruf - ein erneuter Lauf eines teilweise fehlgeschlagenen Batches fragt also nur
+        die fehlgeschlagenen Zeilen an.
+        Das Kürzen zu langer Felder (`repair_rounds`) läuft mit im Slot der jeweiligen Zeile.
+
+        Yields:
+            GenerationResult je Prompt
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        futures = []
+        try:
+            futures = [
+                self.submit(_generate_result_async(
+                    index, semaphore, client, prompt_text, limiter, timeout, cache, force, retry, repair_rounds, log
+                ))
+                for index, prompt_text in enumerate(prompts)
+            ]
+            started = time.perf_counter()
+            for future in futures:
+                yield self._wait(future, poll, started)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+# ============ STREAMING ============
+
+def generate_listing_stream(client, prompt_text, limiter=None, cache=None, force=False, retry=None,
+                            on_update=None, sleep=time.sleep, log=None, fields=None):
+    """
+    Wie generate_listing, aber gestreamt: die Felder werden schon während der Antwort geparst.
+
+    `fields` fragt wie dort nur diese Felder an.
+    `on_update(felder)` wird nach jedem Stück aufgerufen, das die Felder verändert (bei einem
+    Cache-Treffer einmal mit dem fertigen Listing). Wirft es (in Streamlit z.B. der Rerun nach
+    einem Klick auf "Abbrechen"), wird der Stream geschlossen, der RateLimiter mit dem bisherigen
+    Verbrauch abgerechnet und nichts gecacht. Bricht der Stream nach `retry` ab, beginnt die
+    Anzeige von vorn.
+
+    Returns:
+        GenerationResult - Fehler stehen in result.error, statt geworfen zu werden
+    """
+    started = time.perf_counter()
+    result = GenerationResult()
+    try:
+        result.model_name = client.model_name()
+        cache_key = response_cache_key(prompt_text, result.model_name) if cache is not None else None
+        if cache_key and not force:
+            text, data = cache.lookup(cache_key, lambda cached: _parse_cached(cached, fields))
+            if data is not None:
+                result.data, result.text, result.tokens, result.cached = data, text, 0, True
+                if on_update:
+                    on_update(result.data)
+                return result
+        estimated = estimate_tokens(prompt_text, fields)
+        while True:
+            result.attempts += 1
+            parser = ListingJsonParser()
+            parts, usage, shown = [], None, {}
+            try:
+                if limiter:
+                    limiter.acquire(estimated)
+                call_started = time.perf_counter()
+                try:
+                    stream = client.stream(prompt_text, fields)
+                    try:
+                        for part, part_usage in stream:
+                            parts.append(part)
+                            if part_usage["total_tokens"]:
+                                usage = part_usage
+                            current = parser.feed(part)
+                            if on_update and current != shown:
+                                shown = current
+                                on_update(shown)
+                    finally:
+                        stream.close()
+                finally:
+                    # Auch bei Fehler oder Abbruch abrechnen; ohne Usage-Angabe Prompt + bisherige Antwort schätzen
+                    result.api_seconds += time.perf_counter() - call_started
+                    if limiter:
+                        consumed = usage["total_tokens"] if usage else (len(prompt_text) + sum(map(len, parts))) // 4
+                        limiter.settle(estimated, consumed)
+                if usage:
+                    result.set_usage(usage)
+                text = "".join(parts).strip()
+                result.data, result.text = parse_listing_json(text, fields), text
+                break
+            except Exception as e:
+                delay = _next_retry_delay(retry, limiter, e, result.attempts - 1)
+                if delay is None:
+                    raise
+                sleep(delay)
+        if cache_key:
+            cache.put(cache_key, result.text, result.model_name, result.tokens)
+    except Exception as e:
+        result.error = e
+    finally:
+        result.seconds = time.perf_counter() - started
+        if log is not None:
+            log.record(result, "stream")
+    return result
+
+
+# ============ BATCH-JOBS ============
+
+# Zustände einer Zeile in einem Batch-Job ("running" = im laufenden Durchgang eingeplant)
+ROW_PENDING = "pending"
+ROW_RUNNING = "running"
+ROW_DONE = "done"
+ROW_FAILED = "failed"
+
+
+def row_input_hash(*parts):
+    """SHA-256 über alle Eingaben einer Zeile (Prompt, ASIN, Marketplace, ...)"""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def job_input_hash(row_hashes):
+    """Kennung eines Batch-Jobs: gleiche Zeilen in gleicher Reihenfolge ergeben denselben Job"""
+    return hashlib.sha256("\n".join(row_hashes).encode("utf-8")).hexdigest()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class JobStore:
+    """
+    Checkpoints für Batch-Generierungen: je Job die Zeilen mit Eingabe-Hash und Zustand
+    (pending/running/done/failed) sowie das fertige Listing.
+
+    Wird ein Batch mit denselben Zeilen erneut gestartet (Tab geschlossen, Rerun, Abbruch),
+    liefert open_job() den bestehenden Job - fertige Zeilen werden übernommen statt neu
+    generiert. Diese Basisklasse hält die Jobs im Speicher (überlebt Reruns, aber keinen
+    Neustart); app.py legt sie in der Datenbank ab.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def open_job(self, row_hashes, label="", restart=False):
+        """
+        Legt den Job zu `row_hashes` an oder öffnet den bestehenden.
+
+        Args:
+            restart: Alle Zeilen auf pending zurücksetzen (z.B. "Alle Zeilen neu generieren")
+
+        Returns:
+            tuple: (job_id, Liste je Zeile {"state", "result" (Listing-Dict oder None), "error"})
+        """
+        job_id = job_input_hash(row_hashes)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or restart:
+                job = {
+                    "label": label, "created_at": _now(), "updated_at": _now(),
+                    "rows": [{"hash": row_hash, "state": ROW_PENDING, "result": None, "error": None}
+                             for row_hash in row_hashes],
+                }
+                self._jobs[job_id] = job
+            return job_id, [dict(row) for row in job["rows"]]
+
+    def mark_running(self, job_id, indexes):
+        self._update(job_id, indexes, state=ROW_RUNNING, error=None)
+
+    def mark_done(self, job_id, index, result):
+        self._update(job_id, [index], state=ROW_DONE, result=result, error=None)
+
+    def mark_failed(self, job_id, index, error):
+        self._update(job_id, [index], state=ROW_FAILED, error=str(error)[:1000])
+
+    def _update(self, job_id, indexes, **values):
+        with self._lock:
+            job = self._jobs[job_id]
+            for index in indexes:
+                job["rows"][index].update(values)
+            job["updated_at"] = _now()
+
+    def unfinished_jobs(self):
+        """Jobs mit noch nicht fertigen Zeilen: [{"job_id", "label", "total", "done", "failed", "updated_at"}]"""
+        with self._lock:
+            jobs = []
+            for job_id, job in self._jobs.items():
+                states = [row["state"] for row in job["rows"]]
+                if states.count(ROW_DONE) < len(states):
+                    jobs.append({
+                        "job_id": job_id, "label": job["label"], "total": len(states),
+                        "done": states.count(ROW_DONE), "failed": states.count(ROW_FAILED),
+                        "updated_at": job["updated_at"],
+                    })
+            return sorted(jobs, key=lambda job: job["updated_at"], reverse=True)
+
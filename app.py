@@ -3,19 +3,75 @@ import pandas as pd
 import re
 import json
 import uuid
-from io import BytesIO
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.exc import SQLAlchemyError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from listing_io import (
+    LISTING_DB_EXPORT_COLUMNS,
+    db_row_to_listing,
+    UPLOAD_FILE_TYPES,
+    LISTING_SCHEMA,
+    AI_GENERATION_SCHEMA,
+    export_listings_file,
+    EXPORT_FORMATS,
+    PARTITION_FIELDS,
+    export_partitioned_zip,
+    frame_to_xlsx,
+    read_export,
+    export_rows_hash,
+    file_sha256,
+    ParsedUploadCache,
+    BackgroundUploadParser,
+    parse_and_normalize,
+    normalize_listing_frame,
+    frame_to_listing_records,
+    plan_listing_writes,
+    plan_to_save_records,
+    FIELD_BYTE_LIMITS,
+    validate_listing_frame,
+    estimate_upload_rows,
+    scan_key_counts,
+    REQUIRED_SAVE_FIELDS,
+    iter_ingest_chunks,
+    list_upload_sheets,
+    make_export_process_pool,
+    make_upload_process_pool,
+    parse_uploads,
+    source_row_labels,
+)
 
-# Optional: Google Gemini SDK
-# pip install google-generativeai
-try:
-    import google.generativeai as genai
-    _HAS_GEMINI = True
-except Exception:
-    _HAS_GEMINI = False
+# KI-Generierung (Google Gemini SDK optional: pip install google-generativeai)
+from ai_generation import (
+    _HAS_GEMINI,
+    GeminiClient,
+    GenaiBackend,
+    RateLimiter,
+    AsyncGenerationRunner,
+    ResponseCache,
+    RetryPolicy,
+    generate_listing_stream,
+    over_limit_fields,
+    repair_byte_limits,
+    BYTE_REPAIR_MAX_ROUNDS,
+    GenerationLog,
+    JsonlGenerationLog,
+    JobStore,
+    job_input_hash,
+    row_input_hash,
+    ROW_DONE,
+    ROW_FAILED,
+    summarize_generation_log,
+    GEMINI_MAX_WORKERS,
+    GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_TOKENS_PER_MINUTE,
+    GEMINI_REQUEST_TIMEOUT_SECONDS,
+)
 
 # Database connection
 def get_db_connection():
@@ -109,7 +165,7 @@ def get_db_connection():
                 pool_recycle=300,    # Recyclet Connections nach 5 Minuten
                 pool_size=5,         # Anzahl der Connections im Pool
                 max_overflow=10,     # Zusätzliche Connections bei Bedarf
-                pool_timeout=30,     # Timeout für Connection-Erstellung
+                pool_timeout=10,     # Timeout für Connection-Erstellung (kurz halten, sonst hängt die UI)
                 connect_args={
                     "connect_timeout": 10,
                     "keepalives": 1,
@@ -183,6 +239,62 @@ def init_database(engine):
     CREATE INDEX IF NOT EXISTS idx_project ON listings(project);
     CREATE INDEX IF NOT EXISTS idx_brand_guidelines_name ON brand_guidelines(name);
     CREATE INDEX IF NOT EXISTS idx_brand_guidelines_customer ON brand_guidelines(customer_name);
+    
+    -- Antwort-Cache der KI-Generierung (Schlüssel: SHA-256 über Modell + Prompt)
+    CREATE TABLE IF NOT EXISTS generation_cache (
+        cache_key CHAR(64) PRIMARY KEY,
+        model VARCHAR(255),
+        response TEXT NOT NULL,
+        tokens INTEGER,
+        hit_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_hit_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_generation_cache_last_hit ON generation_cache(last_hit_at);
+    
+    -- Protokoll aller Gemini-Aufrufe (Tokens, Latenz, Modell, Wiederholungen, Cache-Treffer)
+    CREATE TABLE IF NOT EXISTS generation_log (
+        id BIGSERIAL PRIMARY KEY,
+        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        batch_id VARCHAR(64),
+        kind VARCHAR(20),
+        model VARCHAR(255),
+        prompt_tokens INTEGER,
+        response_tokens INTEGER,
+        total_tokens INTEGER,
+        latency_ms INTEGER,
+        total_ms INTEGER,
+        attempts INTEGER,
+        cached BOOLEAN,
+        ok BOOLEAN,
+        error TEXT
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_generation_log_created ON generation_log(created_at);
+    CREATE INDEX IF NOT EXISTS idx_generation_log_batch ON generation_log(batch_id);
+    
+    -- Fortsetzbare Batch-Generierung: Job (Kennung = Hash über alle Zeilen) und Checkpoint je Zeile
+    CREATE TABLE IF NOT EXISTS generation_jobs (
+        job_id CHAR(64) PRIMARY KEY,
+        label TEXT,
+        total_rows INTEGER,
+        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE TABLE IF NOT EXISTS generation_job_rows (
+        job_id CHAR(64) REFERENCES generation_jobs(job_id) ON DELETE CASCADE,
+        row_index INTEGER,
+        input_hash CHAR(64) NOT NULL,
+        state VARCHAR(10) NOT NULL DEFAULT 'pending',
+        result TEXT,
+        error TEXT,
+        updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (job_id, row_index)
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_generation_jobs_updated ON generation_jobs(updated_at);
     """
     
     try:
@@ -241,6 +353,7 @@ def save_listing_to_db(engine, listing_data, asin_ean_sku=None, mp=None, account
                 WHERE id = :id
             """)
             with engine.begin() as conn:
+                _set_statement_timeout(conn, "write")
                 conn.execute(update_sql, {
                     "id": result[0],
                     "image": listing_data.get("image"),
@@ -286,6 +399,7 @@ def save_listing_to_db(engine, listing_data, asin_ean_sku=None, mp=None, account
     
     try:
         with engine.begin() as conn:
+            _set_statement_timeout(conn, "write")
             conn.execute(insert_sql, {
                 "asin_ean_sku": asin_ean_sku,
                 "mp": mp,
@@ -328,15 +442,232 @@ def _get_engine_identifier(engine):
     except Exception:
         return "unknown_engine"
 
-@st.cache_data(ttl=300, show_spinner=False)  # Cache für 5 Minuten
-def load_listings_from_db_cached(engine_identifier, filters=None):
-    """Lädt Listings aus der Datenbank mit optionalen Filtern (mit Caching)"""
-    # Hole Engine neu (wird innerhalb der Funktion verwendet)
-    engine = get_db_connection()
-    if not engine:
-        return pd.DataFrame()
-    
-    base_query = "SELECT * FROM listings WHERE 1=1"
+# ============ STATEMENT-TIMEOUTS, ABBRUCH & CIRCUIT BREAKER ============
+# Statement-Timeouts je Abfrageklasse (Millisekunden). Ein langsamer Supabase-Pooler
+# soll die UI nicht minutenlang blockieren. Lesende Abfragen laufen zusätzlich in einem
+# Worker-Thread: Der Skript-Thread wartet mit einem st-Aufruf je Intervall, damit ein Rerun
+# (neue Filter) oder Stop sofort ankommt und die überholte Abfrage serverseitig abgebrochen wird.
+QUERY_TIMEOUTS_MS = {
+    "count": 3000,      # COUNT(*) für die Gesamtanzahl
+    "facets": 5000,     # DISTINCT-Werte für Filter-Dropdowns
+    "listings": 15000,  # Laden der (gefilterten) Listings
+    "write": 60000,     # Inserts/Updates (Batch-Upload)
+    "export": 120000,   # Je FETCH beim serverseitigen Cursor für Komplett-Exporte
+}
+DB_READ_POLL_INTERVAL_SECONDS = 0.25  # Wie oft der Skript-Thread während einer Abfrage auf Rerun/Stop prüft
+DB_READ_WORKERS = 8
+
+# Je Worker-Thread (Engine, DBAPI-Verbindung) der gerade laufenden Leseabfragen (für den Abbruch)
+_read_context = threading.local()
+
+class DbCircuitBreaker:
+    """
+    Einfacher Circuit Breaker für lesende Datenbankzugriffe.
+
+    Nach `failure_threshold` Fehlern in Folge (inkl. Timeouts) wird der Breaker für
+    `reset_timeout` Sekunden geöffnet. In dieser Zeit werden Lesezugriffe nicht an die
+    Datenbank geschickt, sondern aus dem zuletzt erfolgreich geladenen Stand (Snapshot)
+    bedient. Danach darf eine einzelne Probe-Abfrage durch (half-open).
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_running = False
+        self._snapshots = {}
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # Half-open: nach Ablauf des Timeouts genau eine Probe-Abfrage zulassen
+            if not self._probe_running and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probe_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_running = False
+
+    def release_probe(self):
+        """Gibt die Half-open-Probe wieder frei, ohne den Zustand zu ändern (z.B. bei Cache-Treffern)"""
+        with self._lock:
+            self._probe_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def remember(self, key, value):
+        with self._lock:
+            self._snapshots[key] = value
+
+    def snapshot(self, key, default=None):
+        with self._lock:
+            return self._snapshots.get(key, default)
+
+@st.cache_resource(show_spinner=False)
+def get_db_circuit_breaker():
+    """Prozessweiter Circuit Breaker (überlebt Reruns und gilt für alle Sessions)"""
+    return DbCircuitBreaker()
+
+@st.cache_resource(show_spinner=False)
+def get_db_read_executor():
+    """Prozessweiter Thread-Pool für lesende Abfragen (siehe _run_cancellable_read)"""
+    return ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-read")
+
+def _set_statement_timeout(conn, query_class):
+    """Setzt den Statement-Timeout für die laufende Transaktion (nur PostgreSQL)"""
+    timeout_ms = int(QUERY_TIMEOUTS_MS.get(query_class, QUERY_TIMEOUTS_MS["listings"]))
+    conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+
+def _execute_read(engine, query_class, sql, params=None):
+    """
+    Führt eine lesende Abfrage mit dem Statement-Timeout ihrer Abfrageklasse aus.
+    Nur eine tatsächlich ausgeführte Abfrage meldet dem Circuit Breaker Erfolg
+    (Treffer aus st.cache_data sagen nichts über die Datenbank aus).
+    Läuft sie in _run_cancellable_read, wird die Verbindung für einen Abbruch registriert.
+
+    Returns:
+        tuple: (columns, rows)
+    """
+    active = getattr(_read_context, "connections", None)
+    with engine.connect() as conn:
+        dbapi_conn = conn.connection.dbapi_connection
+        if active is not None:
+            active.append((engine, dbapi_conn))
+        try:
+            with conn.begin():
+                _set_statement_timeout(conn, query_class)
+                result = conn.execute(text(sql), params or {})
+                columns, rows = list(result.keys()), result.fetchall()
+        finally:
+            if active is not None:
+                active.remove((engine, dbapi_conn))
+    get_db_circuit_breaker().record_success()
+    return columns, rows
+
+def _cancel_backend_query(engine, dbapi_conn):
+    """Bricht die laufende Abfrage einer DBAPI-Verbindung serverseitig ab (Fehler werden ignoriert)"""
+    try:
+        if hasattr(dbapi_conn, "cancel"):
+            # psycopg2/psycopg: Cancel-Request über eine eigene Verbindung, threadsicher
+            dbapi_conn.cancel()
+            return
+        pid = getattr(getattr(dbapi_conn, "info", None), "backend_pid", None)
+        if pid is not None:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": pid})
+    except Exception:
+        pass
+
+def _run_cancellable_read(loader):
+    """
+    Führt `loader` in einem Worker-Thread aus und wartet darauf im Skript-Thread.
+
+    Dauert die Abfrage länger als DB_READ_POLL_INTERVAL_SECONDS, zeigt ein Platzhalter die
+    Wartezeit an. Dieser st-Aufruf ist zugleich der Punkt, an dem Streamlit einen Rerun/Stop
+    auslöst - dann werden die noch laufenden Abfragen des Workers per Cancel-Request
+    abgebrochen, statt bis zum Statement-Timeout weiterzulaufen.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return loader()
+    connections = []
+
+    def run():
+        # Kontext weiterreichen, damit st.cache_data/st.cache_resource im Worker funktionieren
+        add_script_run_ctx(threading.current_thread(), ctx)
+        _read_context.connections = connections
+        try:
+            return loader()
+        finally:
+            _read_context.connections = None
+
+    future = get_db_read_executor().submit(run)
+    started = time.monotonic()
+    status = None
+    try:
+        while True:
+            try:
+                value = future.result(timeout=DB_READ_POLL_INTERVAL_SECONDS)
+                break
+            except FuturesTimeoutError:
+                if status is None:
+                    status = st.empty()
+                status.caption(f"⏳ Datenbank antwortet… {time.monotonic() - started:.0f} s")
+    except BaseException:
+        # Rerun/Stop (oder Fehler im Skript-Thread): überholte Abfragen nicht weiterlaufen lassen
+        for engine, dbapi_conn in list(connections):
+            _cancel_backend_query(engine, dbapi_conn)
+        raise
+    if status is not None:
+        status.empty()
+    return value
+
+def _read_through_breaker(snapshot_key, loader, default, error_label=None):
+    """
+    Führt `loader` über den Circuit Breaker aus. Ist die Datenbank ungesund (Breaker offen
+    oder Abfrage fehlgeschlagen), wird der zuletzt erfolgreich geladene Stand zurückgegeben.
+    """
+    breaker = get_db_circuit_breaker()
+    if not breaker.allow_request():
+        stale = breaker.snapshot(snapshot_key)
+        if stale is not None:
+            _notify_db_degraded()
+            return stale
+        if error_label:
+            st.warning(
+                f"⚠️ {error_label}: Die Datenbank antwortet aktuell nicht zuverlässig und es liegt noch kein "
+                f"geladener Stand vor. Neuer Versuch in spätestens {breaker.reset_timeout} Sekunden."
+            )
+        return default
+    try:
+        value = _run_cancellable_read(loader)
+    except Exception as e:
+        breaker.record_failure()
+        stale = breaker.snapshot(snapshot_key)
+        if stale is not None:
+            _notify_db_degraded()
+            return stale
+        if error_label:
+            st.error(f"{error_label}: {e}")
+        return default
+    except BaseException:
+        # Rerun/Stop: die abgebrochene Abfrage sagt nichts über die Datenbank aus
+        breaker.release_probe()
+        raise
+    # Kam der Wert aus dem Cache, hat die Probe-Abfrage die Datenbank nicht erreicht
+    breaker.release_probe()
+    if not breaker.is_open:
+        st.session_state.pop("db_degraded_notified", None)
+    breaker.remember(snapshot_key, value)
+    return value
+
+def _notify_db_degraded():
+    """Zeigt einmal pro Session einen Hinweis, dass zwischengespeicherte Daten angezeigt werden"""
+    if not st.session_state.get("db_degraded_notified"):
+        st.session_state["db_degraded_notified"] = True
+        st.toast("⚠️ Datenbank antwortet langsam – es wird der zuletzt geladene Stand angezeigt.")
+
+def _build_listings_query(filters=None, columns=None, order_by="updated_at DESC"):
+    """Baut die SQL-Abfrage und Parameter für die Listing-Filter (order_by ist fest im Code, nie Benutzereingabe)"""
+    select_cols = ", ".join(columns) if columns else "*"
+    base_query = f"SELECT {select_cols} FROM listings WHERE 1=1"
     params = {}
     
     if filters:
@@ -356,21 +687,32 @@ def load_listings_from_db_cached(engine_identifier, filters=None):
             base_query += " AND name ILIKE :name"
             params["name"] = f"%{filters['name']}%"
     
-    base_query += " ORDER BY updated_at DESC"
-    
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(text(base_query), params)
-            df = pd.DataFrame(result.fetchall(), columns=result.keys())
-        return df
-    except SQLAlchemyError as e:
-        st.error(f"Fehler beim Laden: {e}")
+    base_query += f" ORDER BY {order_by}"
+    return base_query, params
+
+@st.cache_data(ttl=300, show_spinner=False)  # Cache für 5 Minuten
+def load_listings_from_db_cached(engine_identifier, filters=None):
+    """Lädt Listings aus der Datenbank mit optionalen Filtern (mit Caching)"""
+    # Hole Engine neu (wird innerhalb der Funktion verwendet)
+    engine = get_db_connection()
+    if not engine:
         return pd.DataFrame()
+    
+    base_query, params = _build_listings_query(filters)
+    # Fehler werden bewusst nicht abgefangen, damit sie nicht gecacht werden
+    columns, rows = _execute_read(engine, "listings", base_query, params)
+    return pd.DataFrame(rows, columns=columns)
 
 def load_listings_from_db(engine, filters=None):
     """Wrapper-Funktion für load_listings_from_db_cached mit Engine-Identifier"""
     engine_id = _get_engine_identifier(engine)
-    return load_listings_from_db_cached(engine_id, filters)
+    snapshot_key = ("listings", engine_id, tuple(sorted((filters or {}).items())))
+    return _read_through_breaker(
+        snapshot_key,
+        lambda: load_listings_from_db_cached(engine_id, filters),
+        default=pd.DataFrame(),
+        error_label="Fehler beim Laden"
+    )
 
 @st.cache_data(ttl=600, show_spinner=False)  # Cache für 10 Minuten (seltener ändern sich die Werte)
 def get_distinct_values_cached(engine_identifier, column):
@@ -380,22 +722,219 @@ def get_distinct_values_cached(engine_identifier, column):
     if not engine:
         return []
     
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(text(f"SELECT DISTINCT {column} FROM listings WHERE {column} IS NOT NULL ORDER BY {column}"))
-            return [row[0] for row in result.fetchall()]
-    except SQLAlchemyError:
-        return []
+    _, rows = _execute_read(
+        engine,
+        "facets",
+        f"SELECT DISTINCT {column} FROM listings WHERE {column} IS NOT NULL ORDER BY {column}"
+    )
+    return [row[0] for row in rows]
 
 def get_distinct_values(engine, column):
     """Wrapper-Funktion für get_distinct_values_cached mit Engine-Identifier"""
     engine_id = _get_engine_identifier(engine)
-    return get_distinct_values_cached(engine_id, column)
+    return _read_through_breaker(
+        ("facets", engine_id, column),
+        lambda: get_distinct_values_cached(engine_id, column),
+        default=[],
+        error_label=None  # Dropdowns bleiben bei Fehlern still leer
+    )
+
+def stream_listings_from_db(engine, filters=None, chunk_size=2000, partition_by=()):
+    """
+    Liefert alle (gefilterten) Listings als Generator über einen serverseitigen Cursor.
+
+    Es werden immer nur `chunk_size` Zeilen gleichzeitig von PostgreSQL geholt, damit auch
+    Exporte mit mehreren hunderttausend Zeilen mit konstantem Speicher auskommen.
+    Die Zeilen werden direkt in das Listing-Format (siehe db_row_to_listing) umgewandelt.
+    Mit `partition_by` (Felder aus PARTITION_FIELDS) kommen gleiche Partitionen direkt hintereinander.
+    """
+    if not engine:
+        return
+    order_by = "updated_at DESC"
+    if partition_by:
+        # Gleicher Schlüssel wie partition_key: NULL wird zu "", Leerraum am Rand zählt nicht
+        order_by = ", ".join(
+            f"BTRIM(COALESCE({field}, ''), E' \\t\\n\\r\\f\\x0b')" for field in partition_by if field in PARTITION_FIELDS
+        ) + ", " + order_by
+    base_query, params = _build_listings_query(filters, columns=LISTING_DB_EXPORT_COLUMNS, order_by=order_by)
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, yield_per=chunk_size)
+        with conn.begin():
+            _set_statement_timeout(conn, "export")
+            result = conn.execute(text(base_query), params)
+            columns = list(result.keys())
+            for partition in result.partitions():
+                for row in partition:
+                    yield db_row_to_listing(dict(zip(columns, row)))
+
+def count_listings(engine):
+    """Zählt alle Listings in der Datenbank (mit Timeout und Circuit Breaker). Gibt None zurück, wenn unbekannt."""
+    if not engine:
+        return None
+    return _read_through_breaker(
+        ("count", _get_engine_identifier(engine)),
+        lambda: _execute_read(engine, "count", "SELECT COUNT(*) FROM listings")[1][0][0],
+        default=None,
+        error_label=None  # Aufrufer zeigt "unbekannt" an
+    )
+
+def fetch_existing_listing_ids(engine, pairs, chunk_size=5000):
+    """
+    Prüft in einer Abfrage pro Chunk, welche (ASIN, MP)-Paare bereits in der Datenbank existieren.
+
+    Die Paare werden als zwei Arrays übergeben und per unnest() gejoint - so reicht für
+    mehrere tausend Upload-Zeilen eine einzige Abfrage statt einer pro Zeile.
+
+    Returns:
+        dict: {(asin, mp): id} für alle vorhandenen Paare
+    """
+    existing = {}
+    pairs = list(pairs)
+    if not engine or not pairs:
+        return existing
+    lookup_sql = text("""
+        SELECT l.asin_ean_sku, l.mp, l.id
+        FROM listings l
+        JOIN unnest(CAST(:asins AS text[]), CAST(:mps AS text[])) AS k(asin, mp)
+          ON l.asin_ean_sku = k.asin AND l.mp = k.mp
+    """)
+    with engine.connect() as conn:
+        with conn.begin():
+            _set_statement_timeout(conn, "listings")
+            for start in range(0, len(pairs), chunk_size):
+                chunk = pairs[start:start + chunk_size]
+                rows = conn.execute(lookup_sql, {
+                    "asins": [asin for asin, _ in chunk],
+                    "mps": [mp for _, mp in chunk]
+                })
+                for asin, mp, listing_id in rows:
+                    existing.setdefault((asin, mp), listing_id)
+    return existing
+
+def _write_listing_row(conn, listing_info):
+    """
+    Schreibt ein einzelnes Listing innerhalb einer bestehenden Transaktion.
+    
+    Returns:
+        str: "success" oder "skipped"
+    """
+    listing_data = listing_info["data"]
+    asin = listing_info["asin"]
+    mp = listing_info["mp"]
+    account = listing_info.get("account")
+    project = listing_info.get("project")
+    check_existing = listing_info.get("check_existing", True)
+    overwrite = listing_info.get("overwrite", False)
+    
+    # Vorab geplante Aktion (plan_listing_writes) - keine Einzelabfrage nötig
+    if "action" in listing_info:
+        if listing_info["action"] == "skip":
+            return "skipped"
+        listing_id = listing_info.get("listing_id") if listing_info["action"] == "update" else None
+    # Prüfe ob existiert
+    elif check_existing and not overwrite:
+        check_sql = text("SELECT id FROM listings WHERE asin_ean_sku = :asin AND mp = :mp")
+        existing = conn.execute(check_sql, {"asin": asin, "mp": mp}).fetchone()
+        
+        if existing:
+            return "skipped"
+        else:
+            listing_id = None
+    elif check_existing and overwrite:
+        check_sql = text("SELECT id FROM listings WHERE asin_ean_sku = :asin AND mp = :mp")
+        existing = conn.execute(check_sql, {"asin": asin, "mp": mp}).fetchone()
+        listing_id = existing[0] if existing else None
+    else:
+        listing_id = None
+    
+    # Kommentare: Wenn leer, setze auf NULL
+    comments_raw = listing_data.get("comments")
+    if comments_raw:
+        # Konvertiere zu String und entferne Leerzeichen
+        comments_value = str(comments_raw).strip()
+        comments_db = comments_value if comments_value else None
+    else:
+        comments_db = None
+    
+    if listing_id:
+        # Update
+        update_sql = text("""
+            UPDATE listings SET
+                image = :image, name = :name, title = :title,
+                account = :account, project = :project, product = :product,
+                titel = :titel, bullet1 = :bullet1, bullet2 = :bullet2,
+                bullet3 = :bullet3, bullet4 = :bullet4, bullet5 = :bullet5,
+                description = :description, search_terms = :search_terms,
+                keywords = :keywords, comments = :comments, updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """)
+        conn.execute(update_sql, {
+            "id": listing_id,
+            "image": listing_data.get("image"),
+            "name": listing_data.get("name"),
+            "title": listing_data.get("Title") or listing_data.get("title"),
+            "account": account, "project": project,
+            "product": listing_data.get("Product", ""),
+            "titel": listing_data.get("Titel", ""),
+            "bullet1": listing_data.get("Bullet1", ""),
+            "bullet2": listing_data.get("Bullet2", ""),
+            "bullet3": listing_data.get("Bullet3", ""),
+            "bullet4": listing_data.get("Bullet4", ""),
+            "bullet5": listing_data.get("Bullet5", ""),
+            "description": listing_data.get("Description", ""),
+            "search_terms": listing_data.get("SearchTerms", ""),
+            "keywords": listing_data.get("Keywords", ""),
+            "comments": comments_db
+        })
+    else:
+        # Insert
+        insert_sql = text("""
+            INSERT INTO listings (
+                asin_ean_sku, mp, image, name, title, account, project,
+                product, titel, bullet1, bullet2, bullet3, bullet4, bullet5,
+                description, search_terms, keywords, comments
+            ) VALUES (
+                :asin_ean_sku, :mp, :image, :name, :title, :account, :project,
+                :product, :titel, :bullet1, :bullet2, :bullet3, :bullet4, :bullet5,
+                :description, :search_terms, :keywords, :comments
+            )
+        """)
+        conn.execute(insert_sql, {
+            "asin_ean_sku": asin, "mp": mp,
+            "image": listing_data.get("image"),
+            "name": listing_data.get("name"),
+            "title": listing_data.get("Title") or listing_data.get("title"),
+            "account": account, "project": project,
+            "product": listing_data.get("Product", ""),
+            "titel": listing_data.get("Titel", ""),
+            "bullet1": listing_data.get("Bullet1", ""),
+            "bullet2": listing_data.get("Bullet2", ""),
+            "bullet3": listing_data.get("Bullet3", ""),
+            "bullet4": listing_data.get("Bullet4", ""),
+            "bullet5": listing_data.get("Bullet5", ""),
+            "description": listing_data.get("Description", ""),
+            "search_terms": listing_data.get("SearchTerms", ""),
+            "keywords": listing_data.get("Keywords", ""),
+            "comments": comments_db
+        })
+    return "success"
+
+def _listing_row_error(listing_info):
+    """Gibt eine Fehlermeldung zurück, wenn die Zeile gar nicht geschrieben werden darf"""
+    if not listing_info.get("asin") or not listing_info.get("mp"):
+        return "Fehlende ASIN oder MP"
+    if listing_info.get("action") == "error":
+        return "Ungültige ASIN oder MP"
+    return None
 
 def batch_save_listings_to_db(engine, listings_data, batch_size=100):
     """
     Speichert Listings in Batches für bessere Performance und Fehlerbehandlung.
     
+    Jeder Batch läuft in einer Transaktion; erfolgreiche Zeilen werden erst nach dem Commit
+    gezählt. Scheitert ein Batch, wird er Zeile für Zeile (je eine Transaktion) wiederholt,
+    damit eine fehlerhafte Zeile nicht die übrigen Zeilen des Batches mitreißt.
+    
     Args:
         engine: SQLAlchemy Engine
         listings_data: Liste von Dicts mit Listing-Daten
@@ -414,130 +953,182 @@ def batch_save_listings_to_db(engine, listings_data, batch_size=100):
     skipped_count = 0
     errors = []
     
+    def row_label(index, listing_info):
+        return f"Zeile {index + 1} ({listing_info.get('asin') or '?'} / {listing_info.get('mp') or '?'})"
+    
+    def short_error(error):
+        # Nur die erste Zeile (SQLAlchemy hängt das komplette SQL-Statement an)
+        return str(error).split("\n", 1)[0][:200]
+    
     # Verarbeite in Batches
     for batch_start in range(0, len(listings_data), batch_size):
         batch_end = min(batch_start + batch_size, len(listings_data))
         batch = listings_data[batch_start:batch_end]
         
+        # Zeilen ohne gültigen Schlüssel gar nicht erst schreiben
+        writable = []
+        for index, listing_info in enumerate(batch, start=batch_start):
+            row_error = _listing_row_error(listing_info)
+            if row_error:
+                error_count += 1
+                errors.append(f"{row_label(index, listing_info)}: {row_error}")
+            else:
+                writable.append((index, listing_info))
+        if not writable:
+            continue
+        
         try:
-            # Eine Connection pro Batch
+            # Eine Connection pro Batch; Zähler erst nach erfolgreichem Commit übernehmen
+            batch_results = []
             with engine.begin() as conn:
-                for listing_info in batch:
-                    listing_data = listing_info["data"]
-                    asin = listing_info["asin"]
-                    mp = listing_info["mp"]
-                    account = listing_info.get("account")
-                    project = listing_info.get("project")
-                    check_existing = listing_info.get("check_existing", True)
-                    overwrite = listing_info.get("overwrite", False)
-                    
-                    if not asin or not mp:
-                        error_count += 1
-                        errors.append(f"Fehlende ASIN oder MP")
-                        continue
-                    
-                    # Prüfe ob existiert
-                    if check_existing and not overwrite:
-                        check_sql = text("SELECT id FROM listings WHERE asin_ean_sku = :asin AND mp = :mp")
-                        existing = conn.execute(check_sql, {"asin": asin, "mp": mp}).fetchone()
-                        
-                        if existing:
-                            skipped_count += 1
-                            continue
-                        else:
-                            listing_id = None
-                    elif check_existing and overwrite:
-                        check_sql = text("SELECT id FROM listings WHERE asin_ean_sku = :asin AND mp = :mp")
-                        existing = conn.execute(check_sql, {"asin": asin, "mp": mp}).fetchone()
-                        listing_id = existing[0] if existing else None
-                    else:
-                        listing_id = None
-                    
-                    # Kommentare: Wenn leer, setze auf NULL
-                    comments_raw = listing_data.get("comments")
-                    if comments_raw:
-                        # Konvertiere zu String und entferne Leerzeichen
-                        comments_value = str(comments_raw).strip()
-                        comments_db = comments_value if comments_value else None
-                    else:
-                        comments_db = None
-                    
-                    if listing_id:
-                        # Update
-                        update_sql = text("""
-                            UPDATE listings SET
-                                image = :image, name = :name, title = :title,
-                                account = :account, project = :project, product = :product,
-                                titel = :titel, bullet1 = :bullet1, bullet2 = :bullet2,
-                                bullet3 = :bullet3, bullet4 = :bullet4, bullet5 = :bullet5,
-                                description = :description, search_terms = :search_terms,
-                                keywords = :keywords, comments = :comments, updated_at = CURRENT_TIMESTAMP
-                            WHERE id = :id
-                        """)
-                        conn.execute(update_sql, {
-                            "id": listing_id,
-                            "image": listing_data.get("image"),
-                            "name": listing_data.get("name"),
-                            "title": listing_data.get("Title") or listing_data.get("title"),
-                            "account": account, "project": project,
-                            "product": listing_data.get("Product", ""),
-                            "titel": listing_data.get("Titel", ""),
-                            "bullet1": listing_data.get("Bullet1", ""),
-                            "bullet2": listing_data.get("Bullet2", ""),
-                            "bullet3": listing_data.get("Bullet3", ""),
-                            "bullet4": listing_data.get("Bullet4", ""),
-                            "bullet5": listing_data.get("Bullet5", ""),
-                            "description": listing_data.get("Description", ""),
-                            "search_terms": listing_data.get("SearchTerms", ""),
-                            "keywords": listing_data.get("Keywords", ""),
-                            "comments": comments_db
-                        })
-                        success_count += 1
-                    else:
-                        # Insert
-                        insert_sql = text("""
-                            INSERT INTO listings (
-                                asin_ean_sku, mp, image, name, title, account, project,
-                                product, titel, bullet1, bullet2, bullet3, bullet4, bullet5,
-                                description, search_terms, keywords, comments
-                            ) VALUES (
-                                :asin_ean_sku, :mp, :image, :name, :title, :account, :project,
-                                :product, :titel, :bullet1, :bullet2, :bullet3, :bullet4, :bullet5,
-                                :description, :search_terms, :keywords, :comments
-                            )
-                        """)
-                        conn.execute(insert_sql, {
-                            "asin_ean_sku": asin, "mp": mp,
-                            "image": listing_data.get("image"),
-                            "name": listing_data.get("name"),
-                            "title": listing_data.get("Title") or listing_data.get("title"),
-                            "account": account, "project": project,
-                            "product": listing_data.get("Product", ""),
-                            "titel": listing_data.get("Titel", ""),
-                            "bullet1": listing_data.get("Bullet1", ""),
-                            "bullet2": listing_data.get("Bullet2", ""),
-                            "bullet3": listing_data.get("Bullet3", ""),
-                            "bullet4": listing_data.get("Bullet4", ""),
-                            "bullet5": listing_data.get("Bullet5", ""),
-                            "description": listing_data.get("Description", ""),
-                            "search_terms": listing_data.get("SearchTerms", ""),
-                            "keywords": listing_data.get("Keywords", ""),
-                            "comments": comments_db
-                        })
-                        success_count += 1
-                
-                # Commit erfolgt automatisch durch engine.begin() context manager
+                _set_statement_timeout(conn, "write")
+                for _, listing_info in writable:
+                    batch_results.append(_write_listing_row(conn, listing_info))
+            success_count += batch_results.count("success")
+            skipped_count += batch_results.count("skipped")
         
         except Exception as batch_error:
-            # Fehler bei diesem Batch
-            error_count += len(batch)
-            error_msg = str(batch_error)[:200]
-            errors.append(f"Batch {batch_start//batch_size + 1} (Zeilen {batch_start + 1}-{batch_end}): {error_msg}")
-            # Weiter mit nächstem Batch
-            continue
+            # Batch wurde zurückgerollt: Zeile für Zeile wiederholen, um die fehlerhaften Zeilen zu isolieren
+            errors.append(
+                f"Batch {batch_start//batch_size + 1} (Zeilen {batch_start + 1}-{batch_end}) "
+                f"fehlgeschlagen, wird einzeln wiederholt: {short_error(batch_error)}"
+            )
+            for index, listing_info in writable:
+                try:
+                    with engine.begin() as conn:
+                        _set_statement_timeout(conn, "write")
+                        result = _write_listing_row(conn, listing_info)
+                except Exception as row_error:
+                    error_count += 1
+                    errors.append(f"{row_label(index, listing_info)}: {short_error(row_error)}")
+                    continue
+                if result == "success":
+                    success_count += 1
+                else:
+                    skipped_count += 1
+    
+    if success_count > 0:
+        load_listings_from_db_cached.clear()
+        get_distinct_values_cached.clear()
     
     return success_count, error_count, skipped_count, errors
 
+def ingest_upload_to_db(engine, source, file_name=None, overwrite=False, skip_invalid=True, on_progress=None,
+                        sheet_name=None, key_counts=None, seen=None):
+    """
+    Importiert einen Upload chunkweise direkt in die Datenbank, ohne ihn komplett zu laden.
+    
+    Lesen, Normalisieren und Validieren laufen als Pipeline im Hintergrund (iter_ingest_chunks),
+    während hier der jeweils vorherige Chunk geplant und geschrieben wird. Für die
+    Duplikat-Nummerierung wird die Datei vorab einmal nur gezählt (scan_key_counts).
+    
+    Args:
+        on_progress: Optionaler Callback(verarbeitete_zeilen, sekunden)
+        sheet_name: Excel-Blatt (Standard: erstes Blatt)
+        key_counts, seen: Zählung und vergebene Nummern mehrerer Blätter/Dateien (siehe ingest_uploads_to_db);
+            ohne Angabe wird nur dieses Blatt gezählt
+    
+    Returns:
+        dict: rows, success, skipped, errors, invalid, duplicates, error_messages, seconds
+    """
+    started = time.perf_counter()
+    if key_counts is None:
+        key_counts = scan_key_counts(source, file_name, sheet_name=sheet_name)
+    if seen is None:
+        seen = {}
+    stats = {"rows": 0, "success": 0, "skipped": 0, "errors": 0, "invalid": 0, "duplicates": 0, "error_messages": []}
+    
+    for chunk, _, chunk_summary in iter_ingest_chunks(source, file_name, sheet_name=sheet_name):
+        if chunk_summary["column_report"]["missing"]:
+            raise ValueError(f"Fehlende erforderliche Spalten: {', '.join(chunk_summary['column_report']['missing'])}")
+        stats["rows"] += len(chunk)
+        
+        # Nummerierung über alle Zeilen, danach fehlerhafte Zeilen aussortieren
+        write_plan, duplicate_count = plan_listing_writes(
+            chunk,
+            lambda pairs: fetch_existing_listing_ids(engine, pairs),
+            overwrite,
+            key_counts=key_counts,
+            seen=seen
+        )
+        stats["duplicates"] += duplicate_count
+        if skip_invalid and chunk_summary["invalid_rows"]:
+            chunk = chunk.drop(index=chunk_summary["invalid_index"])
+            write_plan = write_plan.drop(index=chunk_summary["invalid_index"])
+            stats["invalid"] += chunk_summary["invalid_rows"]
+        
+        success_count, error_count, skipped_count, errors = batch_save_listings_to_db(
+            engine, plan_to_save_records(chunk, write_plan), batch_size=500
+        )
+        stats["success"] += success_count
+        stats["errors"] += error_count
+        stats["skipped"] += skipped_count
+        if len(stats["error_messages"]) < 20:
+            stats["error_messages"].extend(errors[:20 - len(stats["error_messages"])])
+        if on_progress:
+            on_progress(stats["rows"], time.perf_counter() - started)
+    
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def ingest_uploads_to_db(engine, uploaded_files, overwrite=False, skip_invalid=True, on_progress=None):
+    """
+    Importiert mehrere Uploads mit allen Tabellenblättern nacheinander über ingest_upload_to_db.
+    
+    Blätter ohne die Pflichtspalten werden übersprungen und in "skipped_parts" gemeldet,
+    Fehlermeldungen tragen Datei und Blatt. Duplikate werden wie in der Vorschau über den
+    ganzen Upload durchnummeriert: ein Vorab-Durchlauf zählt die Kennungen aller Blätter.
+    
+    Returns:
+        dict: wie ingest_upload_to_db (summiert) + skipped_parts
+    """
+    started = time.perf_counter()
+    totals = {"rows": 0, "success": 0, "skipped": 0, "errors": 0, "invalid": 0, "duplicates": 0,
+              "error_messages": [], "skipped_parts": []}
+    
+    # 1) Kennungen aller Dateien und Blätter zählen (nur die Zählung wird gehalten)
+    parts = []
+    key_counts = pd.Series(dtype="int64")
+    for uploaded_file in uploaded_files:
+        for sheet_name in list_upload_sheets(uploaded_file, uploaded_file.name):
+            origin = f"{uploaded_file.name} › {sheet_name}" if sheet_name else uploaded_file.name
+            try:
+                part_counts = scan_key_counts(
+                    uploaded_file, uploaded_file.name, sheet_name=sheet_name, required=REQUIRED_SAVE_FIELDS
+                )
+            except ValueError as e:
+                totals["skipped_parts"].append(f"{origin}: {str(e)}")
+                continue
+            key_counts = key_counts.add(part_counts, fill_value=0)
+            parts.append((uploaded_file, sheet_name, origin))
+    key_counts = key_counts.astype("int64")
+    
+    # 2) Blätter nacheinander importieren; die vergebenen Nummern laufen über alle Blätter weiter
+    seen = {}
+    for uploaded_file, sheet_name, origin in parts:
+        rows_before = totals["rows"]
+        
+        def _part_progress(rows, seconds):
+            if on_progress:
+                on_progress(rows_before + rows, time.perf_counter() - started)
+        
+        try:
+            part_stats = ingest_upload_to_db(
+                engine, uploaded_file, uploaded_file.name, overwrite=overwrite, skip_invalid=skip_invalid,
+                on_progress=_part_progress, sheet_name=sheet_name, key_counts=key_counts, seen=seen
+            )
+        except ValueError as e:
+            totals["skipped_parts"].append(f"{origin}: {str(e)}")
+            continue
+        for key in ("rows", "success", "skipped", "errors", "invalid", "duplicates"):
+            totals[key] += part_stats[key]
+        room = 20 - len(totals["error_messages"])
+        totals["error_messages"].extend(f"{origin}: {message}" for message in part_stats["error_messages"][:max(room, 0)])
+    
+    totals["seconds"] = time.perf_counter() - started
+    return totals
+
+@st.cache_data(show_spinner=False)  # Statische Vorlage: einmal pro Prozess erzeugen
 def create_example_excel_supabase():
     """Erstellt eine Beispiel-Excel-Datei für Supabase Upload"""
     data = {
@@ -558,12 +1149,9 @@ def create_example_excel_supabase():
         "Keywords": ["keyword1, keyword2, keyword3", "keyword1, keyword2"]
     }
     df = pd.DataFrame(data)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    output.seek(0)
-    return output
+    return read_export(frame_to_xlsx(df))
 
+@st.cache_data(show_spinner=False)  # Statische Vorlage: einmal pro Prozess erzeugen
 def create_example_excel_listings():
     """Erstellt eine Beispiel-Excel-Datei für normale Listings Upload"""
     data = {
@@ -579,11 +1167,7 @@ def create_example_excel_listings():
         "Keywords": ["keyword1, keyword2, keyword3", "keyword1, keyword2"]
     }
     df = pd.DataFrame(data)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    output.seek(0)
-    return output
+    return read_export(frame_to_xlsx(df))
 
 def create_example_excel_ai_generation(db_engine=None):
     """Erstellt eine Beispiel-Excel-Datei für KI-Generierung mit Dropdown-Auswahlfeldern"""
@@ -597,6 +1181,14 @@ def create_example_excel_ai_generation(db_engine=None):
         except Exception:
             pass
     
+    # Die Liste der Brand Guidelines ist der Cache-Schlüssel der Vorlage
+    return _build_ai_generation_template(tuple(brand_guidelines_options))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _build_ai_generation_template(brand_guidelines_options):
+    """Baut die KI-Beispiel-Excel einmal pro Stand der Brand-Guideline-Liste"""
+    brand_guidelines_options = list(brand_guidelines_options)
+    
     # Standard-Marketplace-Optionen
     marketplace_options = ["DE", "FR", "UK", "IT", "ES", "US", "CA"]
     
@@ -632,54 +1224,58 @@ def create_example_excel_ai_generation(db_engine=None):
     }
     
     df = pd.DataFrame(data)
-    output = BytesIO()
     
-    # Erstelle Excel mit Dropdown-Validierung
-    try:
-        from openpyxl.worksheet.datavalidation import DataValidation
-    except ImportError:
-        # Fallback wenn openpyxl nicht verfügbar ist
-        DataValidation = None
-    
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="KI-Generierung")
-        
-        # Hole das Worksheet
-        worksheet = writer.sheets["KI-Generierung"]
-        
-        # Erstelle Dropdown-Validierung für Brand Guidelines (falls verfügbar)
-        if DataValidation:
-            # Brand Guidelines Dropdown (Spalte G, Index 7)
-            brand_guidelines_dv = DataValidation(
-                type="list",
-                formula1=f'"{",".join(brand_guidelines_options)}"',
-                allow_blank=True
-            )
-            brand_guidelines_dv.add(f"G2:G{len(df) + 10}")  # Erlaube mehr Zeilen für zukünftige Nutzung
-            worksheet.add_data_validation(brand_guidelines_dv)
-            
-            # Marketplace Dropdown (Spalte H, Index 8)
-            marketplace_dv = DataValidation(
-                type="list",
-                formula1=f'"{",".join(marketplace_options)}"',
-                allow_blank=False
-            )
-            marketplace_dv.add(f"H2:H{len(df) + 10}")
-            worksheet.add_data_validation(marketplace_dv)
-        
-        # Setze Spaltenbreiten für bessere Lesbarkeit
-        worksheet.column_dimensions['A'].width = 20
-        worksheet.column_dimensions['B'].width = 50
-        worksheet.column_dimensions['C'].width = 50
-        worksheet.column_dimensions['D'].width = 40
-        worksheet.column_dimensions['E'].width = 30
-        worksheet.column_dimensions['F'].width = 40
-        worksheet.column_dimensions['G'].width = 25
-        worksheet.column_dimensions['H'].width = 15
-        worksheet.column_dimensions['I'].width = 40
-    
-    output.seek(0)
-    return output
+    # Erstelle Excel mit Dropdown-Validierung (erlaube mehr Zeilen für zukünftige Nutzung)
+    validations = [
+        # Brand Guidelines Dropdown (Spalte G)
+        (f"G2:G{len(df) + 10}", {"validate": "list", "source": brand_guidelines_options, "ignore_blank": True}),
+        # Marketplace Dropdown (Spalte H)
+        (f"H2:H{len(df) + 10}", {"validate": "list", "source": marketplace_options, "ignore_blank": False}),
+    ]
+    
+    # Spaltenbreiten für bessere Lesbarkeit
+    column_widths = {
+        "Produktname": 20, "Produktspezifikationen": 50, "USPs": 50, "Zielgruppe": 40,
+        "Saisonalitäten": 30, "Kundenbewertungen": 40, "Brand Guidelines": 25,
+        "Marketplace": 15, "Keywords": 40,
+    }
+    
+    output = frame_to_xlsx(df, sheet_name="KI-Generierung", column_widths=column_widths, validations=validations)
+    return read_export(output)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _build_export_cached(content_hash, kind, _rows, _columns=None, file_format="xlsx", partition_by=()):
+    """
+    Erzeugt eine Exportdatei einmal pro Inhalt. `content_hash` (siehe export_rows_hash) ist
+    der Cache-Schlüssel, die Zeilen selbst werden nicht gehasht.
+    """
+    if kind == "amazon" and partition_by:
+        output, _, _ = export_partitioned_zip(_rows, partition_by=partition_by, layout="amazon", file_format=file_format)
+    elif kind == "amazon":
+        output, _ = export_listings_file(_rows, layout="amazon", file_format=file_format)
+    else:
+        output = frame_to_xlsx(pd.DataFrame(_rows, columns=_columns))
+    return read_export(output)
+
+def lazy_export(kind, rows, columns=None, file_format="xlsx", partition_by=()):
+    """
+    Liefert ein Callable für st.download_button(data=...): Die Datei wird erst beim Klick
+    auf den Button gebaut und bei unverändertem Inhalt aus dem Cache geliefert.
+    
+    Args:
+        kind: "amazon" (Amazon-Layout aus Listing-Dicts) oder "table" (Zeilen-Dicts wie sie sind)
+        rows: Liste von Dicts
+        columns: Spaltenreihenfolge für "table"
+        file_format: Schlüssel aus EXPORT_FORMATS (nur für "amazon", "table" ist immer xlsx)
+        partition_by: Felder aus PARTITION_FIELDS - liefert ein ZIP mit einer Datei pro Gruppe ("amazon")
+    """
+    rows = list(rows)
+    partition_by = tuple(partition_by)
+    
+    def build():
+        return _build_export_cached(export_rows_hash(rows, columns), kind, rows, columns, file_format, partition_by)
+    
+    return build
 
 @st.cache_data(ttl=600, show_spinner=False)  # Cache für 10 Minuten
 def load_brand_guidelines_by_name_cached(engine_identifier, guideline_name):
@@ -736,145 +1332,355 @@ def get_brand_guidelines_list(db_engine):
     engine_id = _get_engine_identifier(db_engine)
     return get_brand_guidelines_list_cached(engine_id)
 
-def process_ai_generation_excel(uploaded_file, db_engine=None):
-    """Verarbeitet eine hochgeladene Excel-Datei für KI-Generierung"""
+@st.cache_resource(show_spinner=False)
+def get_upload_cache():
+    """Prozessweiter LRU-Cache für eingelesene und normalisierte Uploads (Schlüssel: SHA-256 des Inhalts)"""
+    return ParsedUploadCache(max_entries=8)
+
+@st.cache_resource(show_spinner=False)
+def get_upload_parser():
+    """Prozessweiter Hintergrund-Parser für Uploads (teilt sich den Cache mit load_upload_frame)"""
+    return BackgroundUploadParser(cache=get_upload_cache(), max_workers=2)
+
+@st.cache_resource(show_spinner=False)
+def get_upload_process_pool():
+    """Prozessweiter Worker-Pool zum parallelen Einlesen mehrerer Dateien/Tabellenblätter"""
+    return make_upload_process_pool()
+
+@st.cache_resource(show_spinner=False)
+def get_export_process_pool():
+    """Prozessweiter Worker-Pool zum parallelen Erzeugen der Dateien eines aufgeteilten Exports"""
+    return make_export_process_pool()
+
+def _upload_cache_key(uploaded_file, schema, required):
+    """
+    Cache-Schlüssel eines Uploads: Inhalts-Hash + Schema + Pflichtspalten.
+    
+    Für eine Liste von Dateien (Mehrfach-Upload, alle Tabellenblätter) werden die Hashes
+    in Upload-Reihenfolge verbunden und der Schlüssel gekennzeichnet.
+    """
+    if isinstance(uploaded_file, list):
+        content_hash = "+".join(file_sha256(f) for f in uploaded_file)
+        return (content_hash, tuple(schema), tuple(required), "all_sheets")
+    return (file_sha256(uploaded_file), tuple(schema), tuple(required))
+
+def _uploaded_files_payload(uploaded_files):
+    """Mehrfach-Upload als Liste von (Dateiname, Bytes) für parse_uploads"""
+    return [(f.name, f.getvalue()) for f in uploaded_files]
+
+def load_upload_frame(uploaded_file, schema=LISTING_SCHEMA, required=()):
+    """
+    Liest einen Upload ein und normalisiert ihn über `schema` - identische Dateien nur einmal.
+    
+    Bei einer Liste von Dateien werden alle Dateien und Tabellenblätter parallel eingelesen
+    und zusammengeführt (siehe parse_uploads).
+    
+    Returns:
+        tuple: (DataFrame, Spalten-Report inkl. "source_columns" und "content_hash")
+    """
+    cache_key = _upload_cache_key(uploaded_file, schema, required)
+    upload_cache = get_upload_cache()
+    cached = upload_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    if isinstance(uploaded_file, list):
+        df, column_report = parse_uploads(
+            _uploaded_files_payload(uploaded_file), schema, required, executor=get_upload_process_pool()
+        )
+    else:
+        df, column_report = parse_and_normalize(uploaded_file, uploaded_file.name, schema, required)
+    column_report["content_hash"] = cache_key[0]
+    upload_cache.put(cache_key, df, column_report)
+    return df, column_report
+
+def render_validation_summary(validation_errors, validation_summary):
+    """Zeigt das Ergebnis von validate_listing_frame an (Zusammenfassung + Fehler-Tabelle)"""
+    if not validation_summary["invalid_rows"]:
+        st.success("✅ Alle Zeilen halten die Byte-Limits ein.")
+        return
+    problems = [f"{field}: {count}× über dem Limit" for field, count in validation_summary["over_limit"].items()]
+    problems += [f"{field}: {count}× leer" for field, count in validation_summary["missing"].items()]
+    st.warning(f"⚠️ **{validation_summary['invalid_rows']}** von {validation_summary['rows']} Zeilen haben Probleme – " + ", ".join(problems))
+    with st.expander("Fehler-Details anzeigen"):
+        st.dataframe(validation_errors.head(1000), use_container_width=True, hide_index=True)
+        if len(validation_errors) > 1000:
+            st.caption(f"Es werden die ersten 1000 von {len(validation_errors)} Fehlern angezeigt.")
+
+def render_upload_parts(column_report):
+    """Zeigt bei Mehrfach-Uploads, welche Dateien/Blätter übernommen oder übersprungen wurden"""
+    if "parts" not in column_report:
+        return
+    def _origin(part):
+        return f"{part['file']} › {part['sheet']}" if part["sheet"] else part["file"]
+    used = [f"{_origin(part)} ({part['rows']})" for part in column_report["parts"]]
+    if used:
+        st.caption(f"Eingelesen ({len(used)} Blätter/Dateien, Zeilen): " + ", ".join(used))
+    if column_report["skipped_parts"]:
+        st.info("ℹ️ Übersprungen: " + "; ".join(
+            f"{_origin(part)} – {part['reason']}" for part in column_report["skipped_parts"]
+        ))
+
+@st.fragment(run_every=0.5)
+def _render_upload_progress(cache_key):
+    """Zeigt den Fortschritt eines Hintergrund-Einlesevorgangs; lädt die Seite neu, sobald er fertig ist"""
+    job = get_upload_parser().get(cache_key)
+    if job is None or job.done:
+        st.rerun()
+    if job.status == "normalizing":
+        text = f"Normalisiere {job.rows} Zeilen..."
+    else:
+        text = f"Lese Datei... {job.rows} Zeilen · {job.rows_per_sec:,.0f} Zeilen/s"
+        if job.eta_seconds is not None:
+            text += f" · noch ca. {job.eta_seconds:.0f} s"
+    st.progress(job.progress, text=text)
+
+def load_upload_frame_async(uploaded_file, schema=LISTING_SCHEMA, required=()):
+    """
+    Wie load_upload_frame (auch für Listen von Dateien), das Einlesen läuft aber im
+    Hintergrund (BackgroundUploadParser).
+    
+    Solange der Job läuft, wird ein Fortschrittsbalken angezeigt und None zurückgegeben -
+    der Rest der Seite bleibt bedienbar. Ein Rerun startet das Einlesen nicht neu.
+    Bei Fehlern wird eine Meldung angezeigt und ebenfalls None zurückgegeben.
+    
+    Returns:
+        tuple | None: (DataFrame, Spalten-Report) sobald fertig
+    """
+    cache_key = _upload_cache_key(uploaded_file, schema, required)
+    upload_parser = get_upload_parser()
+    cached = get_upload_cache().get(cache_key)
+    if cached is not None:
+        # Falls noch ein fertiger Job unter dem Schlüssel liegt, nicht länger festhalten
+        upload_parser.pop(cache_key)
+        return cached
+    
+    if isinstance(uploaded_file, list):
+        job = upload_parser.submit_files(
+            cache_key, _uploaded_files_payload(uploaded_file), schema, required, executor=get_upload_process_pool()
+        )
+    else:
+        job = upload_parser.submit(cache_key, uploaded_file.getvalue(), uploaded_file.name, schema, required)
+    if job.status == "error":
+        upload_parser.pop(cache_key)
+        st.error(f"❌ Fehler beim Laden der Datei: {job.error}")
+        return None
+    if job.status == "done":
+        upload_parser.pop(cache_key)
+        if job.result is None:
+            # Ergebnis wurde beim Abschluss in den Cache übernommen (None, falls schon wieder verdrängt)
+            return get_upload_cache().get(cache_key)
+        df, column_report = job.result
+        return df.copy(), dict(column_report)
+    
+    _render_upload_progress(cache_key)
+    return None
+
+def _generated_listing_record(item, generated):
+    """
+    Listing-Datenstruktur für eine generierte Batch-Zeile.
+    
+    Returns:
+        tuple: (Daten für save_listing_to_db, Listing für die Bearbeitungsmaske mit mp/asin_ean_sku)
+    """
+    listing_data_for_db = {
+        "Product": item["product_name"],
+        "Titel": generated.get("Titel", ""),
+        "Bullet1": generated.get("Bullet1", ""),
+        "Bullet2": generated.get("Bullet2", ""),
+        "Bullet3": generated.get("Bullet3", ""),
+        "Bullet4": generated.get("Bullet4", ""),
+        "Bullet5": generated.get("Bullet5", ""),
+        "Description": generated.get("Description", ""),
+        "SearchTerms": generated.get("SearchTerms", ""),
+        "Keywords": item["keywords"]
+    }
+    listing_data = dict(listing_data_for_db)
+    listing_data["mp"] = item["marketplace"]  # Verwende "mp" statt "Marketplace" für Kompatibilität mit render_listing
+    listing_data["asin_ean_sku"] = item["asin"]  # ASIN hinzufügen
+    return listing_data_for_db, listing_data
+
+def process_ai_generation_excel(uploaded_files, db_engine=None, on_progress=None, force_regenerate=False,
+                                on_resume=None):
+    """
+    Verarbeitet hochgeladene Dateien (alle Tabellenblätter) für KI-Generierung.
+    
+    Die Zeilen werden gleichzeitig auf der prozessweiten Event-Loop generiert
+    (AsyncGenerationRunner, gedrosselt über den RateLimiter); fertige Listings werden in
+    Eingabereihenfolge gespeichert, während die nächsten Zeilen noch generiert werden.
+    
+    Zeilen mit unveränderten Eingaben kommen aus dem Antwort-Cache (außer bei
+    `force_regenerate`) - ein erneuter Lauf fragt nur bisher fehlgeschlagene Zeilen an.
+    Jeder Lauf ist ein Job mit Checkpoint je Zeile (JobStore): wird derselbe Batch nach
+    einer Unterbrechung erneut gestartet, werden fertige Zeilen übernommen. Eine Zeile gilt
+    erst als fertig, wenn sie gespeichert ist - sonst wird sie beim Fortsetzen wiederholt.
+    
+    Args:
+        on_progress: Optionaler Callback(fertige_zeilen, gesamt)
+        on_resume: Optionaler Callback(übernommene_zeilen, gesamt), wenn ein Job fortgesetzt wird
+    
+    Returns:
+        tuple: (Liste generierter Listings oder None bei Dateifehler, Fehlerliste bzw. Fehlermeldung)
+    """
     try:
-        # Lade Excel-Datei
-        df = pd.read_excel(uploaded_file, engine="openpyxl")
-        
-        # Normalisiere Spaltennamen (ignoriere Groß-/Kleinschreibung und Leerzeichen)
-        df.columns = df.columns.str.strip()
-        
-        # Erwartete Spalten
-        required_cols = ["Produktname", "Marketplace"]
-        optional_cols = {
-            "Produktspezifikationen": "Produktspezifikationen",
-            "USPs": "USPs",
-            "Zielgruppe": "Zielgruppe",
-            "Saisonalitäten": "Saisonalitäten",
-            "Kundenbewertungen": "Kundenbewertungen",
-            "Brand Guidelines": "Brand Guidelines",
-            "Keywords": "Keywords"
-        }
-        
-        # Prüfe ob alle erforderlichen Spalten vorhanden sind
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            return None, f"Fehlende erforderliche Spalten: {', '.join(missing_cols)}"
+        # Lade Dateien (xlsx, CSV/TSV oder Parquet - parallel, Kennungen wie ASIN/EAN bleiben Text)
+        # Normalisiere Spalten über das gemeinsame Schema (Aliase, Groß-/Kleinschreibung, Leerzeichen)
+        df, column_report = load_upload_frame(uploaded_files, AI_GENERATION_SCHEMA, required=["Produktname", "Marketplace"])
+    except Exception as e:
+        return None, f"Fehler beim Lesen der Datei: {str(e)}"
+    
+    # Prüfe ob alle erforderlichen Spalten vorhanden sind
+    if column_report["missing"]:
+        return None, f"Fehlende erforderliche Spalten: {', '.join(column_report['missing'])}"
+    
+    generated_listings = []
+    errors = []
+    
+    # 1) Eingaben aller Zeilen prüfen und Prompts bauen
+    # Fehlermeldungen nennen Datei, Tabellenblatt und Zeile
+    rows_to_generate = []
+    for location, row in zip(source_row_labels(df), frame_to_listing_records(df, list(AI_GENERATION_SCHEMA))):
+        try:
+            # Sammle Input-Daten für KI-Generierung (bereits getrimmte Strings)
+            product_name = row["Produktname"]
+            marketplace = row["Marketplace"]
+            
+            # ASIN aus ASIN/EAN/SKU-Spalten; falls keine ASIN gefunden, verwende Produktname als Fallback
+            asin_value = row["asin_ean_sku"] or product_name
+            
+            if not product_name:
+                errors.append(f"{location}: Produktname fehlt")
+                continue
+            
+            if not marketplace:
+                errors.append(f"{location}: Marketplace fehlt")
+                continue
+            
+            # Lade Brand Guidelines falls angegeben
+            guideline_name = row["Brand Guidelines"]
+            brand_guidelines = None
+            if guideline_name and guideline_name != "-- Keine --":
+                brand_guidelines = load_brand_guidelines_by_name(db_engine, guideline_name)
+            
+            # Baue Input-Daten für KI-Generierung
+            input_data = {
+                "product_name": product_name,
+                "product_specs": row["Produktspezifikationen"],
+                "usps": row["USPs"],
+                "target_audience": row["Zielgruppe"],
+                "customer_feedback": row["Kundenbewertungen"],
+                "seasonal_info": row["Saisonalitäten"],
+                "keywords": row["Keywords"],
+                "brand_name_format": brand_guidelines.get("brand_name_format", "") if brand_guidelines else "",
+                "required_formulations": brand_guidelines.get("required_formulations", "") if brand_guidelines else "",
+                "forbidden_terms": brand_guidelines.get("forbidden_terms", "") if brand_guidelines else "",
+            }
+            
+            # Prüfe ob mindestens Grundinformationen vorhanden sind
+            has_basic_info = (
+                input_data["product_name"].strip() or 
+                input_data["product_specs"].strip() or 
+                input_data["usps"].strip()
+            )
+            
+            if not has_basic_info:
+                errors.append(f"{location}: Mindestens Produktname, Produktspezifikationen oder USPs müssen ausgefüllt sein")
+                continue
+            
+            rows_to_generate.append({
+                "location": location,
+                "product_name": product_name,
+                "marketplace": marketplace,
+                "asin": asin_value,
+                "keywords": input_data["keywords"],
+                "prompt": _build_prompt(input_data),
+            })
+        except Exception as e:
+            errors.append(f"{location}: {str(e)}")
+    
+    if not rows_to_generate:
+        return generated_listings, errors
+    
+    # 2) Checkpoint: gleiche Zeilen ergeben denselben Job - bereits fertige Zeilen aus einem
+    #    abgebrochenen Lauf (Tab geschlossen, Rerun) werden übernommen statt neu generiert
+    job_store = get_job_store(_get_engine_identifier(db_engine))
+    row_hashes = [
+        row_input_hash(item["prompt"], item["asin"], item["marketplace"], item["product_name"], item["keywords"])
+        for item in rows_to_generate
+    ]
+    job_id, job_rows = job_store.open_job(
+        row_hashes, label=", ".join(f.name for f in uploaded_files), restart=force_regenerate
+    )
+    listings_by_index = {}
+    for index, job_row in enumerate(job_rows):
+        if job_row["state"] == ROW_DONE:
+            # Erst nach dem automatischen Speichern als fertig markiert - nur wieder anzeigen
+            listings_by_index[index] = _generated_listing_record(rows_to_generate[index], job_row["result"])[1]
+    to_run = [index for index, job_row in enumerate(job_rows) if job_row["state"] != ROW_DONE]
+    if listings_by_index and on_resume:
+        on_resume(len(listings_by_index), len(rows_to_generate))
+    if not to_run:
+        return list(listings_by_index.values()), errors
+    
+    gemini_client, client_error = _get_gemini_client_or_error()
+    if gemini_client is None:
+        return None, client_error
+    
+    # 3) Gleichzeitig generieren (asyncio, höchstens max_workers offene Anfragen); Ergebnisse
+    #    kommen in Eingabereihenfolge und werden sofort gespeichert, während die nächsten
+    #    Zeilen noch generiert werden. Bricht das Script ab, werden offene Anfragen abgebrochen.
+    #    Zu lange Felder werden je Zeile gezielt nachgekürzt (repair_rounds).
+    max_workers, requests_per_minute, tokens_per_minute, timeout, repair_rounds = _get_gemini_limits()
+    # Alle Durchgänge eines Jobs erscheinen im Protokoll als ein Batch
+    batch_log = get_generation_log(_get_engine_identifier(db_engine)).for_batch(job_id[:12])
+    job_store.mark_running(job_id, to_run)
+    # Fortschritt auch während des Wartens neu anzeigen: so bricht ein Rerun die offenen Anfragen ab
+    finished = [len(listings_by_index)]
+    results = get_generation_runner().generate_many(
+        gemini_client,
+        [rows_to_generate[index]["prompt"] for index in to_run],
+        concurrency=max_workers,
+        limiter=get_gemini_rate_limiter(requests_per_minute, tokens_per_minute),
+        timeout=timeout,
+        cache=get_response_cache(_get_engine_identifier(db_engine)),
+        force=force_regenerate,
+        retry=RetryPolicy(),
+        repair_rounds=repair_rounds,
+        log=batch_log,
+        poll=(lambda elapsed: on_progress(finished[0], len(rows_to_generate))) if on_progress else None
+    )
+    for done, result in enumerate(results, start=len(listings_by_index) + 1):
+        finished[0] = done
+        index = to_run[result.index]
+        item = rows_to_generate[index]
+        location = item["location"]
+        if on_progress:
+            on_progress(done, len(rows_to_generate))
+        if not result.ok:
+            retried = f" (nach {result.attempts} Versuchen)" if result.retries else ""
+            errors.append(f"{location}: KI-Generierung fehlgeschlagen{retried}: {result.error}")
+            job_store.mark_failed(job_id, index, result.error)
+            continue
         
-        # Verarbeite jede Zeile
-        generated_listings = []
-        errors = []
+        if result.repair and result.repair["remaining"]:
+            errors.append(f"{location}: Nach dem Kürzen noch zu lang: {_describe_over_limit(result.repair['remaining'])}")
+        listing_data_for_db, listing_data = _generated_listing_record(item, result.data)
+        listings_by_index[index] = listing_data
         
-        for idx, row in df.iterrows():
+        # Automatisch in Datenbank speichern, damit es bei Browserabsturz nicht verloren geht
+        if db_engine and item["asin"] and item["marketplace"]:
             try:
-                # Sammle Input-Daten für KI-Generierung
-                product_name = str(row.get("Produktname", "")).strip()
-                marketplace = str(row.get("Marketplace", "")).strip()
-                
-                # Versuche ASIN aus verschiedenen möglichen Spaltennamen zu lesen
-                asin_value = ""
-                for asin_col in ["ASIN", "ASIN/EAN/SKU", "ASIN / EAN / SKU", "asin_ean_sku", "EAN", "SKU"]:
-                    if asin_col in df.columns:
-                        asin_value = str(row.get(asin_col, "")).strip()
-                        if asin_value:
-                            break
-                
-                # Falls keine ASIN gefunden, verwende Produktname als Fallback
-                if not asin_value:
-                    asin_value = product_name
-                
-                if not product_name:
-                    errors.append(f"Zeile {idx + 2}: Produktname fehlt")
-                    continue
-                
-                if not marketplace:
-                    errors.append(f"Zeile {idx + 2}: Marketplace fehlt")
-                    continue
-                
-                # Lade Brand Guidelines falls angegeben
-                guideline_name = str(row.get("Brand Guidelines", "")).strip()
-                brand_guidelines = None
-                if guideline_name and guideline_name != "-- Keine --" and guideline_name != "nan":
-                    brand_guidelines = load_brand_guidelines_by_name(db_engine, guideline_name)
-                
-                # Baue Input-Daten für KI-Generierung
-                input_data = {
-                    "product_name": product_name,
-                    "product_specs": str(row.get("Produktspezifikationen", "")).strip(),
-                    "usps": str(row.get("USPs", "")).strip(),
-                    "target_audience": str(row.get("Zielgruppe", "")).strip(),
-                    "customer_feedback": str(row.get("Kundenbewertungen", "")).strip(),
-                    "seasonal_info": str(row.get("Saisonalitäten", "")).strip(),
-                    "keywords": str(row.get("Keywords", "")).strip(),
-                    "brand_name_format": brand_guidelines.get("brand_name_format", "") if brand_guidelines else "",
-                    "required_formulations": brand_guidelines.get("required_formulations", "") if brand_guidelines else "",
-                    "forbidden_terms": brand_guidelines.get("forbidden_terms", "") if brand_guidelines else "",
-                }
-                
-                # Prüfe ob mindestens Grundinformationen vorhanden sind
-                has_basic_info = (
-                    input_data["product_name"].strip() or 
-                    input_data["product_specs"].strip() or 
-                    input_data["usps"].strip()
-                )
-                
-                if not has_basic_info:
-                    errors.append(f"Zeile {idx + 2}: Mindestens Produktname, Produktspezifikationen oder USPs müssen ausgefüllt sein")
-                    continue
-                
-                # Generiere Listing mit KI
-                prompt = _build_prompt(input_data)
-                result = _call_gemini_and_parse(prompt)
-                
-                if result:
-                    # Erstelle Listing-Datenstruktur
-                    listing_data = {
-                        "Product": product_name,
-                        "Titel": result.get("Titel", ""),
-                        "Bullet1": result.get("Bullet1", ""),
-                        "Bullet2": result.get("Bullet2", ""),
-                        "Bullet3": result.get("Bullet3", ""),
-                        "Bullet4": result.get("Bullet4", ""),
-                        "Bullet5": result.get("Bullet5", ""),
-                        "Description": result.get("Description", ""),
-                        "SearchTerms": result.get("SearchTerms", ""),
-                        "Keywords": input_data["keywords"],
-                        "mp": marketplace,  # Verwende "mp" statt "Marketplace" für Kompatibilität mit render_listing
-                        "asin_ean_sku": asin_value  # ASIN hinzufügen
-                    }
-                    generated_listings.append(listing_data)
-                    
-                    # Automatisch in Datenbank speichern, damit es bei Browserabsturz nicht verloren geht
-                    if db_engine and asin_value and marketplace:
-                        try:
-                            listing_data_for_db = {
-                                "Product": product_name,
-                                "Titel": result.get("Titel", ""),
-                                "Bullet1": result.get("Bullet1", ""),
-                                "Bullet2": result.get("Bullet2", ""),
-                                "Bullet3": result.get("Bullet3", ""),
-                                "Bullet4": result.get("Bullet4", ""),
-                                "Bullet5": result.get("Bullet5", ""),
-                                "Description": result.get("Description", ""),
-                                "SearchTerms": result.get("SearchTerms", ""),
-                                "Keywords": input_data["keywords"]
-                            }
-                            save_listing_to_db(db_engine, listing_data_for_db, asin_value, marketplace, None, None)
-                        except Exception as save_error:
-                            # Fehler beim Speichern nicht kritisch, nur in errors-Liste aufnehmen
-                            errors.append(f"Zeile {idx + 2}: Automatisches Speichern fehlgeschlagen: {str(save_error)}")
-                else:
-                    errors.append(f"Zeile {idx + 2}: KI-Generierung fehlgeschlagen")
-                    
-            except Exception as e:
-                errors.append(f"Zeile {idx + 2}: {str(e)}")
+                save_listing_to_db(db_engine, listing_data_for_db, item["asin"], item["marketplace"], None, None)
+            except Exception as save_error:
+                # Nicht als fertig markieren: beim Fortsetzen wird die Zeile (aus dem Cache) erneut gespeichert
+                errors.append(f"{location}: Automatisches Speichern fehlgeschlagen: {str(save_error)}")
+                job_store.mark_failed(job_id, index, save_error)
                 continue
-        
-        return generated_listings, errors
-        
-    except Exception as e:
-        return None, f"Fehler beim Lesen der Excel-Datei: {str(e)}"
+        # Checkpoint erst nach erfolgreichem Speichern
+        job_store.mark_done(job_id, index, result.data)
+    
+    generated_listings = [listings_by_index[index] for index in sorted(listings_by_index)]
+    return generated_listings, errors
 
 st.set_page_config(
     page_title="Amazon Listing Editor",
@@ -1409,7 +2215,7 @@ Nach der Bearbeitung kannst du die aktualisierten Daten wieder als Excel herunte
 
 Damit die Datei korrekt eingelesen wird, muss sie folgende Struktur erfüllen:
 
-- **Format:** `.xlsx` (Excel-Datei, keine CSV oder andere Formate)  
+- **Format:** `.xlsx` (Excel), `.csv` / `.tsv` / `.txt` (Trennzeichen `,` `;` Tab oder `|` werden automatisch erkannt) oder `.parquet`  
 - **Tabellenstruktur:**  
   - Die Spalten sollten wie folgt benannt sein, **dabei spielt die Reihenfolge der Spalten keine Rolle**:
     ```
@@ -2083,101 +2889,379 @@ OUTPUT-FORMAT: Gib die Antwort ausschließlich als kompaktes JSON im folgenden S
 if "generated_rows" not in st.session_state:
     st.session_state["generated_rows"] = []
 
-def _get_available_gemini_model(api_key: str) -> str:
+def _get_gemini_settings():
+    """API-Key und optional fest eingestelltes Modell (GEMINI_MODEL / gemini_model) aus Umgebung oder Streamlit secrets"""
+    api_key = os.getenv("GEMINI_API_KEY")
+    model_override = os.getenv("GEMINI_MODEL")
+    try:
+        if hasattr(st, 'secrets'):
+            if not api_key and "gemini_api_key" in st.secrets:
+                api_key = st.secrets["gemini_api_key"]
+            if not model_override and "gemini_model" in st.secrets:
+                model_override = st.secrets["gemini_model"]
+    except Exception:
+        pass
+    return api_key, model_override
+
+def _get_gemini_limits():
     """
-    Prüft verfügbare Gemini-Modelle und gibt das erste verfügbare Modell zurück,
-    das generateContent unterstützt.
+    Parallele Anfragen, Anfragen/Tokens pro Minute, Zeitlimit je Anfrage und Kürzungsrunden
+    für zu lange Felder (gemini_max_workers, gemini_rpm, gemini_tpm, gemini_timeout,
+    gemini_repair_rounds)
     """
-    try:
-        genai.configure(api_key=api_key)
-        models = genai.list_models()
-        
-        # Priorisierte Liste von Modellen (von bevorzugt zu weniger bevorzugt)
-        preferred_models = [
-            'gemini-1.5-pro-002',
-            'gemini-1.5-pro',
-            'gemini-1.5-flash',
-            'gemini-pro',
-            'gemini-1.0-pro',
+    limits = []
+    for name, default in (
+        ("gemini_max_workers", GEMINI_MAX_WORKERS),
+        ("gemini_rpm", GEMINI_REQUESTS_PER_MINUTE),
+        ("gemini_tpm", GEMINI_TOKENS_PER_MINUTE),
+        ("gemini_timeout", GEMINI_REQUEST_TIMEOUT_SECONDS),
+        ("gemini_repair_rounds", BYTE_REPAIR_MAX_ROUNDS),
+    ):
+        value = os.getenv(name.upper())
+        try:
+            if value is None and hasattr(st, 'secrets') and name in st.secrets:
+                value = st.secrets[name]
+        except Exception:
+            pass
+        try:
+            limits.append(int(value) if value is not None else default)
+        except (TypeError, ValueError):
+            limits.append(default)
+    return tuple(limits)
+
+def _describe_over_limit(over):
+    """z.B. "Titel (162/150 Bytes), Bullet2 (231/200 Bytes)" für over_limit_fields()"""
+    return ", ".join(f"{field} ({size}/{limit} Bytes)" for field, (size, limit) in over.items())
+
+def _show_repair_report(report):
+    """Meldet, welche Felder nachträglich gekürzt wurden und welche noch zu lang sind"""
+    if not report:
+        return
+    if report["fixed"]:
+        st.info(f"✂️ Auf Byte-Limit gekürzt: {', '.join(report['fixed'])} ({report['rounds']} Kürzungsrunde(n)).")
+    if report["remaining"]:
+        st.warning(f"⚠️ Noch zu lang: {_describe_over_limit(report['remaining'])}. Bitte in der Bearbeitungsmaske kürzen.")
+    if report["error"]:
+        st.warning(f"⚠️ Kürzen fehlgeschlagen: {report['error']}")
+
+class DbResponseCache(ResponseCache):
+    """
+    ResponseCache in der Tabelle generation_cache - überlebt Neustarts und gilt für alle Prozesse.
+    
+    Abgelaufene Einträge werden beim Lesen ignoriert; aufgeräumt (TTL und Größenlimit, zuletzt
+    genutzte bleiben) wird nur bei jedem `evict_every`-ten Speichern, nicht bei jedem Aufruf.
+    """
+    
+    def __init__(self, engine, evict_every=50, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+        self.evict_every = evict_every
+        self._stores = 0
+    
+    def _load(self, key):
+        with self.engine.begin() as conn:
+            row = conn.execute(text("""
+                UPDATE generation_cache
+                SET hit_count = hit_count + 1, last_hit_at = CURRENT_TIMESTAMP
+                WHERE cache_key = :key AND created_at > CURRENT_TIMESTAMP - make_interval(secs => :ttl)
+                RETURNING response
+            """), {"key": key, "ttl": self.ttl}).fetchone()
+        return row[0] if row else None
+    
+    def _store(self, key, response_text, model_name, tokens):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO generation_cache (cache_key, model, response, tokens)
+                VALUES (:key, :model, :response, :tokens)
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    model = EXCLUDED.model,
+                    response = EXCLUDED.response,
+                    tokens = EXCLUDED.tokens,
+                    created_at = CURRENT_TIMESTAMP,
+                    last_hit_at = CURRENT_TIMESTAMP
+            """), {"key": key, "model": model_name, "response": response_text, "tokens": tokens})
+        with self._lock:
+            self._stores += 1
+    
+    def _evict(self):
+        if self._stores % self.evict_every:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "DELETE FROM generation_cache WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => :ttl)"
+            ), {"ttl": self.ttl})
+            conn.execute(text("""
+                DELETE FROM generation_cache WHERE cache_key IN (
+                    SELECT cache_key FROM generation_cache ORDER BY last_hit_at DESC OFFSET :max_entries
+                )
+            """), {"max_entries": self.max_entries})
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache(engine_identifier):
+    """Prozessweiter Antwort-Cache: in der Datenbank, ohne Datenbank im Speicher"""
+    engine = get_db_connection() if engine_identifier != "no_engine" else None
+    if engine:
+        return DbResponseCache(engine)
+    return ResponseCache()
+
+class DbGenerationLog(GenerationLog):
+    """GenerationLog in der Tabelle generation_log - gemeinsam für alle Prozesse und Sessions"""
+    
+    def __init__(self, engine, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+    
+    def _write(self, entry):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO generation_log (created_at, batch_id, kind, model, prompt_tokens, response_tokens,
+                    total_tokens, latency_ms, total_ms, attempts, cached, ok, error)
+                VALUES (:created_at, :batch_id, :kind, :model, :prompt_tokens, :response_tokens,
+                    :total_tokens, :latency_ms, :total_ms, :attempts, :cached, :ok, :error)
+            """), entry)
+    
+    def _read(self, days):
+        query = "SELECT * FROM generation_log"
+        if days:
+            query += " WHERE created_at > CURRENT_TIMESTAMP - make_interval(days => :days)"
+        query += " ORDER BY created_at DESC LIMIT :limit"
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query), {"days": days, "limit": self._entries.maxlen}).mappings().all()
+        entries = [dict(row) for row in reversed(rows)]
+        for entry in entries:
+            entry["created_at"] = entry["created_at"].isoformat()
+        return entries
+
+@st.cache_resource(show_spinner=False)
+def get_generation_log(engine_identifier):
+    """Prozessweites Aufruf-Protokoll: in der Datenbank, ohne Datenbank als JSONL-Datei"""
+    engine = get_db_connection() if engine_identifier != "no_engine" else None
+    if engine:
+        return DbGenerationLog(engine)
+    return JsonlGenerationLog()
+
+class DbJobStore(JobStore):
+    """JobStore in den Tabellen generation_jobs/generation_job_rows - überlebt Neustarts"""
+    
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+    
+    def open_job(self, row_hashes, label="", restart=False):
+        job_id = job_input_hash(row_hashes)
+        with self.engine.begin() as conn:
+            if restart:
+                conn.execute(text("DELETE FROM generation_jobs WHERE job_id = :job_id"), {"job_id": job_id})
+            created = conn.execute(text("""
+                INSERT INTO generation_jobs (job_id, label, total_rows) VALUES (:job_id, :label, :total)
+                ON CONFLICT (job_id) DO NOTHING
+                RETURNING job_id
+            """), {"job_id": job_id, "label": label, "total": len(row_hashes)}).fetchone()
+            if created:
+                conn.execute(text("""
+                    INSERT INTO generation_job_rows (job_id, row_index, input_hash) VALUES (:job_id, :row_index, :input_hash)
+                """), [{"job_id": job_id, "row_index": index, "input_hash": row_hash}
+                       for index, row_hash in enumerate(row_hashes)])
+            rows = conn.execute(text("""
+                SELECT state, result, error FROM generation_job_rows WHERE job_id = :job_id ORDER BY row_index
+            """), {"job_id": job_id}).fetchall()
+        return job_id, [
+            {"state": state, "result": json.loads(result) if result else None, "error": error}
+            for state, result, error in rows
         ]
-        
-        # Erstelle eine Liste aller verfügbaren Modelle mit ihren unterstützten Methoden
-        available_models = {}
-        for model in models:
-            if 'generateContent' in model.supported_generation_methods:
-                model_name = model.name.replace('models/', '')
-                available_models[model_name] = model
-        
-        # Versuche zuerst die bevorzugten Modelle
-        for model_name in preferred_models:
-            if model_name in available_models:
-                return model_name
-        
-        # Falls kein bevorzugtes Modell verfügbar, nimm das erste verfügbare
-        if available_models:
-            return list(available_models.keys())[0]
-        
-        return None
+    
+    def _update(self, job_id, indexes, **values):
+        if "result" in values:
+            values["result"] = json.dumps(values["result"], ensure_ascii=False)
+        assignments = ", ".join(f"{column} = :{column}" for column in values)
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+                UPDATE generation_job_rows SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = :job_id AND row_index = ANY(:indexes)
+            """), {**values, "job_id": job_id, "indexes": list(indexes)})
+            conn.execute(text("UPDATE generation_jobs SET updated_at = CURRENT_TIMESTAMP WHERE job_id = :job_id"),
+                         {"job_id": job_id})
+    
+    def unfinished_jobs(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT j.job_id, j.label, j.total_rows, j.updated_at,
+                       COUNT(*) FILTER (WHERE r.state = :done) AS done,
+                       COUNT(*) FILTER (WHERE r.state = :failed) AS failed
+                FROM generation_jobs j JOIN generation_job_rows r ON r.job_id = j.job_id
+                GROUP BY j.job_id
+                HAVING COUNT(*) FILTER (WHERE r.state = :done) < j.total_rows
+                ORDER BY j.updated_at DESC
+                LIMIT 20
+            """), {"done": ROW_DONE, "failed": ROW_FAILED}).fetchall()
+        return [
+            {"job_id": job_id, "label": label, "total": total, "done": done, "failed": failed,
+             "updated_at": updated_at.isoformat(timespec="seconds")}
+            for job_id, label, total, updated_at, done, failed in rows
+        ]
+
+@st.cache_resource(show_spinner=False)
+def get_job_store(engine_identifier):
+    """Prozessweiter Speicher für Batch-Checkpoints: in der Datenbank, ohne Datenbank im Speicher"""
+    engine = get_db_connection() if engine_identifier != "no_engine" else None
+    if engine:
+        return DbJobStore(engine)
+    return JobStore()
+
+@st.cache_resource(show_spinner=False)
+def get_generation_runner():
+    """Prozessweite Event-Loop (eigener Thread) für alle Gemini-Anfragen aller Sessions"""
+    return AsyncGenerationRunner()
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_rate_limiter(requests_per_minute, tokens_per_minute):
+    """Prozessweiter RateLimiter - alle Sessions teilen sich das Kontingent des API-Keys"""
+    return RateLimiter(requests_per_minute, tokens_per_minute)
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_client(api_key, model_override=None):
+    """
+    Prozessweiter Gemini-Client: configure() einmal, Modellsuche mit TTL statt list_models()
+    bei jedem Aufruf, GenerativeModel-Instanzen werden wiederverwendet.
+    """
+    return GeminiClient(GenaiBackend(api_key), model_override=model_override)
+
+def _get_gemini_client_or_error():
+    """
+    Liefert den prozessweiten Gemini-Client oder eine Fehlermeldung.
+    
+    Returns:
+        tuple: (GeminiClient oder None, Fehlermeldung oder None)
+    """
+    if not _HAS_GEMINI:
+        return None, "Google Gemini SDK nicht installiert. Installiere mit `pip install google-generativeai` und setze die Umgebungsvariable GEMINI_API_KEY."
+    api_key, model_override = _get_gemini_settings()
+    if not api_key:
+        return None, "GEMINI_API_KEY nicht gefunden. Bitte setze die Umgebungsvariable oder füge sie zu Streamlit secrets hinzu."
+    try:
+        gemini_client = get_gemini_client(api_key, model_override)
+        if not gemini_client.model_name():
+            return None, "Kein verfügbares Gemini-Modell gefunden, das generateContent unterstützt."
     except Exception as e:
-        st.warning(f"Fehler beim Abrufen der verfügbaren Modelle: {e}")
-        return None
+        return None, f"Gemini-Client konnte nicht initialisiert werden: {e}"
+    return gemini_client, None
+
+def _render_stream_preview(preview, fields):
+    """Zeigt die bisher gestreamten Felder mit Byte-Zählern im Platzhalter `preview` an"""
+    with preview.container():
+        for field_name, limit in FIELD_BYTE_LIMITS.items():
+            value = fields.get(field_name)
+            if value is None:
+                continue
+            blen = len(value.encode("utf-8"))
+            counter_class = "over-limit" if blen > limit else "under-limit"
+            st.markdown(f"<div class='field-label'>{field_name}</div>", unsafe_allow_html=True)
+            st.text(value)
+            st.markdown(f"<div class='byte-counter {counter_class}'>Bytes: {blen} / {limit}</div>", unsafe_allow_html=True)
 
-def _call_gemini_and_parse(prompt_text: str) -> dict:
+def _call_gemini_and_parse(prompt_text: str, force_regenerate: bool = False, preview=None) -> dict:
     """
     Ruft (optional) Google Gemini auf und parst die JSON-Antwort.
-    Verwendet automatisch das erste verfügbare Modell, das generateContent unterstützt.
-    Fällt beim Fehler auf {} zurück.
+    Verwendet das in secrets eingestellte Modell (gemini_model) oder das erste verfügbare,
+    das generateContent unterstützt. Gleiche Prompts werden aus dem Antwort-Cache bedient,
+    außer bei `force_regenerate`. Mit `preview` (st.empty()) wird gestreamt und die Felder
+    erscheinen dort schon während der Generierung. Fällt beim Fehler auf {} zurück.
     """
     # Wenn Gemini SDK fehlt oder kein API-Key gesetzt ist, brechen wir sauber ab.
-    if not _HAS_GEMINI:
-        st.warning("Google Gemini SDK nicht installiert. Installiere mit `pip install google-generativeai` und setze die Umgebungsvariable GEMINI_API_KEY.")
+    gemini_client, client_error = _get_gemini_client_or_error()
+    if gemini_client is None:
+        if not _HAS_GEMINI:
+            st.warning(client_error)
+        else:
+            st.error(client_error)
         return {}
 
     try:
-        # API-Key aus Environment oder Streamlit secrets holen
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            try:
-                if hasattr(st, 'secrets') and "gemini_api_key" in st.secrets:
-                    api_key = st.secrets["gemini_api_key"]
-            except Exception:
-                pass
-        
-        if not api_key:
-            st.error("GEMINI_API_KEY nicht gefunden. Bitte setze die Umgebungsvariable oder füge sie zu Streamlit secrets hinzu.")
-            return {}
-        
-        genai.configure(api_key=api_key)
-        
-        # Finde verfügbares Modell
-        model_name = _get_available_gemini_model(api_key)
-        if not model_name:
-            st.error("Kein verfügbares Gemini-Modell gefunden, das generateContent unterstützt.")
-            return {}
-        
         # Zeige verwendetes Modell an (nur beim ersten Aufruf, um Spam zu vermeiden)
+        model_name = gemini_client.model_name()
         if "gemini_model_used" not in st.session_state:
             st.info(f"ℹ️ Verwende Gemini-Modell: {model_name}")
             st.session_state["gemini_model_used"] = model_name
         
-        model = genai.GenerativeModel(model_name)
-        
-        # System-Prompt und User-Prompt kombinieren
-        full_prompt = f"Du bist ein hilfreicher, präziser Assistent.\n\n{prompt_text}"
-        
-        response = model.generate_content(full_prompt)
-        text = response.text.strip()
-        
-        # JSON extrahieren
-        m = re.search(r"\{.*\}", text, re.S)
-        if not m:
-            st.error("Konnte kein JSON aus der Antwort extrahieren.")
+        _, requests_per_minute, tokens_per_minute, timeout, repair_rounds = _get_gemini_limits()
+        limiter = get_gemini_rate_limiter(requests_per_minute, tokens_per_minute)
+        response_cache = get_response_cache(_get_engine_identifier(db_engine))
+        generation_log = get_generation_log(_get_engine_identifier(db_engine))
+        if preview is not None:
+            # Streaming im Skript-Thread: ein Klick auf "Abbrechen" startet das Skript neu - der
+            # Rerun wird bei der nächsten Vorschau-Ausgabe ausgelöst und beendet den Stream
+            generation = generate_listing_stream(
+                gemini_client,
+                prompt_text,
+                limiter=limiter,
+                cache=response_cache,
+                force=force_regenerate,
+                retry=RetryPolicy(),
+                on_update=lambda fields: _render_stream_preview(preview, fields),
+                log=generation_log
+            )
+        else:
+            # Läuft auf der prozessweiten Event-Loop; gleicher RateLimiter wie die Batch-Generierung.
+            # Die Wartezeit-Anzeige ist zugleich der Punkt, an dem ein Rerun die Anfrage abbricht.
+            wait_status = st.empty()
+            generation = get_generation_runner().generate(
+                gemini_client,
+                prompt_text,
+                limiter=limiter,
+                timeout=timeout,
+                cache=response_cache,
+                force=force_regenerate,
+                retry=RetryPolicy(),
+                repair_rounds=repair_rounds,
+                log=generation_log,
+                poll=lambda elapsed: wait_status.caption(f"⏳ {elapsed:.0f} s")
+            )
+            wait_status.empty()
+        if preview is not None:
+            preview.empty()
+        if not generation.ok:
+            retried = f" (nach {generation.attempts} Versuchen)" if generation.retries else ""
+            st.error(f"Generierung fehlgeschlagen{retried}: {generation.error}")
             return {}
-        return json.loads(m.group(0))
+        if generation.cached:
+            st.info("♻️ Antwort aus dem Cache (gleiche Eingaben wie zuvor). Für eine neue Variante 'Neu generieren' aktivieren.")
+        data = generation.data
+        if preview is not None and repair_rounds and over_limit_fields(data):
+            # Im Streaming-Pfad wird erst nach dem vollständigen Listing gekürzt
+            with st.spinner("✂️ Kürze zu lange Felder..."):
+                data, generation.repair = repair_byte_limits(
+                    gemini_client,
+                    data,
+                    max_rounds=repair_rounds,
+                    limiter=limiter,
+                    cache=response_cache,
+                    retry=RetryPolicy(),
+                    log=generation_log
+                )
+        _show_repair_report(generation.repair)
+        return data
     except Exception as e:
         st.error(f"Generierung fehlgeschlagen: {e}")
         return {}
 
+force_regenerate_single = st.checkbox(
+    "🔄 Neu generieren (Antwort-Cache ignorieren)",
+    value=False,
+    key="force_regenerate_single",
+    help="Bei unveränderten Eingaben wird sonst die zuletzt generierte Antwort wiederverwendet, ohne Gemini erneut aufzurufen."
+)
+stream_single = st.checkbox(
+    "⚡ Live-Vorschau (Streaming)",
+    value=True,
+    key="stream_single",
+    help="Zeigt Titel, Bullets usw. schon während der Generierung an. Über 'Abbrechen' lässt sich eine unpassende Antwort vorzeitig stoppen."
+)
+
+# Ist die Markierung noch gesetzt, wurde die letzte Generierung durch einen Rerun beendet
+# (z.B. "Abbrechen") und ist nie bis zum Ende gelaufen
+if st.session_state.pop("single_generation_running", False):
+    st.warning("⏹️ Generierung abgebrochen.")
+
 if st.button("✨ Listing automatisch erstellen (Google Gemini)"):
     # Sammle Metadaten (Pflichtfelder)
     asin_metadata = st.session_state.get("input_asin_metadata", "").strip()
@@ -2209,9 +3293,20 @@ if st.button("✨ Listing automatisch erstellen (Google Gemini)"):
         if not has_basic_info:
             st.warning("⚠️ Bitte fülle mindestens die Felder 'Produktname', 'Produktspezifikationen' oder 'USPs' aus.")
         else:
-            with st.spinner("🤖 Generiere Listing mit KI..."):
-                prompt = _build_prompt(input_data)
-                result = _call_gemini_and_parse(prompt)
+            prompt = _build_prompt(input_data)
+            st.session_state["single_generation_running"] = True
+            if stream_single:
+                stream_status = st.empty()
+                with stream_status.container():
+                    # Ein Klick auf den Button löst einen Rerun aus, der den laufenden Stream beendet
+                    st.button("⏹️ Generierung abbrechen", key="abort_single_generation")
+                    st.caption("🤖 Generiere Listing mit KI...")
+                result = _call_gemini_and_parse(prompt, force_regenerate=force_regenerate_single, preview=st.empty())
+                stream_status.empty()
+            else:
+                with st.spinner("🤖 Generiere Listing mit KI..."):
+                    result = _call_gemini_and_parse(prompt, force_regenerate=force_regenerate_single)
+            st.session_state.pop("single_generation_running", None)
             if result:
                 # Generiertes Listing in identisches Datenformat bringen
                 product_name_for_listing = input_data["product_name"].strip() or "Generiert aus Kontext"
@@ -2276,16 +3371,54 @@ with col_download:
 
 with col_upload:
     st.markdown("#### ⬆️ Excel-Datei hochladen")
-    uploaded_file = st.file_uploader(
-        "Excel-Datei für KI-Generierung hochladen",
-        type=["xlsx"],
-        help="Lade eine Excel-Datei hoch, die die Produktinformationen für die KI-Generierung enthält"
+    ai_uploaded_files = st.file_uploader(
+        "Dateien für KI-Generierung hochladen (Excel, CSV, TSV oder Parquet)",
+        type=UPLOAD_FILE_TYPES,
+        accept_multiple_files=True,
+        help="Lade eine oder mehrere Dateien mit den Produktinformationen für die KI-Generierung hoch (gleiche Spalten wie die Beispiel-Excel). Bei Excel-Dateien werden alle Tabellenblätter verarbeitet."
+    )
+    
+    force_regenerate_batch = st.checkbox(
+        "🔄 Alle Zeilen neu generieren (Antwort-Cache ignorieren)",
+        value=False,
+        key="force_regenerate_batch",
+        help="Ohne diese Option werden Zeilen mit unveränderten Eingaben aus dem Cache übernommen - nach einem Abbruch oder Fehlern werden so nur die fehlenden Zeilen neu angefragt."
     )
+    response_cache_stats = get_response_cache(_get_engine_identifier(db_engine)).stats
+    if response_cache_stats["hits"] or response_cache_stats["misses"]:
+        st.caption(
+            f"Antwort-Cache: {response_cache_stats['hits']} Treffer · {response_cache_stats['misses']} neu angefragt "
+            f"(Trefferquote {response_cache_stats['hit_rate']:.0%})"
+        )
+    
+    try:
+        unfinished_jobs = get_job_store(_get_engine_identifier(db_engine)).unfinished_jobs()
+    except Exception:
+        unfinished_jobs = []
+    if unfinished_jobs:
+        with st.expander(f"⏸️ Unterbrochene Batch-Jobs ({len(unfinished_jobs)})"):
+            st.caption("Dieselbe(n) Datei(en) erneut hochladen und starten - fertige Zeilen werden übernommen, nur der Rest wird generiert.")
+            for job in unfinished_jobs:
+                failed = f", {job['failed']} fehlgeschlagen" if job["failed"] else ""
+                st.text(f"{job['label'] or job['job_id'][:12]}: {job['done']} von {job['total']} Zeilen fertig{failed} (zuletzt {job['updated_at']})")
     
-    if uploaded_file:
+    if ai_uploaded_files:
         if st.button("🚀 KI-Generierung starten", type="primary", use_container_width=True):
-            with st.spinner("🤖 Verarbeite Excel und generiere Listings..."):
-                generated_listings, errors = process_ai_generation_excel(uploaded_file, db_engine)
+            with st.spinner("🤖 Verarbeite Dateien und generiere Listings..."):
+                generation_progress = st.progress(0.0, text="Bereite Zeilen vor...")
+                
+                def _show_generation_progress(done, total):
+                    generation_progress.progress(done / total, text=f"{done} von {total} Listings generiert")
+                
+                def _show_resumed_job(resumed, total):
+                    st.info(f"⏯️ Job fortgesetzt: {resumed} von {total} Zeilen aus dem letzten Lauf übernommen.")
+                    generation_progress.progress(resumed / total, text=f"{resumed} von {total} Listings generiert")
+                
+                generated_listings, errors = process_ai_generation_excel(
+                    ai_uploaded_files, db_engine, on_progress=_show_generation_progress,
+                    force_regenerate=force_regenerate_batch, on_resume=_show_resumed_job
+                )
+                generation_progress.empty()
                 
                 if generated_listings is None:
                     st.error(f"❌ Fehler beim Verarbeiten der Excel-Datei: {errors}")
@@ -2306,6 +3439,31 @@ with col_upload:
                     else:
                         st.error("❌ Keine Listings konnten generiert werden. Bitte prüfe die Excel-Datei und die Fehlermeldungen.")
 
+# ============ KI-PROTOKOLL: KOSTEN & LATENZ ============
+with st.expander("📈 KI-Protokoll: Kosten & Latenz"):
+    log_days = st.selectbox("Zeitraum", [1, 7, 30, 90], index=1, format_func=lambda d: f"Letzte {d} Tage", key="generation_log_days")
+    try:
+        log_entries = get_generation_log(_get_engine_identifier(db_engine)).entries(days=log_days)
+    except Exception as e:
+        log_entries = []
+        st.warning(f"⚠️ Protokoll konnte nicht geladen werden: {e}")
+    if not log_entries:
+        st.info("Noch keine Gemini-Aufrufe protokolliert.")
+    else:
+        by_model, by_batch = summarize_generation_log(log_entries)
+        api_calls = sum(1 for entry in log_entries if not entry["cached"])
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Aufrufe", len(log_entries))
+        col2.metric("Davon API", api_calls)
+        col3.metric("Cache-Trefferquote", f"{1 - api_calls / len(log_entries):.0%}")
+        col4.metric("Kosten (geschätzt)", f"${by_model['cost_usd'].sum():.2f}" if not by_model.empty else "$0.00")
+        st.markdown("**Je Modell** (Latenz nur echte API-Aufrufe, in ms)")
+        st.dataframe(by_model, use_container_width=True, hide_index=True)
+        if not by_batch.empty:
+            st.markdown("**Je Batch** (inkl. Kürzungsrunden)")
+            st.dataframe(by_batch, use_container_width=True, hide_index=True)
+        st.caption("Kosten nach Listenpreisen (GEMINI_PRICES_PER_MILLION in ai_generation.py) - Richtwert, keine Abrechnung.")
+
 # ================== DATENBANK-FUNKTIONEN ==================
 
 # Datenbankansicht mit Filtern
@@ -2370,17 +3528,82 @@ if db_engine:
         
         # Debug: Zeige Filter-Status und Gesamtzahl
         if db_engine:
-            try:
-                with db_engine.connect() as conn:
-                    total_count_result = conn.execute(text("SELECT COUNT(*) as total FROM listings"))
-                    total_count = total_count_result.fetchone()[0]
-                    
-                    if filters:
-                        st.info(f"🔍 **Aktive Filter:** {len(filters)} Filter gesetzt. **Gesamt in DB:** {total_count} Listings")
-                    else:
-                        st.info(f"📊 **Gesamt in Datenbank:** {total_count} Listings")
-            except Exception as e:
-                st.warning(f"⚠️ Konnte Gesamtzahl nicht ermitteln: {e}")
+            # COUNT(*) mit kurzem Statement-Timeout; bei langsamer DB kommt der letzte bekannte Wert
+            total_count = count_listings(db_engine)
+            if total_count is None:
+                st.warning("⚠️ Konnte Gesamtzahl nicht ermitteln (Datenbank antwortet nicht rechtzeitig).")
+            elif filters:
+                st.info(f"🔍 **Aktive Filter:** {len(filters)} Filter gesetzt. **Gesamt in DB:** {total_count} Listings")
+            else:
+                st.info(f"📊 **Gesamt in Datenbank:** {total_count} Listings")
+        
+        # Komplett-Export direkt aus der Datenbank (ohne Umweg über die Tabelle im Browser)
+        with st.expander("📦 Alle gefilterten Listings exportieren", expanded=False):
+            st.caption("Exportiert alle Listings, die den aktiven Filtern entsprechen, direkt aus der Datenbank – auch bei sehr großen Katalogen.")
+            full_export_layout = st.radio(
+                "Spalten-Layout",
+                options=["internal", "amazon"],
+                format_func=lambda x: "Internes Format (wie Supabase-Upload)" if x == "internal" else "Amazon-Format",
+                horizontal=True,
+                key="full_export_layout"
+            )
+            full_export_format = st.radio(
+                "Dateiformat",
+                options=list(EXPORT_FORMATS),
+                format_func=lambda x: EXPORT_FORMATS[x][2],
+                horizontal=True,
+                key="full_export_format",
+                help="Flat-Files (Tab-getrennt, UTF-8) akzeptiert Seller Central direkt – deutlich schneller und kleiner als Excel, auch für sehr große Kataloge."
+            )
+            full_export_partition = st.multiselect(
+                "Aufteilen nach (ZIP mit einer Datei pro Gruppe)",
+                options=list(PARTITION_FIELDS),
+                format_func=lambda x: PARTITION_FIELDS[x],
+                key="full_export_partition",
+                help="Erzeugt pro Marketplace und/oder Account eine eigene Datei – z.B. für die Auslieferung an einzelne Kunden."
+            )
+            if st.button("📦 Export erstellen", key="btn_full_export"):
+                if get_db_circuit_breaker().is_open:
+                    st.warning("⚠️ Die Datenbank antwortet aktuell nicht zuverlässig. Bitte versuche den Export gleich noch einmal.")
+                else:
+                    export_status = st.empty()
+                    try:
+                        with st.spinner("Exportiere Listings..."):
+                            if full_export_partition:
+                                full_export_file, partition_count, full_export_count = export_partitioned_zip(
+                                    stream_listings_from_db(db_engine, filters if filters else None, partition_by=full_export_partition),
+                                    partition_by=full_export_partition,
+                                    layout=full_export_layout,
+                                    file_format=full_export_format,
+                                    presorted=True,
+                                    executor=get_export_process_pool(),
+                                    on_progress=lambda p, n: export_status.text(f"{p} Dateien / {n} Listings geschrieben...")
+                                )
+                                full_export_ext, full_export_mime = ".zip", "application/zip"
+                            else:
+                                full_export_file, full_export_count = export_listings_file(
+                                    stream_listings_from_db(db_engine, filters if filters else None),
+                                    layout=full_export_layout,
+                                    file_format=full_export_format,
+                                    on_progress=lambda n: export_status.text(f"{n} Listings geschrieben...")
+                                )
+                                full_export_ext, full_export_mime = EXPORT_FORMATS[full_export_format][:2]
+                        export_status.empty()
+                        if full_export_partition:
+                            st.success(f"✅ {full_export_count} Listings in {partition_count} Dateien exportiert")
+                        else:
+                            st.success(f"✅ {full_export_count} Listings exportiert")
+                        st.download_button(
+                            label="📥 Export herunterladen",
+                            data=read_export(full_export_file),
+                            file_name=f"listings_export_{full_export_layout}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{full_export_ext}",
+                            mime=full_export_mime,
+                            on_click="ignore",
+                            key="btn_full_export_download"
+                        )
+                    except SQLAlchemyError as e:
+                        export_status.empty()
+                        st.error(f"❌ Export fehlgeschlagen: {e}")
         
         # Lade gefilterte Daten
         db_df = load_listings_from_db(db_engine, filters if filters else None)
@@ -2390,7 +3613,7 @@ if db_engine:
             
             # Debug: Zeige zusätzliche Info wenn Filter aktiv
             if filters:
-                st.warning(f"⚠️ **Hinweis:** Es werden nur {len(db_df)} Listings angezeigt, da Filter aktiv sind. Gesamt in DB: {total_count if 'total_count' in locals() else 'unbekannt'}")
+                st.warning(f"⚠️ **Hinweis:** Es werden nur {len(db_df)} Listings angezeigt, da Filter aktiv sind. Gesamt in DB: {total_count if locals().get('total_count') is not None else 'unbekannt'}")
             
             # Zeige nur relevante Spalten in der Übersicht
             display_cols = ["asin_ean_sku", "mp", "name", "account", "project", "updated_at"]
@@ -2491,8 +3714,8 @@ if db_engine:
         
         Diese Funktion ist speziell für den reinen Datenbank-Upload gedacht und getrennt vom normalen Bearbeitungs-Workflow.
         
-        **Format der Excel-Datei:**
-        Die Excel-Datei sollte folgende Spalten enthalten:
+        **Format der Datei:**
+        Excel (`.xlsx`), CSV/TSV (Trennzeichen werden automatisch erkannt) oder Parquet. Die Datei sollte folgende Spalten enthalten:
         - **ASIN/EAN/SKU** (oder ähnliche Namen wie "ASIN", "EAN", "SKU") - **Pflichtfeld**
         - **MP** (oder "Marketplace") - **Pflichtfeld** - Der Marktplatz-Code (z.B. DE, FR, UK, IT, ES, etc.)
         - **Name** (oder "Produktname") - Optional: Produktname
@@ -2519,70 +3742,116 @@ if db_engine:
         )
         st.markdown("---")
         
-        supabase_upload_file = st.file_uploader(
-            "📤 Excel-Datei für Supabase-Upload",
-            type=["xlsx"],
-            key="supabase_upload_file",
-            help="Wähle eine Excel-Datei mit deinen Listings aus"
+        supabase_upload_files = st.file_uploader(
+            "📤 Dateien für Supabase-Upload (Excel, CSV, TSV oder Parquet)",
+            type=UPLOAD_FILE_TYPES,
+            accept_multiple_files=True,
+            key="supabase_upload_files",
+            help="Wähle eine oder mehrere Dateien mit deinen Listings aus. Bei Excel-Dateien werden alle Tabellenblätter eingelesen."
+        )
+        
+        supabase_streaming = st.checkbox(
+            "Große Datei direkt importieren (ohne Vorschau, speichersparend)",
+            value=False,
+            key="supabase_streaming_import",
+            help="Die Datei wird in Blöcken gelesen, geprüft und gespeichert, ohne sie komplett in den Speicher zu laden. Fehlerhafte Zeilen werden übersprungen."
         )
         
-        if supabase_upload_file:
+        if supabase_upload_files and supabase_streaming:
+            streaming_overwrite = st.checkbox(
+                "Bestehende Einträge überschreiben",
+                value=False,
+                help="Wenn aktiviert, werden bestehende Listings (gleiche ASIN + MP) aktualisiert. Sonst werden sie übersprungen.",
+                key="overwrite_supabase_streaming"
+            )
+            if st.button("💾 Direkt importieren", key="btn_supabase_streaming", type="primary"):
+                file_estimates = [estimate_upload_rows(f, f.name, all_sheets=True) for f in supabase_upload_files]
+                estimated_rows = None if None in file_estimates else sum(file_estimates)
+                streaming_progress = st.progress(0.0, text="Zähle Kennungen...")
+                
+                def _show_streaming_progress(rows, seconds):
+                    rate = rows / seconds if seconds else 0
+                    text = f"{rows} Zeilen verarbeitet · {rate:,.0f} Zeilen/s"
+                    if estimated_rows and rate:
+                        text += f" · noch ca. {max(estimated_rows - rows, 0) / rate:.0f} s"
+                    streaming_progress.progress(min(rows / estimated_rows, 1.0) if estimated_rows else 0.0, text=text)
+                
+                try:
+                    ingest_stats = ingest_uploads_to_db(
+                        db_engine,
+                        supabase_upload_files,
+                        overwrite=streaming_overwrite,
+                        on_progress=_show_streaming_progress
+                    )
+                    streaming_progress.empty()
+                    st.markdown("### 📊 Upload-Statistik")
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.metric("Gesamt verarbeitet", ingest_stats["rows"])
+                    with col2:
+                        st.metric("✅ Erfolgreich", ingest_stats["success"])
+                    with col3:
+                        st.metric("⏭️ Übersprungen", ingest_stats["skipped"])
+                    with col4:
+                        st.metric("❌ Fehler", ingest_stats["errors"] + ingest_stats["invalid"])
+                    st.caption(f"Dauer: {ingest_stats['seconds']:.1f} s · {ingest_stats['duplicates']} Zeilen mit duplizierter ASIN durchnummeriert")
+                    if ingest_stats["invalid"]:
+                        st.warning(f"⚠️ **{ingest_stats['invalid']}** Zeilen wegen überschrittener Byte-Limits oder fehlender ASIN/MP nicht gespeichert")
+                    if ingest_stats["skipped_parts"]:
+                        st.info("ℹ️ Übersprungen: " + "; ".join(ingest_stats["skipped_parts"]))
+                    if ingest_stats["error_messages"]:
+                        with st.expander("Fehler-Details anzeigen (erste 20)"):
+                            for error in ingest_stats["error_messages"]:
+                                st.text(error)
+                except Exception as e:
+                    streaming_progress.empty()
+                    st.error(f"❌ Import fehlgeschlagen: {str(e)}")
+        
+        # Einlesen im Hintergrund - bis die Datei fertig ist, wird nur der Fortschritt angezeigt
+        supabase_loaded = None
+        if supabase_upload_files and not supabase_streaming:
+            # Alle Dateien und Blätter parallel einlesen und über das gemeinsame Schema zusammenführen
+            # (Aliase, Duplikate füllen leere Werte auf)
+            supabase_loaded = load_upload_frame_async(supabase_upload_files, LISTING_SCHEMA, required=["asin_ean_sku", "mp"])
+        
+        if supabase_loaded is not None:
             try:
-                upload_df = pd.read_excel(supabase_upload_file)
+                upload_df, upload_column_report = supabase_loaded
                 
                 # Zeige Spalten-Info
                 st.markdown("**Erkannte Spalten:**")
-                st.code(", ".join(upload_df.columns.tolist()))
+                st.code(", ".join(upload_column_report["source_columns"]))
+                render_upload_parts(upload_column_report)
                 
-                # Spaltennamen normalisieren (flexibler) - vermeide Duplikate
-                column_mapping = {}
-                used_target_names = set()  # Verhindere doppelte Zielnamen
-                
-                for col in upload_df.columns:
-                    col_lower = str(col).strip().lower()
-                    target_name = None
-                    
-                    # Prüfe jeden Zielnamen und verwende nur den ersten Treffer
-                    if "asin" in col_lower or "ean" in col_lower or "sku" in col_lower:
-                        target_name = "asin_ean_sku"
-                    elif col_lower == "mp" or col_lower == "marketplace":
-                        target_name = "mp"
-                    elif col_lower == "name" or col_lower == "produktname":
-                        target_name = "name"
-                    elif col_lower == "title" or col_lower == "titel":
-                        target_name = "Titel"  # Wichtig: "Titel" mit großem T für deutsche Bearbeitungsmaske
-                    elif col_lower == "account":
-                        target_name = "account"
-                    elif col_lower == "project" or col_lower == "projekt":
-                        target_name = "project"
-                    elif col_lower == "image" or col_lower == "bild":
-                        target_name = "image"
-                    
-                    # Nur mappen, wenn Zielname noch nicht verwendet wurde
-                    if target_name and target_name not in used_target_names:
-                        column_mapping[col] = target_name
-                        used_target_names.add(target_name)
-                
-                upload_df = upload_df.rename(columns=column_mapping)
+                if upload_column_report["duplicates"]:
+                    st.info("ℹ️ Mehrfach zugeordnete Spalten (füllen leere Werte der ersten Spalte auf): " + "; ".join(
+                        f"{target} ← {', '.join(map(str, cols))}" for target, cols in upload_column_report["duplicates"].items()
+                    ))
+                if upload_column_report["unmapped"]:
+                    st.caption("Nicht zugeordnete Spalten (werden ignoriert): " + ", ".join(map(str, upload_column_report["unmapped"])))
                 
                 # Prüfe ob erforderliche Spalten vorhanden
-                has_required = "asin_ean_sku" in upload_df.columns and "mp" in upload_df.columns
+                has_required = not upload_column_report["missing"]
                 
                 if not has_required:
-                    st.error("❌ Die Datei muss Spalten für ASIN/EAN/SKU und MP enthalten!")
+                    st.error("❌ Mindestens ein Tabellenblatt muss Spalten für ASIN/EAN/SKU und MP enthalten!")
                     st.info("💡 Gefundene Spaltennamen werden automatisch erkannt. Falls die Erkennung nicht funktioniert, benenne die Spalten um.")
                 else:
                     st.success(f"✅ {len(upload_df)} Zeilen erfolgreich geladen")
                     
                     # Zeige Vorschau
                     st.markdown("**Vorschau (erste 5 Zeilen):**")
-                    preview_cols = ["asin_ean_sku", "mp", "name", "account", "project"]
+                    preview_cols = ["asin_ean_sku", "mp", "name", "account", "project", "source_file", "source_sheet"]
                     available_preview_cols = [c for c in preview_cols if c in upload_df.columns]
                     if available_preview_cols:
                         st.dataframe(upload_df[available_preview_cols].head(), use_container_width=True)
                     else:
                         st.dataframe(upload_df.head(), use_container_width=True)
                     
+                    # Byte-Limits und Pflichtfelder für alle Zeilen prüfen, bevor etwas gespeichert wird
+                    validation_errors, validation_summary = validate_listing_frame(upload_df)
+                    render_validation_summary(validation_errors, validation_summary)
+                    
                     # Upload-Optionen
                     col1, col2 = st.columns(2)
                     with col1:
@@ -2592,6 +3861,13 @@ if db_engine:
                             help="Wenn aktiviert, werden bestehende Listings (gleiche ASIN + MP) aktualisiert. Sonst werden sie übersprungen.",
                             key="overwrite_supabase"
                         )
+                        skip_invalid_supabase = st.checkbox(
+                            "Fehlerhafte Zeilen nicht speichern",
+                            value=True,
+                            help="Zeilen mit überschrittenem Byte-Limit oder fehlender ASIN/MP werden nicht in die Datenbank geschrieben.",
+                            key="skip_invalid_supabase",
+                            disabled=not validation_summary["invalid_rows"]
+                        )
                     
                     with col2:
                         show_details_supabase = st.checkbox(
@@ -2602,8 +3878,6 @@ if db_engine:
                     
                     if st.button("💾 In Supabase speichern", key="btn_supabase_save", type="primary"):
                         # Bereite Daten für Batch-Upload vor
-                        listings_to_save = []
-                        
                         if show_details_supabase:
                             progress_bar = st.progress(0)
                             status_text = st.empty()
@@ -2612,68 +3886,38 @@ if db_engine:
                             progress_bar = None
                             status_text = None
                         
-                        # Erkenne und nummeriere ASIN-Duplikate
-                        asin_counter = {}  # Zählt Vorkommen jeder ASIN
-                        asin_occurrence = {}  # Zählt aktuelle Nummer für jede ASIN
-                        
-                        # Erste Durchlauf: Zähle Vorkommen jeder ASIN
-                        for idx, row in upload_df.iterrows():
-                            asin = str(row.get("asin_ean_sku", "")).strip()
-                            if asin:
-                                asin_counter[asin] = asin_counter.get(asin, 0) + 1
+                        # Fehlerhafte Zeilen (siehe Validierung) vorab aussortieren
+                        save_df = upload_df
+                        invalid_skipped = 0
+                        if skip_invalid_supabase and validation_summary["invalid_rows"]:
+                            save_df = upload_df.drop(index=validation_summary["invalid_index"])
+                            invalid_skipped = len(upload_df) - len(save_df)
                         
-                        # Zweiter Durchlauf: Nummeriere Duplikate
-                        duplicate_count = 0
-                        for asin, count in asin_counter.items():
-                            if count > 1:
-                                duplicate_count += count
+                        # Duplikate nummerieren und Existenz aller Paare in einem Schritt prüfen
+                        try:
+                            write_plan, duplicate_count = plan_listing_writes(
+                                save_df,
+                                lambda pairs: fetch_existing_listing_ids(db_engine, pairs),
+                                overwrite_existing_supabase
+                            )
+                        except Exception as e:
+                            st.error(f"❌ Fehler beim Abgleich mit der Datenbank: {str(e)}")
+                            st.stop()
                         
                         if duplicate_count > 0:
                             st.info(f"ℹ️ **{duplicate_count}** Zeilen mit duplizierten ASIN-Werten gefunden. Diese werden automatisch durchnummeriert (z.B. 'ASIN-1', 'ASIN-2').")
                         
-                        # Sammle alle Listings
-                        for idx, row in upload_df.iterrows():
-                            if show_details_supabase and progress_bar:
-                                progress_bar.progress((idx + 1) / len(upload_df) * 0.5)  # 50% für Vorbereitung
-                            
-                            listing_data = {
-                                "Product": str(row.get("Product", "")),
-                                "Titel": str(row.get("Titel", "")),
-                                "Bullet1": str(row.get("Bullet1", "")),
-                                "Bullet2": str(row.get("Bullet2", "")),
-                                "Bullet3": str(row.get("Bullet3", "")),
-                                "Bullet4": str(row.get("Bullet4", "")),
-                                "Bullet5": str(row.get("Bullet5", "")),
-                                "Description": str(row.get("Description", "")),
-                                "SearchTerms": str(row.get("SearchTerms", "")),
-                                "Keywords": str(row.get("Keywords", "")),
-                                "name": str(row.get("name", "")),
-                                "image": str(row.get("image", "")) if "image" in row and pd.notna(row.get("image")) else None
-                            }
-                            
-                            asin = str(row.get("asin_ean_sku", "")).strip()
-                            mp = str(row.get("mp", "")).strip()
-                            account = str(row.get("account", "")).strip() if "account" in row and pd.notna(row.get("account")) else None
-                            project = str(row.get("project", "")).strip() if "project" in row and pd.notna(row.get("project")) else None
-                            
-                            if asin and mp:
-                                # Wenn diese ASIN mehrfach vorkommt, nummeriere sie
-                                if asin_counter.get(asin, 0) > 1:
-                                    asin_occurrence[asin] = asin_occurrence.get(asin, 0) + 1
-                                    # Füge Nummer hinzu: Original-ASIN + "-" + Nummer
-                                    numbered_asin = f"{asin}-{asin_occurrence[asin]}"
-                                else:
-                                    numbered_asin = asin
-                                
-                                listings_to_save.append({
-                                    "data": listing_data,
-                                    "asin": numbered_asin,
-                                    "mp": mp,
-                                    "account": account,
-                                    "project": project,
-                                    "check_existing": True,
-                                    "overwrite": overwrite_existing_supabase
-                                })
+                        plan_counts = write_plan["action"].value_counts()
+                        if show_details_supabase:
+                            st.caption(
+                                f"Plan: {plan_counts.get('insert', 0)} neu · {plan_counts.get('update', 0)} aktualisieren · "
+                                f"{plan_counts.get('skip', 0)} überspringen · {plan_counts.get('error', 0)} ohne ASIN/MP"
+                            )
+                        
+                        listings_to_save = plan_to_save_records(save_df, write_plan)
+                        
+                        if show_details_supabase and progress_bar:
+                            progress_bar.progress(0.5)  # 50% für Vorbereitung
                         
                         # Batch-Upload durchführen
                         if show_details_supabase and status_text:
@@ -2684,6 +3928,9 @@ if db_engine:
                             listings_to_save, 
                             batch_size=100
                         )
+                        if invalid_skipped:
+                            error_count += invalid_skipped
+                            errors.insert(0, f"{invalid_skipped} Zeilen wegen Validierungsfehlern nicht gespeichert (siehe Fehler-Details oben)")
                         
                         if show_details_supabase and progress_bar:
                             progress_bar.progress(1.0)  # 100% fertig
@@ -2707,12 +3954,9 @@ if db_engine:
                         
                         # Debug: Prüfe tatsächliche Anzahl in DB nach Upload
                         if db_engine:
-                            try:
-                                with db_engine.connect() as conn:
-                                    count_after = conn.execute(text("SELECT COUNT(*) FROM listings")).fetchone()[0]
-                                    st.info(f"📊 **Aktuelle Anzahl in Datenbank nach Upload:** {count_after} Listings")
-                            except Exception:
-                                pass
+                            count_after = count_listings(db_engine)
+                            if count_after is not None:
+                                st.info(f"📊 **Aktuelle Anzahl in Datenbank nach Upload:** {count_after} Listings")
                         
                         if success_count > 0:
                             st.success(f"✅ **{success_count}** Listings erfolgreich in Supabase gespeichert!")
@@ -2766,7 +4010,7 @@ st.download_button(
 )
 st.markdown("---")
 
-uploaded_file = st.file_uploader("📤 Excel-Datei mit Listings hochladen", type=["xlsx"])
+uploaded_file = st.file_uploader("📤 Datei mit Listings hochladen (Excel, CSV, TSV oder Parquet)", type=UPLOAD_FILE_TYPES)
 
 # Session State für Upload-Modus
 if "upload_mode" not in st.session_state:
@@ -3022,11 +4266,7 @@ def render_listing(row, i, has_product, listing_id=None, skip_expander=False):
                 return value
 
             listing_data = {}
-            limits = {
-                "Titel": 150, "Bullet1": 200, "Bullet2": 200, "Bullet3": 200,
-                "Bullet4": 200, "Bullet5": 200, "Description": 2000, "SearchTerms": 250
-            }
-            for fname, lim in limits.items():
+            for fname, lim in FIELD_BYTE_LIMITS.items():
                 listing_data[fname] = render_field(fname, lim)
             listing_data["Keywords"] = keywords_input
             listing_data["Product"] = st.session_state.get(f"product_{key_suffix}", default_name)
@@ -3063,55 +4303,29 @@ def render_listing(row, i, has_product, listing_id=None, skip_expander=False):
 
 # ---- 1) Upload mit Vorschau und Auswahl ----
 if uploaded_file:
-    # Reset wenn neue Datei hochgeladen wird
-    if st.session_state.get("upload_file_key") != uploaded_file.name:
+    # Reset wenn eine Datei mit anderem Inhalt hochgeladen wird (Name allein reicht nicht)
+    upload_content_hash = file_sha256(uploaded_file)
+    if st.session_state.get("upload_file_key") != upload_content_hash:
         st.session_state["uploaded_df"] = None
         st.session_state["upload_mode"] = "preview"
         st.session_state["show_edit_interface"] = False
     
-    # Lade DataFrame nur einmal
+    # Lade DataFrame nur einmal (im Hintergrund, bis dahin wird der Fortschritt angezeigt)
     if st.session_state["uploaded_df"] is None:
         try:
-            df = pd.read_excel(uploaded_file)
-            has_product = "Product" in df.columns
-            expected_cols = ["Titel","Bullet1","Bullet2","Bullet3","Bullet4","Bullet5","Description","SearchTerms","Keywords"]
-            cols_lower = [str(c).strip().lower() for c in df.columns]
-
-            # Normalisiere Spaltennamen - mappe "Title" auf "Titel" und Metadaten-Spalten
-            column_normalization = {}
-            for col in df.columns:
-                col_lower = str(col).strip().lower()
-                if col_lower == "title" and col != "Titel":  # Nur wenn noch nicht "Titel"
-                    column_normalization[col] = "Titel"
-                # Normalisiere Metadaten-Spalten
-                elif ("asin" in col_lower or "ean" in col_lower or "sku" in col_lower) and col != "asin_ean_sku":
-                    column_normalization[col] = "asin_ean_sku"
-                elif (col_lower == "mp" or col_lower == "marketplace") and col != "mp":
-                    column_normalization[col] = "mp"
-                elif col_lower == "account" and col != "account":
-                    column_normalization[col] = "account"
-                elif (col_lower == "project" or col_lower == "projekt") and col != "project":
-                    column_normalization[col] = "project"
-            
-            if column_normalization:
-                df = df.rename(columns=column_normalization)
-
-            if ("keywords" in cols_lower) and not any(
-                c in cols_lower for c in ["titel","bullet1","bullet2","bullet3","bullet4","bullet5","description","searchterms","search terms"]
-            ):
-                df = df.rename(columns={c: ("Keywords" if str(c).strip().lower() == "keywords" else c) for c in df.columns})
-                df["Keywords"] = df["Keywords"].astype(str).fillna("")
-                for col in ["Titel","Bullet1","Bullet2","Bullet3","Bullet4","Bullet5","Description","SearchTerms"]:
-                    if col not in df.columns:
-                        df[col] = ""
-                order = (["Product"] if "Product" in df.columns else []) + expected_cols
-                df = df[order]
-                has_product = "Product" in df.columns
-            
-            st.session_state["uploaded_df"] = df
-            st.session_state["upload_file_key"] = uploaded_file.name
-            st.session_state["upload_mode"] = "preview"
-            st.session_state["has_product"] = has_product
+            # Normalisiere Spaltennamen über das gemeinsame Schema ("Title" -> "Titel", Metadaten-Spalten usw.).
+            # Fehlende Inhaltsspalten werden leer ergänzt, z.B. wenn nur eine Keyword-Liste hochgeladen wird.
+            # Identische Dateien kommen aus dem prozessweiten Cache und werden nicht erneut eingelesen.
+            loaded_upload = load_upload_frame_async(uploaded_file, LISTING_SCHEMA)
+            if loaded_upload is not None:
+                df, upload_column_report = loaded_upload
+                has_product = "Product" in upload_column_report["found"]
+                st.session_state["upload_column_report"] = upload_column_report
+                
+                st.session_state["uploaded_df"] = df
+                st.session_state["upload_file_key"] = upload_content_hash
+                st.session_state["upload_mode"] = "preview"
+                st.session_state["has_product"] = has_product
         except Exception as e:
             st.error(f"Fehler beim Laden der Datei: {e}")
             st.session_state["uploaded_df"] = None
@@ -3129,25 +4343,36 @@ if uploaded_file:
         col1, col2, col3 = st.columns(3)
         with col1:
             st.metric("Anzahl Listings", len(df))
+        upload_column_report = st.session_state.get("upload_column_report") or {"mapping": {}, "found": [], "unmapped": [], "duplicates": {}}
         with col2:
-            st.metric("Spalten", len(df.columns))
+            st.metric("Erkannte Spalten", len(upload_column_report["found"]))
         with col3:
-            if "Product" in df.columns:
-                product_count = df["Product"].notna().sum()
+            if has_product:
+                product_count = int((df["Product"] != "").sum())
                 st.metric("Mit Produktname", product_count)
         
+        # Byte-Limits für alle Zeilen prüfen (ASIN/MP sind zum Bearbeiten nicht erforderlich)
+        validation_errors, validation_summary = validate_listing_frame(df, required=())
+        render_validation_summary(validation_errors, validation_summary)
+        
         # Zeige erste Zeilen
         st.subheader("Vorschau (erste 5 Zeilen)")
-        preview_cols = ["Product"] if "Product" in df.columns else []
+        preview_cols = ["Product"] if has_product else []
         preview_cols.extend([c for c in ["Titel", "Bullet1", "Bullet2"] if c in df.columns])
         if preview_cols:
             st.dataframe(df[preview_cols].head(), use_container_width=True)
         else:
             st.dataframe(df.head(), use_container_width=True)
         
-        # Zeige alle Spalten
+        # Zeige alle Spalten und deren Zuordnung
         with st.expander("Alle Spalten anzeigen"):
-            st.code(", ".join(df.columns.tolist()))
+            st.code("\n".join(f"{src} → {target}" for src, target in upload_column_report["mapping"].items()))
+            if upload_column_report["duplicates"]:
+                st.info("ℹ️ Mehrfach zugeordnete Spalten (füllen leere Werte der ersten Spalte auf): " + "; ".join(
+                    f"{target} ← {', '.join(map(str, cols))}" for target, cols in upload_column_report["duplicates"].items()
+                ))
+            if upload_column_report["unmapped"]:
+                st.caption("Nicht zugeordnete Spalten: " + ", ".join(map(str, upload_column_report["unmapped"])))
         
         # Auswahl: Bearbeiten oder direkt speichern
         st.markdown("---")
@@ -3189,11 +4414,8 @@ if uploaded_file:
                     key="show_details_direct"
                 )
             
-            # Spalten-Mapping für Metadaten
-            asin_cols = [c for c in df.columns if "asin" in c.lower() or "ean" in c.lower() or "sku" in c.lower()]
-            mp_cols = [c for c in df.columns if c.upper() == "MP" or "marketplace" in c.lower()]
-            
-            if not asin_cols or not mp_cols:
+            # Metadaten-Spalten wurden beim Laden bereits auf asin_ean_sku / mp normalisiert
+            if "asin_ean_sku" not in upload_column_report["found"] or "mp" not in upload_column_report["found"]:
                 st.warning("⚠️ Die Datei muss Spalten für ASIN/EAN/SKU und MP enthalten, um direkt zu speichern.")
                 st.info("💡 Alternativ kannst du die Listings bearbeiten und danach speichern.")
             else:
@@ -3206,73 +4428,37 @@ if uploaded_file:
                         progress_bar = st.progress(0)
                         status_text = st.empty()
                     
-                    # Erkenne und nummeriere ASIN-Duplikate
-                    asin_counter = {}  # Zählt Vorkommen jeder ASIN
-                    asin_occurrence = {}  # Zählt aktuelle Nummer für jede ASIN
-                    
-                    # Erste Durchlauf: Zähle Vorkommen jeder ASIN
-                    for idx, row in df.iterrows():
-                        asin = str(row[asin_cols[0]]).strip() if pd.notna(row[asin_cols[0]]) else ""
-                        if asin:
-                            asin_counter[asin] = asin_counter.get(asin, 0) + 1
+                    if show_details_direct and status_text:
+                        status_text.text("Bereite Daten vor...")
+                    if show_details_direct and progress_bar:
+                        progress_bar.progress(0.1)
                     
-                    # Zweiter Durchlauf: Nummeriere Duplikate
-                    duplicate_count = 0
-                    for asin, count in asin_counter.items():
-                        if count > 1:
-                            duplicate_count += count
+                    # Duplikate nummerieren und Existenz aller Paare in einem Schritt prüfen
+                    try:
+                        write_plan, duplicate_count = plan_listing_writes(
+                            df,
+                            lambda pairs: fetch_existing_listing_ids(db_engine, pairs),
+                            overwrite_direct
+                        )
+                    except Exception as e:
+                        st.error(f"❌ Fehler beim Abgleich mit der Datenbank: {str(e)}")
+                        st.stop()
                     
                     if duplicate_count > 0:
                         st.info(f"ℹ️ **{duplicate_count}** Zeilen mit duplizierten ASIN-Werten gefunden. Diese werden automatisch durchnummeriert (z.B. 'ASIN-1', 'ASIN-2').")
                     
+                    plan_counts = write_plan["action"].value_counts()
+                    if show_details_direct:
+                        st.caption(
+                            f"Plan: {plan_counts.get('insert', 0)} neu · {plan_counts.get('update', 0)} aktualisieren · "
+                            f"{plan_counts.get('skip', 0)} überspringen · {plan_counts.get('error', 0)} ohne ASIN/MP"
+                        )
+                    
                     # Bereite Daten für Batch-Upload vor
-                    listings_to_save = []
+                    listings_to_save = plan_to_save_records(df, write_plan)
                     
-                    if show_details_direct and status_text:
-                        status_text.text("Bereite Daten vor...")
                     if show_details_direct and progress_bar:
-                        progress_bar.progress(0.1)
-                    
-                    for idx, row in df.iterrows():
-                        if show_details_direct and progress_bar:
-                            progress_bar.progress((idx + 1) / len(df) * 0.5)  # 50% für Vorbereitung
-                        
-                        listing_data = {
-                            "Product": str(row.get("Product", "")),
-                            "Titel": str(row.get("Titel", "")),
-                            "Bullet1": str(row.get("Bullet1", "")),
-                            "Bullet2": str(row.get("Bullet2", "")),
-                            "Bullet3": str(row.get("Bullet3", "")),
-                            "Bullet4": str(row.get("Bullet4", "")),
-                            "Bullet5": str(row.get("Bullet5", "")),
-                            "Description": str(row.get("Description", "")),
-                            "SearchTerms": str(row.get("SearchTerms", "")),
-                            "Keywords": str(row.get("Keywords", ""))
-                        }
-                        
-                        asin = str(row[asin_cols[0]]).strip() if pd.notna(row[asin_cols[0]]) else ""
-                        mp = str(row[mp_cols[0]]).strip() if pd.notna(row[mp_cols[0]]) else ""
-                        account = str(row.get("Account", "")).strip() if "Account" in row and pd.notna(row.get("Account")) else None
-                        project = str(row.get("Project", "")).strip() if "Project" in row and pd.notna(row.get("Project")) else None
-                        
-                        if asin and mp:
-                            # Wenn diese ASIN mehrfach vorkommt, nummeriere sie
-                            if asin_counter.get(asin, 0) > 1:
-                                asin_occurrence[asin] = asin_occurrence.get(asin, 0) + 1
-                                # Füge Nummer hinzu: Original-ASIN + "-" + Nummer
-                                numbered_asin = f"{asin}-{asin_occurrence[asin]}"
-                            else:
-                                numbered_asin = asin
-                            
-                            listings_to_save.append({
-                                "data": listing_data,
-                                "asin": numbered_asin,
-                                "mp": mp,
-                                "account": account,
-                                "project": project,
-                                "check_existing": True,
-                                "overwrite": overwrite_direct
-                            })
+                        progress_bar.progress(0.5)  # 50% für Vorbereitung
                     
                     # Batch-Upload durchführen
                     if show_details_direct and status_text:
@@ -3308,12 +4494,9 @@ if uploaded_file:
                     
                     # Debug: Prüfe tatsächliche Anzahl in DB nach Upload
                     if db_engine:
-                        try:
-                            with db_engine.connect() as conn:
-                                count_after = conn.execute(text("SELECT COUNT(*) FROM listings")).fetchone()[0]
-                                st.info(f"📊 **Aktuelle Anzahl in Datenbank nach Upload:** {count_after} Listings")
-                        except Exception:
-                            pass
+                        count_after = count_listings(db_engine)
+                        if count_after is not None:
+                            st.info(f"📊 **Aktuelle Anzahl in Datenbank nach Upload:** {count_after} Listings")
                     
                     if success_count > 0:
                         st.success(f"✅ **{success_count}** Listings erfolgreich gespeichert!")
@@ -3332,7 +4515,7 @@ if uploaded_file:
         st.header("✏️ Listings bearbeiten")
         st.info(f"📊 Bearbeite {len(df)} Listings. Verwende die Expander zum Ein- und Ausklappen.")
         
-        for i, row in df.iterrows():
+        for i, row in zip(df.index, frame_to_listing_records(df)):
             listing_data = render_listing(row, i, has_product)
             updated_rows_all.append(listing_data)
 
@@ -3653,15 +4836,9 @@ if "db_listings_for_edit" in st.session_state and len(st.session_state["db_listi
             export_rows.append(export_row)
         
         if export_rows:
-            export_df = pd.DataFrame(export_rows)
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                export_df.to_excel(writer, index=False)
-            output.seek(0)
-            
             st.download_button(
                 label="📥 Bearbeitete Listings als Excel herunterladen",
-                data=output,
+                data=lazy_export("table", export_rows),
                 file_name=f"bearbeitete_listings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 help="Lade alle bearbeiteten Listings als Excel-Datei herunter"
@@ -3671,23 +4848,16 @@ if "db_listings_for_edit" in st.session_state and len(st.session_state["db_listi
 if updated_rows_all:
     st.markdown("---")
     st.header("📥 Download & Speichern")
-    result_df = pd.DataFrame(updated_rows_all)
-    if "Product" not in result_df.columns:
-        result_df["Product"] = ""
-    cols = ["Product"] + [c for c in result_df.columns if c != "Product"]
-    result_df = result_df[cols]
+    # Spaltenreihenfolge wie bei pd.DataFrame(updated_rows_all), "Product" zuerst
+    result_columns = ["Product"] + [c for c in dict.fromkeys(k for row in updated_rows_all for k in row) if c != "Product"]
 
     col1, col2 = st.columns([1, 1])
     
     with col1:
         st.subheader("📥 Excel herunterladen")
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            result_df.to_excel(writer, index=False)
-        output.seek(0)
         st.download_button(
             label="📥 Excel herunterladen",
-            data=output,
+            data=lazy_export("table", updated_rows_all, result_columns),
             file_name="updated_listings.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -3708,116 +4878,41 @@ if updated_rows_all:
             
             if st.button("💾 Alle Listings in Datenbank speichern", key="btn_save_all"):
                 # Metadaten werden aus den einzelnen listing_data Objekten gelesen
-                # Erkenne und nummeriere ASIN-Duplikate
-                asin_counter = {}  # Zählt Vorkommen jeder ASIN
-                asin_occurrence = {}  # Zählt aktuelle Nummer für jede ASIN
-                
-                # Erste Durchlauf: Zähle Vorkommen jeder ASIN aus updated_rows_all
-                for listing_data in updated_rows_all:
-                    asin = str(listing_data.get("asin_ean_sku", "")).strip()
-                    if not asin:
-                        # Falls keine ASIN, verwende Product-Name
-                        asin = str(listing_data.get("Product", "")).strip()
-                    if asin:
-                        asin_counter[asin] = asin_counter.get(asin, 0) + 1
+                save_df, _ = normalize_listing_frame(pd.DataFrame(updated_rows_all))
+                # Falls keine ASIN, verwende Product-Name
+                save_df["asin_ean_sku"] = save_df["asin_ean_sku"].mask(save_df["asin_ean_sku"] == "", save_df["Product"])
                 
-                # Zweiter Durchlauf: Nummeriere Duplikate
-                duplicate_count = 0
-                for asin, count in asin_counter.items():
-                    if count > 1:
-                        duplicate_count += count
+                # Duplikate nummerieren; existiert die Original-ASIN bereits, wird sie (bei Überschreiben) aktualisiert
+                try:
+                    write_plan, duplicate_count = plan_listing_writes(
+                        save_df,
+                        lambda pairs: fetch_existing_listing_ids(db_engine, pairs),
+                        overwrite_existing,
+                        prefer_existing_original=True
+                    )
+                except Exception as e:
+                    st.error(f"❌ Fehler beim Abgleich mit der Datenbank: {str(e)}")
+                    st.stop()
                 
                 if duplicate_count > 0:
                     st.info(f"ℹ️ **{duplicate_count}** Zeilen mit duplizierten ASIN-Werten gefunden. Diese werden automatisch durchnummeriert (z.B. 'ASIN-1', 'ASIN-2').")
                 
-                success_count = 0
-                error_count = 0
-                skipped_count = 0
-                
-                for listing_data in updated_rows_all:
-                    asin = str(listing_data.get("asin_ean_sku", "")).strip()
-                    if not asin:
-                        # Falls keine ASIN, verwende Product-Name
-                        asin = str(listing_data.get("Product", "")).strip()
-                    mp = str(listing_data.get("mp", "")).strip()
-                    # Account und Project korrekt extrahieren (kann None sein)
-                    account_value = listing_data.get("account", "")
-                    account = str(account_value).strip() if account_value else None
-                    project_value = listing_data.get("project", "")
-                    project = str(project_value).strip() if project_value else None
-                    
-                    if asin and mp:
-                        # Prüfe ob Eintrag bereits in Datenbank existiert
-                        check_sql = text("SELECT id FROM listings WHERE asin_ean_sku = :asin AND mp = :mp")
-                        existing_in_db = None
-                        try:
-                            with db_engine.connect() as conn:
-                                result = conn.execute(check_sql, {"asin": asin, "mp": mp}).fetchone()
-                                if result:
-                                    existing_in_db = result[0]
-                        except Exception:
-                            pass
-                        
-                        # Wenn Eintrag existiert und überschreiben nicht aktiviert ist, überspringe
-                        if existing_in_db and not overwrite_existing:
-                            skipped_count += 1
-                            continue
-                        
-                        # Bestimme finale ASIN (nummeriert nur für Duplikate innerhalb des Uploads, nicht für DB-Einträge)
-                        final_asin = asin
-                        if existing_in_db and overwrite_existing:
-                            # Wenn überschreiben aktiviert ist, verwende die ursprüngliche ASIN (nicht nummeriert)
-                            final_asin = asin
-                        elif asin_counter.get(asin, 0) > 1:
-                            # Nur für Duplikate innerhalb des aktuellen Uploads nummerieren
-                            asin_occurrence[asin] = asin_occurrence.get(asin, 0) + 1
-                            # Prüfe ob die nummerierte ASIN bereits in DB existiert
-                            numbered_asin = f"{asin}-{asin_occurrence[asin]}"
-                            check_numbered_sql = text("SELECT id FROM listings WHERE asin_ean_sku = :asin AND mp = :mp")
-                            existing_numbered = None
-                            try:
-                                with db_engine.connect() as conn:
-                                    result = conn.execute(check_numbered_sql, {"asin": numbered_asin, "mp": mp}).fetchone()
-                                    if result:
-                                        existing_numbered = result[0]
-                            except Exception:
-                                pass
-                            
-                            # Wenn nummerierte ASIN existiert und überschreiben nicht aktiviert, überspringe
-                            if existing_numbered and not overwrite_existing:
-                                skipped_count += 1
-                                continue
-                            
-                            final_asin = numbered_asin
-                        
-                        # Erstelle listing_data für save_listing_to_db (ohne Metadaten)
-                        listing_data_for_db = {
-                            "Product": str(listing_data.get("Product", "")),
-                            "Titel": str(listing_data.get("Titel", "")),
-                            "Bullet1": str(listing_data.get("Bullet1", "")),
-                            "Bullet2": str(listing_data.get("Bullet2", "")),
-                            "Bullet3": str(listing_data.get("Bullet3", "")),
-                            "Bullet4": str(listing_data.get("Bullet4", "")),
-                            "Bullet5": str(listing_data.get("Bullet5", "")),
-                            "Description": str(listing_data.get("Description", "")),
-                            "SearchTerms": str(listing_data.get("SearchTerms", "")),
-                            "Keywords": str(listing_data.get("Keywords", "")),
-                            "comments": listing_data.get("comments")  # Kommentare hinzufügen
-                        }
-                        
-                        if save_listing_to_db(db_engine, listing_data_for_db, final_asin, mp, account, project):
-                            success_count += 1
-                        else:
-                            error_count += 1
-                    else:
-                        error_count += 1
+                success_count, error_count, skipped_count, save_errors = batch_save_listings_to_db(
+                    db_engine,
+                    plan_to_save_records(save_df, write_plan),
+                    batch_size=100
+                )
                 
                 if success_count > 0:
                     st.success(f"✅ {success_count} Listings erfolgreich gespeichert!")
                 if skipped_count > 0:
                     st.info(f"⏭️ {skipped_count} Listings übersprungen (bereits vorhanden - gleiche ASIN + MP Kombination)")
                 if error_count > 0:
-                    st.warning(f"⚠️ {error_count} Listings konnten nicht gespeichert werden (fehlende ASIN/MP)")
+                    st.warning(f"⚠️ {error_count} Listings konnten nicht gespeichert werden")
+                if save_errors:
+                    with st.expander("Fehler-Details anzeigen" if len(save_errors) <= 20 else "Fehler-Details anzeigen (erste 20)"):
+                        for error in save_errors[:20]:
+                            st.text(error)
         else:
             st.info("💡 Datenbankverbindung nicht verfügbar. Setze SUPABASE_DB_PASSWORD Umgebungsvariable.")
 
@@ -3845,6 +4940,7 @@ if st.session_state.get("db_listings_edited"):
         combined_listing["mp"] = mp
         combined_listing["asin_ean_sku"] = original_listing.get("asin_ean_sku", "")
         combined_listing["image"] = original_listing.get("image", "")
+        combined_listing["account"] = original_listing.get("account", "")
         all_listings_for_export.append(combined_listing)
 
 # Bearbeitete Excel-Listings (updated_rows_all wird weiter oben definiert)
@@ -3857,62 +4953,33 @@ if 'updated_rows_all' in locals() or 'updated_rows_all' in globals():
         pass
 
 if all_listings_for_export:
-    export_data = []
-    for listing in all_listings_for_export:
-        export_row = {
-            "Marketplace": str(listing.get("mp", "")).strip(),
-            "ASIN": str(listing.get("asin_ean_sku", "")).strip(),
-            "Product Title": str(listing.get("Titel", "")).strip(),
-            "Description": str(listing.get("Description", "")).strip(),
-            "Bullet 1": str(listing.get("Bullet1", "")).strip(),
-            "Bullet 2": str(listing.get("Bullet2", "")).strip(),
-            "Bullet 3": str(listing.get("Bullet3", "")).strip(),
-            "Bullet 4": str(listing.get("Bullet4", "")).strip(),
-            "Bullet 5": str(listing.get("Bullet5", "")).strip(),
-            "Bullet 6": "",
-            "Bullet 7": "",
-            "Bullet 8": "",
-            "Bullet 9": "",
-            "Generic Keywords": str(listing.get("SearchTerms", "")).strip(),  # SearchTerms = Generic Keywords
-            "SKU": str(listing.get("asin_ean_sku", "")).strip(),  # SKU = ASIN
-            "Brand Story": "",
-            "Variation ASIN": "",
-            "image": str(listing.get("image", "")).strip() if listing.get("image") else "",
-            "image1": "",
-            "image2": "",
-            "image3": "",
-            "image4": "",
-            "image5": "",
-            "image6": "",
-            "image7": "",
-            "image8": "",
-            "image9": "",
-            "image10": "",
-            "image11": "",
-            "image12": "",
-            "image13": "",
-            "image14": "",
-            "Minimum Advertised Price": ""
-        }
-        export_data.append(export_row)
-    
-    if export_data:
-        export_df = pd.DataFrame(export_data)
-        output_amazon = BytesIO()
-        with pd.ExcelWriter(output_amazon, engine="openpyxl") as writer:
-            export_df.to_excel(writer, index=False, sheet_name="Amazon Export")
-        output_amazon.seek(0)
-        
-        st.download_button(
-            label="📥 Alle Listings im Amazon-Format herunterladen",
-            data=output_amazon,
-            file_name=f"amazon_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            type="primary",
-            use_container_width=True,
-            help="Exportiert alle aktuellen Listings (KI-generiert, bearbeitet, aus Excel) im Amazon-Format mit allen erforderlichen Spalten"
-        )
+    # Spalten und Mapping wie beim Datenbank-Export im Amazon-Layout (listing_to_amazon_row);
+    # die Datei wird erst beim Klick gebaut
+    amazon_export_format = st.radio(
+        "Dateiformat",
+        options=list(EXPORT_FORMATS),
+        format_func=lambda x: EXPORT_FORMATS[x][2],
+        horizontal=True,
+        key="amazon_export_format"
+    )
+    amazon_export_partition = st.multiselect(
+        "Aufteilen nach (ZIP mit einer Datei pro Gruppe)",
+        options=list(PARTITION_FIELDS),
+        format_func=lambda x: PARTITION_FIELDS[x],
+        key="amazon_export_partition"
+    )
+    if amazon_export_partition:
+        amazon_export_ext, amazon_export_mime = ".zip", "application/zip"
     else:
-        st.info("ℹ️ Keine Listings zum Exportieren vorhanden.")
+        amazon_export_ext, amazon_export_mime = EXPORT_FORMATS[amazon_export_format][:2]
+    st.download_button(
+        label="📥 Alle Listings im Amazon-Format herunterladen",
+        data=lazy_export("amazon", all_listings_for_export, file_format=amazon_export_format, partition_by=amazon_export_partition),
+        file_name=f"amazon_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}{amazon_export_ext}",
+        mime=amazon_export_mime,
+        type="primary",
+        use_container_width=True,
+        help="Exportiert alle aktuellen Listings (KI-generiert, bearbeitet, aus Excel) im Amazon-Format mit allen erforderlichen Spalten"
+    )
 else:
     st.info("ℹ️ Keine Listings zum Exportieren vorhanden.")
@@ -0,0 +1,144 @@
+"""
+Fake-Backend für GeminiClient ohne API-Aufrufe (nur für lokale Prüfungen, nicht von app.py importiert).
+
+Damit lassen sich Wiederholungen, Cooldown, RateLimiter und Cache ohne Key und ohne Kosten
+durchspielen. `python fake_gemini.py` prüft die Fehlerbehandlung von generate_listing
+deterministisch (429 mit Wartezeit, 503, 400).
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+
+from ai_generation import (
+    ERROR_FATAL,
+    ERROR_RATE_LIMIT,
+    ERROR_TRANSIENT,
+    LISTING_RESPONSE_FIELDS,
+    GeminiClient,
+    RetryPolicy,
+    classify_gemini_error,
+    generate_listing,
+)
+
+
+class FakeApiError(Exception):
+    """API-Fehler des FakeGeminiBackend mit HTTP-Status (.code) und optionaler Wartezeit (.retry_after)"""
+
+    def __init__(self, code, message="", retry_after=None):
+        super().__init__(f"{code} {message}".strip())
+        self.code = code
+        self.retry_after = retry_after
+
+
+class _FakeResponse:
+    """Antwort bzw. Stream-Stück des FakeGeminiBackend (text, usage_metadata wie bei google.generativeai)"""
+
+    def __init__(self, text, prompt_tokens=None, response_tokens=None):
+        self.text = text
+        self.usage_metadata = None
+        if prompt_tokens is not None:
+            self.usage_metadata = type("UsageMetadata", (), {
+                "prompt_token_count": prompt_tokens,
+                "candidates_token_count": response_tokens,
+                "total_token_count": prompt_tokens + response_tokens,
+            })()
+
+
+class _FakeModel:
+    """GenerativeModel des FakeGeminiBackend"""
+
+    def __init__(self, backend, model_name):
+        self.backend = backend
+        self.model_name = model_name
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        text = self.backend.next_response(self.model_name, prompt, generation_config)
+        prompt_tokens, response_tokens = len(prompt) // 4, len(text) // 4
+        if not stream:
+            return _FakeResponse(text, prompt_tokens, response_tokens)
+        size = self.backend.chunk_size
+        chunks = [_FakeResponse(text[start:start + size]) for start in range(0, len(text), size)]
+        # Wie bei der echten API: usage_metadata kommt mit dem letzten Stück
+        return chunks + [_FakeResponse("", prompt_tokens, response_tokens)]
+
+
+class FakeGeminiBackend:
+    """
+    Lokales Backend für GeminiClient ohne API-Aufrufe - z.B. um Wiederholungen, Cooldown,
+    RateLimiter und Cache ohne Key und ohne Kosten durchzuspielen.
+
+    `script` wird Aufruf für Aufruf abgearbeitet: Exceptions (z.B. FakeApiError(429,
+    retry_after=2)) werden geworfen, Strings als Antworttext geliefert. Ist es leer, kommt
+    `default_text` (ein gültiges Listing). Alle Aufrufe stehen in `calls`.
+    """
+
+    def __init__(self, script=(), default_text=None, model_name="gemini-fake", latency=0.0, chunk_size=40):
+        self.script = deque(script)
+        self.default_text = default_text or json.dumps(
+            {field: f"{field} (Fake)" for field in LISTING_RESPONSE_FIELDS}, ensure_ascii=False
+        )
+        self.model_name = model_name
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def list_models(self):
+        model = type("Model", (), {"name": f"models/{self.model_name}", "supported_generation_methods": ["generateContent"]})
+        return [model()]
+
+    def generative_model(self, model_name):
+        return _FakeModel(self, model_name)
+
+    def next_response(self, model_name, prompt, generation_config=None):
+        """Nächster Schritt aus `script` (wirft Exceptions, liefert sonst den Antworttext)"""
+        with self._lock:
+            self.calls.append({"model": model_name, "prompt": prompt, "generation_config": generation_config})
+            step = self.script.popleft() if self.script else self.default_text
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(step, BaseException):
+            raise step
+        return step
+
+
+# ============ SELBSTTEST ============
+
+def self_check():
+    """
+    Treibt generate_listing durch das Fake-Backend (eingespieltes `sleep`, fester Zufall).
+
+    Raises:
+        AssertionError: Wenn Klassifizierung oder Wiederholungen nicht wie erwartet laufen
+    """
+    rate_limited = FakeApiError(429, "quota exceeded", retry_after=7)
+    overloaded = FakeApiError(503, "overloaded")
+    bad_request = FakeApiError(400, "invalid argument")
+    assert classify_gemini_error(rate_limited) == ERROR_RATE_LIMIT
+    assert classify_gemini_error(overloaded) == ERROR_TRANSIENT
+    assert classify_gemini_error(bad_request) == ERROR_FATAL
+
+    # 429 wartet die vorgegebene Zeit, 503 ein Backoff mit Jitter, danach klappt es
+    sleeps = []
+    backend = FakeGeminiBackend(script=[rate_limited, overloaded])
+    retry = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=30.0, rng=random.Random(0))
+    result = generate_listing(GeminiClient(backend), "Testprodukt", retry=retry, sleep=sleeps.append)
+    expected_jitter = random.Random(0).uniform(0, 1.0 * 2 ** 1)
+    assert result.error is None, result.error
+    assert result.attempts == 3 and len(backend.calls) == 3
+    assert sleeps == [7, expected_jitter], sleeps
+    assert set(result.data) == set(LISTING_RESPONSE_FIELDS)
+
+    # 400 ist nicht wiederholbar: ein Versuch, kein Warten, Fehler im Ergebnis
+    sleeps = []
+    backend = FakeGeminiBackend(script=[bad_request])
+    result = generate_listing(GeminiClient(backend), "Testprodukt", retry=retry, sleep=sleeps.append)
+    assert result.error is bad_request
+    assert result.attempts == 1 and len(backend.calls) == 1 and sleeps == []
+
+
+if __name__ == "__main__":
+    self_check()
+    print("fake_gemini: OK")
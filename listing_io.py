@@ -0,0 +1,1771 @@
+"""
+Datei-Ein- und Ausgabe für den Amazon Listing Editor.
+
+Alles in diesem Modul kommt ohne Streamlit aus, damit es aus app.py heraus genutzt
+und unabhängig von der UI (z.B. für Benchmarks) aufgerufen werden kann.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import groupby
+
+import openpyxl
+import pandas as pd
+import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
+
+# Optional: pyarrow für schnelles CSV/TSV- und Parquet-Einlesen
+# pip install pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+    _HAS_PYARROW = True
+except Exception:
+    _HAS_PYARROW = False
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Ab dieser Größe wird eine Exportdatei nicht mehr im Speicher, sondern auf der Platte gehalten
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+# Excel erlaubt für Dropdown-Listen höchstens 255 Zeichen (Werte mit Kommas getrennt); längere
+# Listen schreibt write_xlsx_stream in dieses ausgeblendete Blatt und verweist auf den Bereich
+VALIDATION_LIST_MAX_CHARS = 255
+VALIDATION_LIST_SHEET = "Auswahllisten"
+
+LISTING_TEXT_FIELDS = [
+    "Titel", "Bullet1", "Bullet2", "Bullet3", "Bullet4", "Bullet5",
+    "Description", "SearchTerms",
+]
+
+# Internes Layout (entspricht dem Upload-Format für Supabase)
+INTERNAL_EXPORT_COLUMNS = [
+    "ASIN / EAN / SKU", "MP", "Name", "Titel", "Account", "Project", "Image",
+    "Bullet1", "Bullet2", "Bullet3", "Bullet4", "Bullet5",
+    "Description", "SearchTerms", "Keywords",
+]
+
+# Amazon-Layout (Spalten wie im Amazon-Format Export)
+AMAZON_EXPORT_COLUMNS = [
+    "Marketplace", "ASIN", "Product Title", "Description",
+    "Bullet 1", "Bullet 2", "Bullet 3", "Bullet 4", "Bullet 5",
+    "Bullet 6", "Bullet 7", "Bullet 8", "Bullet 9",
+    "Generic Keywords", "SKU", "Brand Story", "Variation ASIN",
+    "image", "image1", "image2", "image3", "image4", "image5", "image6", "image7",
+    "image8", "image9", "image10", "image11", "image12", "image13", "image14",
+    "Minimum Advertised Price",
+]
+
+# Spalten, deren Inhalt immer als Text gelesen wird (Kennungen dürfen keine Zahlen werden)
+IDENTIFIER_COLUMN_TOKENS = ("asin", "ean", "sku", "gtin", "upc", "isbn")
+IDENTIFIER_COLUMN_NAMES = {"mp", "marketplace"}
+
+# Standard-Chunkgröße beim Einlesen von Uploads
+READ_CHUNK_ROWS = 5000
+
+# Erlaubte Dateiendungen für alle Uploads (st.file_uploader)
+UPLOAD_FILE_TYPES = ["xlsx", "csv", "tsv", "txt", "parquet"]
+
+# Spalten der Tabelle `listings`, die für einen Export benötigt werden
+LISTING_DB_EXPORT_COLUMNS = [
+    "asin_ean_sku", "mp", "name", "product", "account", "project", "image",
+    "titel", "bullet1", "bullet2", "bullet3", "bullet4", "bullet5",
+    "description", "search_terms", "keywords",
+]
+
+
+def _text(value):
+    """Wandelt einen Zellwert in einen getrimmten String um (None -> "")"""
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def db_row_to_listing(row):
+    """Wandelt eine Zeile der Tabelle `listings` in das Listing-Format der Bearbeitungsmaske um"""
+    return {
+        "asin_ean_sku": row.get("asin_ean_sku") or "",
+        "mp": row.get("mp") or "",
+        "name": row.get("name") or "",
+        "Product": row.get("product") or row.get("name") or "",
+        "account": row.get("account") or "",
+        "project": row.get("project") or "",
+        "image": row.get("image") or "",
+        "Titel": row.get("titel") or "",
+        "Bullet1": row.get("bullet1") or "",
+        "Bullet2": row.get("bullet2") or "",
+        "Bullet3": row.get("bullet3") or "",
+        "Bullet4": row.get("bullet4") or "",
+        "Bullet5": row.get("bullet5") or "",
+        "Description": row.get("description") or "",
+        "SearchTerms": row.get("search_terms") or "",
+        "Keywords": row.get("keywords") or "",
+    }
+
+
+def listing_to_internal_row(listing):
+    """Mappt ein Listing auf das interne Export-Layout"""
+    return {
+        "ASIN / EAN / SKU": _text(listing.get("asin_ean_sku")),
+        "MP": _text(listing.get("mp")),
+        "Name": _text(listing.get("Product") or listing.get("name")),
+        "Titel": _text(listing.get("Titel")),
+        "Account": _text(listing.get("account")),
+        "Project": _text(listing.get("project")),
+        "Image": _text(listing.get("image")),
+        "Bullet1": _text(listing.get("Bullet1")),
+        "Bullet2": _text(listing.get("Bullet2")),
+        "Bullet3": _text(listing.get("Bullet3")),
+        "Bullet4": _text(listing.get("Bullet4")),
+        "Bullet5": _text(listing.get("Bullet5")),
+        "Description": _text(listing.get("Description")),
+        "SearchTerms": _text(listing.get("SearchTerms")),
+        "Keywords": _text(listing.get("Keywords")),
+    }
+
+
+def listing_to_amazon_row(listing):
+    """Mappt ein Listing auf das Amazon-Export-Layout"""
+    export_row = dict.fromkeys(AMAZON_EXPORT_COLUMNS, "")
+    export_row.update({
+        "Marketplace": _text(listing.get("mp")),
+        "ASIN": _text(listing.get("asin_ean_sku")),
+        "Product Title": _text(listing.get("Titel")),
+        "Description": _text(listing.get("Description")),
+        "Bullet 1": _text(listing.get("Bullet1")),
+        "Bullet 2": _text(listing.get("Bullet2")),
+        "Bullet 3": _text(listing.get("Bullet3")),
+        "Bullet 4": _text(listing.get("Bullet4")),
+        "Bullet 5": _text(listing.get("Bullet5")),
+        "Generic Keywords": _text(listing.get("SearchTerms")),  # SearchTerms = Generic Keywords
+        "SKU": _text(listing.get("asin_ean_sku")),  # SKU = ASIN
+        "image": _text(listing.get("image")) if listing.get("image") else "",
+    })
+    return export_row
+
+
+# Exportformate: Dateiendung, MIME-Typ, Anzeigename
+EXPORT_FORMATS = {
+    "xlsx": (".xlsx", XLSX_MIME, "Excel (.xlsx)"),
+    "tsv": (".txt", "text/tab-separated-values", "Flat-File (.txt, Tab-getrennt)"),
+    "tsv.gz": (".txt.gz", "application/gzip", "Flat-File komprimiert (.txt.gz)"),
+}
+
+EXPORT_LAYOUTS = {
+    "internal": (INTERNAL_EXPORT_COLUMNS, listing_to_internal_row, "Listings"),
+    "amazon": (AMAZON_EXPORT_COLUMNS, listing_to_amazon_row, "Amazon Export"),
+}
+
+
+def write_xlsx_stream(rows, columns, sheet_name="Sheet1", on_progress=None, progress_every=5000,
+                      column_widths=None, validations=None):
+    """
+    Schreibt Zeilen (Dicts) zeilenweise in eine xlsx-Datei, ohne das Workbook im Speicher zu halten.
+
+    xlsxwriter im `constant_memory`-Modus schreibt jede Zeile sofort auf die Platte,
+    das Ergebnis landet in einer SpooledTemporaryFile (kleine Dateien bleiben im RAM).
+
+    Args:
+        rows: Iterable von Dicts (z.B. ein Generator über einen DB-Cursor)
+        columns: Spaltenreihenfolge
+        sheet_name: Name des Tabellenblatts
+        on_progress: Optionaler Callback, der mit der Anzahl geschriebener Zeilen aufgerufen wird
+        column_widths: Optionales Dict {Spaltenname: Breite}
+        validations: Optionale Liste von (Zellbereich, xlsxwriter-Validierungs-Dict), z.B. Dropdowns;
+            Auswahllisten über VALIDATION_LIST_MAX_CHARS kommen aus dem Blatt VALIDATION_LIST_SHEET
+
+    Returns:
+        tuple: (file, row_count) - Datei ist auf Position 0 zurückgespult
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_formulas": False, "strings_to_urls": False})
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    # Spaltenbreiten müssen im constant_memory-Modus vor den Zeilen gesetzt werden
+    for col_index, column in enumerate(columns):
+        if column_widths and column in column_widths:
+            worksheet.set_column(col_index, col_index, column_widths[column])
+    for cell_range, validation in _validations_with_list_ranges(workbook, validations or []):
+        worksheet.data_validation(cell_range, validation)
+
+    header_format = workbook.add_format({"bold": True})
+    worksheet.write_row(0, 0, columns, header_format)
+
+    row_count = 0
+    for row in rows:
+        row_count += 1
+        worksheet.write_row(row_count, 0, [row.get(col, "") for col in columns])
+        if on_progress and row_count % progress_every == 0:
+            on_progress(row_count)
+
+    workbook.close()
+    if on_progress:
+        on_progress(row_count)
+    output.seek(0)
+    return output, row_count
+
+
+def _needs_list_range(values):
+    """Passt eine Auswahlliste nicht als Text in die Validierung (zu lang oder Werte mit Komma/Anführungszeichen)?"""
+    values = [str(value) for value in values]
+    return len(",".join(values)) > VALIDATION_LIST_MAX_CHARS or any("," in value or '"' in value for value in values)
+
+
+def _validations_with_list_ranges(workbook, validations):
+    """
+    Ersetzt zu lange Auswahllisten durch Bereiche in einem ausgeblendeten Blatt (eine Spalte je Liste).
+
+    Im constant_memory-Modus müssen die Zeilen des Blatts in Reihenfolge geschrieben werden,
+    deshalb werden erst alle Listen gesammelt und dann zeilenweise geschrieben.
+    """
+    lists = []
+    resolved = []
+    for cell_range, validation in validations:
+        source = validation.get("source")
+        if validation.get("validate") == "list" and isinstance(source, (list, tuple)) and source and _needs_list_range(source):
+            column = xl_col_to_name(len(lists))
+            validation = {**validation, "source": f"='{VALIDATION_LIST_SHEET}'!${column}$1:${column}${len(source)}"}
+            lists.append([str(value) for value in source])
+        resolved.append((cell_range, validation))
+    if lists:
+        list_sheet = workbook.add_worksheet(VALIDATION_LIST_SHEET)
+        list_sheet.hide()
+        for row_index in range(max(len(values) for values in lists)):
+            for col_index, values in enumerate(lists):
+                if row_index < len(values):
+                    list_sheet.write_string(row_index, col_index, values[row_index])
+    return resolved
+
+
+def frame_to_xlsx(frame, sheet_name="Sheet1", column_widths=None, validations=None):
+    """
+    Schreibt einen DataFrame über write_xlsx_stream als xlsx (ohne Index).
+
+    Fehlende Werte werden als leere Zellen geschrieben.
+
+    Returns:
+        file: SpooledTemporaryFile auf Position 0
+    """
+    columns = [str(c) for c in frame.columns]
+    frame = frame.astype(object).where(frame.notna(), "")
+    frame.columns = columns
+    output, _ = write_xlsx_stream(
+        frame_to_listing_records(frame, columns),
+        columns,
+        sheet_name=sheet_name,
+        column_widths=column_widths,
+        validations=validations,
+    )
+    return output
+
+
+def read_export(file):
+    """Liest eine Exportdatei vollständig (z.B. für st.download_button) und schließt sie"""
+    try:
+        file.seek(0)
+        return file.read()
+    finally:
+        file.close()
+
+
+def export_listings_xlsx(listings, layout="internal", on_progress=None):
+    """
+    Exportiert Listings (Iterable von Listing-Dicts) im gewünschten Layout als xlsx.
+
+    Returns:
+        tuple: (file, row_count)
+    """
+    columns, mapper, sheet_name = EXPORT_LAYOUTS[layout]
+    return write_xlsx_stream(
+        (mapper(listing) for listing in listings),
+        columns,
+        sheet_name=sheet_name,
+        on_progress=on_progress,
+    )
+
+
+def _flat_file_value(value):
+    """Bereitet einen Wert für eine Tab-getrennte Flat-File-Zeile vor (Tabs/Zeilenumbrüche -> Leerzeichen)"""
+    if value is None:
+        return ""
+    return " ".join(str(value).replace("\t", " ").splitlines())
+
+
+def write_tsv_stream(rows, columns, compress=False, on_progress=None, progress_every=5000):
+    """
+    Schreibt Zeilen (Dicts) als Tab-getrennte UTF-8-Textdatei (Amazon Flat-File), optional gzip-komprimiert.
+
+    Jede Zeile wird sofort geschrieben, der Speicherbedarf hängt nicht von der Zeilenzahl ab.
+    Flat-Files kennen keine Anführungszeichen: Tabs und Zeilenumbrüche in Texten werden
+    deshalb durch Leerzeichen ersetzt.
+
+    Returns:
+        tuple: (file, row_count) - Datei ist auf Position 0 zurückgespult
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    binary = gzip.GzipFile(fileobj=output, mode="wb") if compress else output
+    writer_stream = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+    writer_stream.write("\t".join(columns) + "\n")
+
+    row_count = 0
+    for row in rows:
+        row_count += 1
+        writer_stream.write("\t".join(_flat_file_value(row.get(col)) for col in columns) + "\n")
+        if on_progress and row_count % progress_every == 0:
+            on_progress(row_count)
+
+    writer_stream.flush()
+    writer_stream.detach()
+    if compress:
+        binary.close()  # schreibt den gzip-Trailer, `output` bleibt offen
+    if on_progress:
+        on_progress(row_count)
+    output.seek(0)
+    return output, row_count
+
+
+def export_listings_file(listings, layout="internal", file_format="xlsx", on_progress=None):
+    """
+    Exportiert Listings im gewünschten Layout und Dateiformat (siehe EXPORT_FORMATS).
+
+    Returns:
+        tuple: (file, row_count)
+    """
+    if file_format == "xlsx":
+        return export_listings_xlsx(listings, layout=layout, on_progress=on_progress)
+    columns, mapper, _ = EXPORT_LAYOUTS[layout]
+    return write_tsv_stream(
+        (mapper(listing) for listing in listings),
+        columns,
+        compress=file_format == "tsv.gz",
+        on_progress=on_progress,
+    )
+
+
+# Felder, nach denen ein Export in einzelne Dateien aufgeteilt werden kann
+PARTITION_FIELDS = {"mp": "Marketplace", "account": "Account"}
+
+# Worker-Prozesse beim Erzeugen der Partitionsdateien (xlsxwriter ist reines Python und hält den GIL)
+PARTITION_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def partition_key(listing, partition_by):
+    """Partitionsschlüssel eines Listings, z.B. ("DE", "Kunde A") für partition_by=("mp", "account")"""
+    return tuple(_text(listing.get(field)) for field in partition_by)
+
+
+def iter_partitions(listings, partition_by, presorted=False):
+    """
+    Teilt Listings nach `partition_by` auf und liefert (Schlüssel, Liste von Listings).
+
+    Mit `presorted=True` müssen gleiche Schlüssel direkt aufeinander folgen (z.B. ORDER BY mp, account);
+    dann wird immer nur eine Partition gleichzeitig im Speicher gehalten.
+    """
+    if presorted:
+        for key, group in groupby(listings, key=lambda listing: partition_key(listing, partition_by)):
+            yield key, list(group)
+        return
+    partitions = {}
+    for listing in listings:
+        partitions.setdefault(partition_key(listing, partition_by), []).append(listing)
+    for key in sorted(partitions):
+        yield key, partitions[key]
+
+
+def _partition_file_name(key, partition_by, extension, used_names):
+    """Dateiname im ZIP für eine Partition (nur sichere Zeichen, eindeutig)"""
+    parts = [
+        re.sub(r"[^A-Za-z0-9._-]+", "_", value).strip("._") or f"ohne-{field}"
+        for field, value in zip(partition_by, key)
+    ]
+    base = "_".join(parts)
+    name = f"{base}{extension}"
+    counter = 2
+    while name in used_names:
+        name = f"{base}_{counter}{extension}"
+        counter += 1
+    used_names.add(name)
+    return name
+
+
+def make_export_process_pool(max_workers=PARTITION_WORKERS):
+    """Prozess-Pool für export_partitioned_zip (Start per "spawn", siehe make_upload_process_pool)"""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _export_partition(listings, layout, file_format):
+    """Worker: erzeugt eine Partitionsdatei und gibt (Inhalt als Bytes, Zeilenanzahl) zurück"""
+    part_file, row_count = export_listings_file(listings, layout, file_format)
+    return read_export(part_file), row_count
+
+
+def export_partitioned_zip(listings, partition_by=("mp",), layout="amazon", file_format="xlsx",
+                           presorted=False, executor=None, on_progress=None):
+    """
+    Exportiert Listings als ZIP mit einer Datei pro Partition (z.B. pro Marketplace und Account).
+
+    Ohne `executor` werden die Partitionsdateien nacheinander im aktuellen Prozess erzeugt und
+    direkt ins ZIP (SpooledTemporaryFile) kopiert. Mit einem Prozess-Pool (siehe
+    make_export_process_pool) entstehen sie parallel in den Workern und werden in
+    Eingangsreihenfolge übernommen; es sind höchstens PARTITION_WORKERS + 1 Partitionen
+    gleichzeitig in Arbeit, der Speicherbedarf bleibt damit begrenzt. Fällt der Pool aus,
+    wird im aktuellen Prozess weitergeschrieben.
+
+    Args:
+        listings: Iterable von Listing-Dicts
+        partition_by: Felder aus PARTITION_FIELDS
+        layout: Schlüssel aus EXPORT_LAYOUTS
+        file_format: Schlüssel aus EXPORT_FORMATS (Format der Dateien im ZIP)
+        presorted: Listings kommen bereits nach `partition_by` sortiert (siehe iter_partitions)
+        executor: Optionaler Prozess-Pool
+        on_progress: Optionaler Callback(partitionen, zeilen)
+
+    Returns:
+        tuple: (file, partition_count, row_count) - Datei ist auf Position 0 zurückgespult
+    """
+    extension = EXPORT_FORMATS[file_format][0]
+    # xlsx und gzip sind bereits komprimiert - nochmaliges Deflate kostet nur Zeit
+    compression = zipfile.ZIP_STORED if file_format in ("xlsx", "tsv.gz") else zipfile.ZIP_DEFLATED
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    used_names = set()
+    partition_count = 0
+    row_count = 0
+
+    with zipfile.ZipFile(output, "w", compression) as archive:
+        pending = deque()
+        partitions = iter_partitions(listings, partition_by, presorted=presorted)
+        while True:
+            # Neue Partitionen einreichen, solange Platz im Pool ist (ohne Pool: immer nur eine)
+            for key, part in partitions:
+                name = _partition_file_name(key, partition_by, extension, used_names)
+                future = executor.submit(_export_partition, part, layout, file_format) if executor is not None else None
+                pending.append((name, part, future))
+                if future is None or len(pending) > PARTITION_WORKERS:
+                    break
+            if not pending:
+                break
+            # Älteste Partition ins ZIP übernehmen (Reihenfolge bleibt stabil)
+            name, part, future = pending.popleft()
+            data = None
+            if future is not None:
+                try:
+                    data, part_rows = future.result()
+                except BrokenProcessPool:
+                    executor = None
+            if data is not None:
+                archive.writestr(name, data)
+            else:
+                part_file, part_rows = export_listings_file(part, layout, file_format)
+                with part_file, archive.open(name, "w") as member:
+                    shutil.copyfileobj(part_file, member)
+            partition_count += 1
+            row_count += part_rows
+            if on_progress:
+                on_progress(partition_count, row_count)
+
+    output.seek(0)
+    return output, partition_count, row_count
+
+
+def export_rows_hash(rows, columns=None):
+    """
+    Inhalts-Hash (SHA-256) über Exportzeilen - gleicher Inhalt ergibt denselben Export.
+
+    Args:
+        rows: Iterable von Dicts
+        columns: Optionale Spaltenreihenfolge (gehört mit zum Inhalt)
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(columns, ensure_ascii=False).encode("utf-8"))
+    seen_columns = {}
+    for row in rows:
+        seen_columns.update(dict.fromkeys(row))
+        digest.update(json.dumps(row, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8"))
+        digest.update(b"\n")
+    if columns is None:
+        # Ohne feste Spalten ergibt sich die Reihenfolge aus dem ersten Auftreten (wie bei pd.DataFrame)
+        digest.update(json.dumps(list(seen_columns), ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# ============ UPLOADS EINLESEN ============
+
+def is_identifier_column(column_name):
+    """Prüft, ob eine Spalte eine Kennung (ASIN/EAN/SKU/MP ...) enthält und als Text gelesen werden muss"""
+    name = str(column_name).strip().lower()
+    return name in IDENTIFIER_COLUMN_NAMES or any(token in name for token in IDENTIFIER_COLUMN_TOKENS)
+
+
+def identifier_to_str(value, number_format=None):
+    """
+    Wandelt einen Zellwert einer Kennungs-Spalte verlustfrei in Text um.
+
+    Zahlen wie 4006381333931.0 werden zu "4006381333931". Ist die Zelle in Excel mit
+    einem Null-Format (z.B. "0000000000000") formatiert, werden führende Nullen
+    wiederhergestellt, so wie Excel sie anzeigt.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ""
+        text = str(int(value)) if value.is_integer() else repr(value)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        text = str(value)
+    else:
+        return str(value).strip()
+    if number_format and set(number_format) == {"0"} and text.isdigit():
+        text = text.zfill(len(number_format))
+    return text
+
+
+def _unique_headers(raw_headers):
+    """Erzeugt eindeutige Spaltennamen wie pandas ("Unnamed: 3", "Titel.1")"""
+    headers = []
+    seen = {}
+    for i, value in enumerate(raw_headers):
+        text = str(value).replace("\ufeff", "").strip() if value is not None else ""
+        name = text if text else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        headers.append(name)
+    return headers
+
+
+def _rewind(source):
+    """Spult Datei-Objekte (z.B. Streamlit-Uploads) an den Anfang zurück"""
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+def _rows_to_frame(rows, headers, start_index):
+    """Baut einen Chunk-DataFrame, dessen Index der Zeilennummer in der Datei entspricht (0 = erste Datenzeile)"""
+    return pd.DataFrame(rows, columns=headers, index=pd.RangeIndex(start_index, start_index + len(rows)), dtype=object)
+
+
+def iter_excel_chunks(source, chunk_size=READ_CHUNK_ROWS, sheet_name=None):
+    """
+    Liest ein Excel-Blatt zeilenweise (openpyxl `read_only`) und liefert DataFrames mit
+    höchstens `chunk_size` Zeilen.
+
+    - Kennungs-Spalten (siehe is_identifier_column) werden immer als Text gelesen,
+      leere Kennungen werden zu "".
+    - Alle anderen Spalten behalten ihren Zellwert, leere Zellen werden zu NaN
+      (wie bei pd.read_excel).
+    - Komplett leere Zeilen werden übersprungen.
+
+    Der Speicherbedarf hängt nur von `chunk_size` ab, nicht von der Dateigröße.
+    """
+    workbook = openpyxl.load_workbook(_rewind(source), read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = worksheet.iter_rows()
+        header_cells = next(rows, None)
+        if header_cells is None:
+            return
+        raw_headers = [cell.value for cell in header_cells]
+        # Leere Spalten am Ende (z.B. durch Formatierungen) abschneiden
+        while raw_headers and (raw_headers[-1] is None or not str(raw_headers[-1]).strip()):
+            raw_headers.pop()
+        headers = _unique_headers(raw_headers)
+        width = len(headers)
+        identifier_idx = [i for i, name in enumerate(headers) if is_identifier_column(name)]
+        identifier_set = set(identifier_idx)
+        other_idx = [i for i in range(width) if i not in identifier_set]
+
+        chunk = []
+        start_index = 0
+        for cells in rows:
+            values = [cell.value for cell in cells[:width]]
+            if len(values) < width:
+                values.extend([None] * (width - len(values)))
+            if all(v is None or (isinstance(v, str) and not v.strip()) for v in values):
+                continue
+            for i in identifier_idx:
+                cell = cells[i] if i < len(cells) else None
+                values[i] = identifier_to_str(values[i], getattr(cell, "number_format", None))
+            for i in other_idx:
+                if values[i] is None:
+                    values[i] = float("nan")
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                yield _rows_to_frame(chunk, headers, start_index)
+                start_index += len(chunk)
+                chunk = []
+        if chunk:
+            yield _rows_to_frame(chunk, headers, start_index)
+        elif start_index == 0:
+            # Nur Kopfzeile: leeren DataFrame mit Spalten liefern
+            yield _rows_to_frame([], headers, 0)
+    finally:
+        workbook.close()
+
+
+def read_excel_frame(source, sheet_name=None, chunk_size=READ_CHUNK_ROWS):
+    """Liest ein komplettes Excel-Blatt über iter_excel_chunks in einen DataFrame"""
+    chunks = list(iter_excel_chunks(source, chunk_size=chunk_size, sheet_name=sheet_name))
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks)
+
+
+def detect_upload_format(source, file_name=None):
+    """
+    Erkennt das Format eines Uploads: "xlsx", "parquet" oder "csv" (CSV/TSV/TXT).
+    Maßgeblich ist der Dateiinhalt (Magic Bytes), die Endung dient nur als Fallback.
+    """
+    head = b""
+    if hasattr(source, "read"):
+        _rewind(source)
+        head = source.read(8)
+        _rewind(source)
+    if head.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    ext = os.path.splitext(str(file_name or getattr(source, "name", "") or ""))[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return "xlsx"
+    if ext == ".parquet":
+        return "parquet"
+    return "csv"
+
+
+def _sniff_csv(source, sample_bytes=64 * 1024):
+    """
+    Ermittelt Encoding, Trennzeichen und Kopfzeile einer CSV/TSV-Datei anhand einer Stichprobe.
+
+    Returns:
+        tuple: (encoding, delimiter, headers)
+    """
+    _rewind(source)
+    sample = source.read(sample_bytes)
+    _rewind(source)
+    if sample.startswith(b"\xef\xbb\xbf"):
+        sample = sample[3:]
+    try:
+        text = sample.decode("utf-8")
+        encoding = "utf-8"
+    except UnicodeDecodeError as e:
+        if e.start >= len(sample) - 4:
+            # Stichprobe endet mitten in einem Multibyte-Zeichen
+            text = sample[:e.start].decode("utf-8")
+            encoding = "utf-8"
+        else:
+            # Typischer Excel-Export unter Windows
+            text = sample.decode("cp1252", errors="replace")
+            encoding = "cp1252"
+    first_line = text.splitlines()[0] if text else ""
+    try:
+        delimiter = csv.Sniffer().sniff(text[:16 * 1024], delimiters=",;\t|").delimiter
+    except csv.Error:
+        counts = {d: first_line.count(d) for d in ("\t", ";", ",", "|")}
+        delimiter = max(counts, key=counts.get) if any(counts.values()) else ","
+    headers = next(csv.reader([first_line], delimiter=delimiter), [])
+    return encoding, delimiter, _unique_headers(headers)
+
+
+def _finish_text_frame(df, start_index):
+    """Bringt einen aus CSV/Parquet gelesenen Chunk in dieselbe Form wie iter_excel_chunks"""
+    df = df.astype(object)
+    for col in df.columns:
+        if is_identifier_column(col):
+            df[col] = [identifier_to_str(v) for v in df[col]]
+        else:
+            df[col] = df[col].where(df[col].notna() & (df[col] != ""), float("nan"))
+    df.index = pd.RangeIndex(start_index, start_index + len(df))
+    return df
+
+
+def _iter_arrow_batches(batches, chunk_size):
+    """Fasst Arrow-RecordBatches zu DataFrames mit genau `chunk_size` Zeilen zusammen (letzter Chunk kleiner)"""
+    buffer = []
+    buffered_rows = 0
+    start_index = 0
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        buffer.append(batch)
+        buffered_rows += batch.num_rows
+        while buffered_rows >= chunk_size:
+            table = pa.Table.from_batches(buffer)
+            yield _finish_text_frame(table.slice(0, chunk_size).to_pandas(), start_index)
+            start_index += chunk_size
+            rest = table.slice(chunk_size)
+            buffer = rest.to_batches() if rest.num_rows else []
+            buffered_rows = rest.num_rows
+    if buffered_rows:
+        yield _finish_text_frame(pa.Table.from_batches(buffer).to_pandas(), start_index)
+
+
+def iter_csv_chunks(source, chunk_size=READ_CHUNK_ROWS, delimiter=None):
+    """
+    Liest CSV/TSV-Dateien in Chunks. Trennzeichen (`,` `;` Tab `|`) und Encoding werden
+    automatisch erkannt. Alle Spalten werden als Text gelesen, leere Felder werden wie
+    bei Excel behandelt (Kennungen "", sonst NaN).
+
+    Verwendet den Multi-Thread-CSV-Reader von pyarrow, ohne pyarrow pandas.read_csv.
+    """
+    encoding, sniffed_delimiter, headers = _sniff_csv(source)
+    delimiter = delimiter or sniffed_delimiter
+    if not headers:
+        return
+    _rewind(source)
+
+    if _HAS_PYARROW:
+        reader = pa_csv.open_csv(
+            source,
+            read_options=pa_csv.ReadOptions(
+                column_names=headers,
+                skip_rows=1,
+                encoding=encoding,
+                block_size=4 * 1024 * 1024,
+            ),
+            parse_options=pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.string() for name in headers},
+                strings_can_be_null=False,
+            ),
+        )
+        yielded = False
+        for frame in _iter_arrow_batches(reader, chunk_size):
+            yielded = True
+            yield frame
+        if not yielded:
+            yield _rows_to_frame([], headers, 0)
+        return
+
+    text_stream = io.TextIOWrapper(source, encoding=encoding + ("-sig" if encoding == "utf-8" else ""), newline="")
+    try:
+        start_index = 0
+        for frame in pd.read_csv(text_stream, sep=delimiter, names=headers, skiprows=1, dtype=str,
+                                 keep_default_na=False, chunksize=chunk_size):
+            yield _finish_text_frame(frame, start_index)
+            start_index += len(frame)
+    finally:
+        # Den Upload selbst nicht schließen
+        text_stream.detach()
+
+
+def iter_parquet_chunks(source, chunk_size=READ_CHUNK_ROWS):
+    """Liest eine Parquet-Datei in Chunks (benötigt pyarrow)"""
+    if not _HAS_PYARROW:
+        raise ImportError("Für Parquet-Uploads wird pyarrow benötigt (pip install pyarrow).")
+    parquet_file = pa_parquet.ParquetFile(_rewind(source))
+    yield from _iter_arrow_batches(parquet_file.iter_batches(batch_size=chunk_size), chunk_size)
+
+
+def iter_upload_chunks(source, file_name=None, chunk_size=READ_CHUNK_ROWS, sheet_name=None):
+    """Liest einen Upload (xlsx, CSV/TSV oder Parquet) in DataFrame-Chunks gleicher Form"""
+    upload_format = detect_upload_format(source, file_name)
+    if upload_format == "xlsx":
+        yield from iter_excel_chunks(source, chunk_size=chunk_size, sheet_name=sheet_name)
+    elif upload_format == "parquet":
+        yield from iter_parquet_chunks(source, chunk_size=chunk_size)
+    else:
+        yield from iter_csv_chunks(source, chunk_size=chunk_size)
+
+
+def read_upload_frame(source, file_name=None, sheet_name=None, chunk_size=READ_CHUNK_ROWS):
+    """Liest einen kompletten Upload (xlsx, CSV/TSV oder Parquet) in einen DataFrame"""
+    chunks = list(iter_upload_chunks(source, file_name=file_name, chunk_size=chunk_size, sheet_name=sheet_name))
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks)
+
+
+def file_sha256(source, block_size=1024 * 1024):
+    """SHA-256 über den Inhalt einer Datei bzw. eines Uploads (danach wieder auf Position 0)"""
+    digest = hashlib.sha256()
+    _rewind(source)
+    for block in iter(lambda: source.read(block_size), b""):
+        digest.update(block)
+    _rewind(source)
+    return digest.hexdigest()
+
+
+class ParsedUploadCache:
+    """
+    Kleiner threadsicherer LRU-Cache für eingelesene und normalisierte Uploads.
+
+    Schlüssel ist der Inhalts-Hash der Datei (plus Schema), nicht der Dateiname: Eine umbenannte
+    Kopie wird nicht erneut eingelesen, eine geänderte Datei mit gleichem Namen nie veraltet
+    ausgeliefert. Es werden Kopien herausgegeben, damit Aufrufer den Cache nicht verändern.
+    """
+
+    def __init__(self, max_entries=8, max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Liefert (DataFrame-Kopie, Report) oder None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            frame, report, _ = entry
+        return frame.copy(), dict(report)
+
+    def put(self, key, frame, report):
+        """Legt ein Ergebnis ab; gibt False zurück, wenn es allein schon zu groß für den Cache ist"""
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            self._entries[key] = (frame.copy(), dict(report), size)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries or sum(e[2] for e in self._entries.values()) > self.max_bytes:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# ============ SPALTEN-MAPPING & NORMALISIERUNG ============
+
+# Schema: kanonischer Spaltenname -> (exakte Aliase in Kleinschreibung, Teilstrings)
+# Exakte Aliase haben Vorrang vor Teilstrings. Die Reihenfolge bestimmt die Spaltenreihenfolge
+# des normalisierten DataFrames.
+LISTING_SCHEMA = {
+    "Product": (("product", "produkt"), ()),
+    "asin_ean_sku": (("asin_ean_sku", "asin / ean / sku", "asin/ean/sku", "asin", "ean", "sku"), ("asin", "ean", "sku")),
+    "mp": (("mp", "marketplace", "marktplatz"), ()),
+    "name": (("name", "produktname"), ()),
+    "account": (("account",), ()),
+    "project": (("project", "projekt"), ()),
+    "image": (("image", "bild"), ()),
+    "Titel": (("titel", "title", "product title"), ()),
+    "Bullet1": (("bullet1", "bullet 1", "bullet_1"), ()),
+    "Bullet2": (("bullet2", "bullet 2", "bullet_2"), ()),
+    "Bullet3": (("bullet3", "bullet 3", "bullet_3"), ()),
+    "Bullet4": (("bullet4", "bullet 4", "bullet_4"), ()),
+    "Bullet5": (("bullet5", "bullet 5", "bullet_5"), ()),
+    "Description": (("description", "beschreibung"), ()),
+    "SearchTerms": (("searchterms", "search terms", "search_terms", "generic keywords"), ()),
+    "Keywords": (("keywords",), ()),
+    "comments": (("comments", "kommentare"), ()),
+}
+
+# Schema für die Excel-basierte KI-Generierung
+AI_GENERATION_SCHEMA = {
+    "Produktname": (("produktname", "product name"), ()),
+    "Marketplace": (("marketplace", "mp", "marktplatz"), ()),
+    "asin_ean_sku": (("asin", "asin/ean/sku", "asin / ean / sku", "asin_ean_sku", "ean", "sku"), ()),
+    "Produktspezifikationen": (("produktspezifikationen", "spezifikationen"), ()),
+    "USPs": (("usps", "usp"), ()),
+    "Zielgruppe": (("zielgruppe",), ()),
+    "Saisonalitäten": (("saisonalitäten", "saisonalitaeten", "saisonalität"), ()),
+    "Kundenbewertungen": (("kundenbewertungen",), ()),
+    "Brand Guidelines": (("brand guidelines", "brand guideline"), ()),
+    "Keywords": (("keywords",), ()),
+}
+
+
+def map_columns(columns, schema=LISTING_SCHEMA):
+    """
+    Ordnet Quellspalten den kanonischen Namen eines Schemas zu.
+
+    Returns:
+        dict: Report mit
+            - "mapping": {Quellspalte: kanonischer Name} (nur die erste Quelle je Zielname)
+            - "found": Liste der gefundenen kanonischen Namen
+            - "unmapped": Quellspalten ohne Zuordnung
+            - "duplicates": {kanonischer Name: [weitere Quellspalten]} - diese füllen leere Werte auf
+    """
+    exact = {}
+    for canonical, (aliases, _) in schema.items():
+        for alias in aliases:
+            exact.setdefault(alias, canonical)
+
+    mapping = {}
+    duplicates = {}
+    unmapped = []
+    sources = {}
+    for col in columns:
+        col_lower = str(col).strip().lower()
+        target = exact.get(col_lower)
+        if target is None:
+            for canonical, (_, tokens) in schema.items():
+                if any(token in col_lower for token in tokens):
+                    target = canonical
+                    break
+        if target is None:
+            unmapped.append(col)
+        elif target in sources:
+            duplicates.setdefault(target, []).append(col)
+        else:
+            sources[target] = col
+            mapping[col] = target
+
+    return {
+        "mapping": mapping,
+        "found": [canonical for canonical in schema if canonical in sources],
+        "unmapped": unmapped,
+        "duplicates": duplicates,
+    }
+
+
+def _clean_text_column(series):
+    """Vektorisiert: NaN/None -> "", alles andere -> getrimmter String"""
+    return series.where(series.notna(), "").astype(str).str.strip()
+
+
+def normalize_listing_frame(df, schema=LISTING_SCHEMA, required=()):
+    """
+    Bringt einen Upload-DataFrame in die kanonische Form eines Schemas.
+
+    - Spalten werden über map_columns umbenannt, fehlende kanonische Spalten als "" ergänzt.
+    - Alle kanonischen Spalten werden vektorisiert zu getrimmten Strings ("" statt NaN).
+    - Mehrfach vorhandene Quellspalten (z.B. "ASIN" und "EAN") füllen leere Werte der ersten auf.
+    - Nicht zugeordnete Spalten bleiben unverändert hinten erhalten.
+
+    Returns:
+        tuple: (normalisierter DataFrame, Report von map_columns + "missing")
+    """
+    report = map_columns(df.columns, schema)
+    report["missing"] = [col for col in required if col not in report["found"]]
+
+    normalized = {}
+    for canonical in schema:
+        source = next((src for src, target in report["mapping"].items() if target == canonical), None)
+        if source is None:
+            normalized[canonical] = pd.Series("", index=df.index, dtype=object)
+            continue
+        values = _clean_text_column(df[source])
+        for extra in report["duplicates"].get(canonical, []):
+            values = values.mask(values == "", _clean_text_column(df[extra]))
+        normalized[canonical] = values
+
+    result = pd.DataFrame(normalized, index=df.index)
+    for col in report["unmapped"]:
+        result[col] = df[col]
+    return result, report
+
+
+def frame_to_listing_records(df, fields=None):
+    """Wandelt einen normalisierten DataFrame in eine Liste von Listing-Dicts um"""
+    fields = fields or [col for col in LISTING_SCHEMA if col in df.columns]
+    # Spaltenweise über Python-Listen ist deutlich schneller als DataFrame.to_dict("records")
+    columns = [df[field].tolist() for field in fields]
+    return [dict(zip(fields, values)) for values in zip(*columns)]
+
+
+# ============ VALIDIERUNG ============
+
+# Byte-Limits der Listing-Felder (UTF-8, wie von Amazon gezählt)
+FIELD_BYTE_LIMITS = {
+    "Titel": 150, "Bullet1": 200, "Bullet2": 200, "Bullet3": 200,
+    "Bullet4": 200, "Bullet5": 200, "Description": 2000, "SearchTerms": 250,
+}
+
+# Pflichtfelder beim Speichern in die Datenbank
+REQUIRED_SAVE_FIELDS = ("asin_ean_sku", "mp")
+
+
+def utf8_byte_lengths(series):
+    """UTF-8-Bytelänge je Wert einer Text-Spalte (vektorisiert, fehlende Werte = 0)"""
+    values = series.fillna("").astype(str)
+    if _HAS_PYARROW:
+        import pyarrow.compute as pc
+        lengths = pc.binary_length(pa.array(values, type=pa.string()))
+        return pd.Series(lengths.to_numpy(zero_copy_only=False), index=series.index)
+    return values.str.encode("utf-8").str.len()
+
+
+def validate_listing_frame(df, limits=None, required=REQUIRED_SAVE_FIELDS):
+    """
+    Prüft einen normalisierten Upload komplett auf Byte-Limits und Pflichtfelder.
+
+    Args:
+        df: Normalisierter DataFrame (siehe normalize_listing_frame)
+        limits: {Feld: max. Bytes}, Standard FIELD_BYTE_LIMITS
+        required: Felder, die nicht leer sein dürfen
+
+    Returns:
+        tuple: (Fehler-DataFrame mit row, asin_ean_sku, mp, field, problem, bytes, limit -
+                bei zusammengeführten Uploads zusätzlich source_file und source_sheet;
+                Zusammenfassung mit rows, invalid_rows, over_limit {Feld: Anzahl}, missing {Feld: Anzahl}
+                und invalid_index)
+    """
+    limits = FIELD_BYTE_LIMITS if limits is None else limits
+    asin = df["asin_ean_sku"] if "asin_ean_sku" in df.columns else pd.Series("", index=df.index)
+    mp = df["mp"] if "mp" in df.columns else pd.Series("", index=df.index)
+    parts = []
+    summary = {"rows": len(df), "over_limit": {}, "missing": {}}
+
+    for field, limit in limits.items():
+        if field not in df.columns:
+            continue
+        lengths = utf8_byte_lengths(df[field])
+        over = lengths > limit
+        count = int(over.sum())
+        if count:
+            summary["over_limit"][field] = count
+            parts.append(pd.DataFrame({
+                "index": df.index[over],
+                "row": df.index[over] + 2,  # Zeilennummer in der Datei (Kopfzeile = 1)
+                "asin_ean_sku": asin[over].to_numpy(),
+                "mp": mp[over].to_numpy(),
+                "field": field,
+                "problem": "Byte-Limit überschritten",
+                "bytes": lengths[over].to_numpy(),
+                "limit": limit,
+            }))
+
+    for field in required:
+        values = df[field] if field in df.columns else pd.Series("", index=df.index)
+        missing = values.fillna("").astype(str).str.strip() == ""
+        count = int(missing.sum())
+        if count:
+            summary["missing"][field] = count
+            parts.append(pd.DataFrame({
+                "index": df.index[missing],
+                "row": df.index[missing] + 2,
+                "asin_ean_sku": asin[missing].to_numpy(),
+                "mp": mp[missing].to_numpy(),
+                "field": field,
+                "problem": "Pflichtfeld leer",
+                "bytes": 0,
+                "limit": None,
+            }))
+
+    columns = ["index", "row", "asin_ean_sku", "mp", "field", "problem", "bytes", "limit"]
+    errors = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+    errors = errors.sort_values(["index", "field"], kind="stable", ignore_index=True)
+    invalid_index = pd.Index(errors["index"]).unique()
+    if "source_row" in df.columns:
+        # Zusammengeführte Uploads (parse_uploads): Datei, Blatt und Zeile der Herkunft angeben
+        origin = df.loc[errors["index"], list(PROVENANCE_COLUMNS)]
+        errors["row"] = origin["source_row"].to_numpy()
+        errors.insert(0, "source_sheet", origin["source_sheet"].to_numpy())
+        errors.insert(0, "source_file", origin["source_file"].to_numpy())
+    errors = errors.drop(columns="index")
+    summary["invalid_rows"] = len(invalid_index)
+    summary["invalid_index"] = invalid_index
+    return errors, summary
+
+
+# ============ HINTERGRUND-EINLESEN ============
+
+def estimate_upload_rows(source, file_name=None, all_sheets=False):
+    """
+    Schätzt die Anzahl Datenzeilen eines Uploads (für Fortschritt/ETA), ohne ihn einzulesen.
+
+    Parquet: aus den Metadaten, xlsx: aus der Blatt-Dimension (erstes oder alle Blätter),
+    CSV/TSV: Zeilenumbrüche. Gibt None zurück, wenn keine Schätzung möglich ist.
+    """
+    try:
+        upload_format = detect_upload_format(source, file_name)
+        if upload_format == "parquet" and _HAS_PYARROW:
+            return pa_parquet.ParquetFile(_rewind(source)).metadata.num_rows
+        if upload_format == "xlsx":
+            workbook = openpyxl.load_workbook(_rewind(source), read_only=True, data_only=True)
+            try:
+                worksheets = workbook.worksheets if all_sheets else workbook.worksheets[:1]
+                max_rows = [worksheet.max_row for worksheet in worksheets]
+            finally:
+                workbook.close()
+            if any(max_row is None for max_row in max_rows):
+                return None
+            return sum(max(max_row - 1, 0) for max_row in max_rows)
+        data = _rewind(source).read()
+        return max(data.count(b"\n") - 1, 0) if data else 0
+    except Exception:
+        return None
+    finally:
+        _rewind(source)
+
+
+def parse_and_normalize(source, file_name=None, schema=None, required=(), on_rows=None, on_normalize=None,
+                        sheet_name=None):
+    """
+    Liest einen Upload chunkweise ein und normalisiert ihn über `schema`.
+
+    Args:
+        on_rows: Optionaler Callback mit der Anzahl bisher gelesener Zeilen
+        on_normalize: Optionaler Callback, bevor die Normalisierung beginnt
+        sheet_name: Excel-Blatt (Standard: erstes Blatt)
+
+    Returns:
+        tuple: (DataFrame, Spalten-Report inkl. "source_columns")
+    """
+    chunks = []
+    rows = 0
+    for chunk in iter_upload_chunks(source, file_name=file_name, sheet_name=sheet_name):
+        chunks.append(chunk)
+        rows += len(chunk)
+        if on_rows:
+            on_rows(rows)
+    if not chunks:
+        df = pd.DataFrame()
+    else:
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+    source_columns = [str(c) for c in df.columns]
+    if on_normalize:
+        on_normalize()
+    df, report = normalize_listing_frame(df, schema or LISTING_SCHEMA, required=required)
+    report["source_columns"] = source_columns
+    return df, report
+
+
+class UploadParseJob:
+    """Fortschritt und Ergebnis eines Einlesevorgangs im Hintergrund"""
+
+    def __init__(self, key, total_rows=None):
+        self.key = key
+        self.total_rows = total_rows
+        self.rows = 0
+        self.status = "reading"  # reading -> normalizing -> done | error
+        self.started = time.perf_counter()
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "error")
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def progress(self):
+        """Anteil 0..1 (geschätzt), 1.0 wenn fertig"""
+        if self.done:
+            return 1.0
+        if not self.total_rows:
+            return 0.0
+        return min(self.rows / self.total_rows, 0.99)
+
+    @property
+    def eta_seconds(self):
+        """Geschätzte Restzeit in Sekunden oder None"""
+        if self.done or not self.total_rows or not self.rows_per_sec:
+            return None
+        return max(self.total_rows - self.rows, 0) / self.rows_per_sec
+
+
+class BackgroundUploadParser:
+    """
+    Liest Uploads in einem Thread-Pool ein, damit die Seite währenddessen bedienbar bleibt.
+
+    Jobs sind über einen Schlüssel (Inhalts-Hash + Schema) eindeutig: Ein erneuter Aufruf
+    mit derselben Datei (z.B. nach einem Rerun) hängt sich an den laufenden Job, statt neu zu
+    beginnen. Fertige Ergebnisse landen im ParsedUploadCache und der Job wird sofort
+    entfernt - nur Ergebnisse, die nicht in den Cache passen, bleiben bis pop() am Job hängen.
+    """
+
+    def __init__(self, cache=None, max_workers=2):
+        self.cache = cache
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload-parse")
+
+    def submit(self, key, data, file_name=None, schema=None, required=()):
+        """Startet einen Job für `data` (Bytes) oder liefert den bereits vorhandenen"""
+        def parse(job):
+            def on_rows(rows):
+                job.rows = rows
+
+            def on_normalize():
+                job.status = "normalizing"
+
+            return parse_and_normalize(
+                io.BytesIO(data), file_name, schema, required, on_rows=on_rows, on_normalize=on_normalize
+            )
+
+        return self._submit(key, lambda: estimate_upload_rows(io.BytesIO(data), file_name), parse)
+
+    def submit_files(self, key, files, schema=None, required=(), executor=None):
+        """Wie submit, aber für mehrere Dateien mit allen Tabellenblättern (siehe parse_uploads)"""
+        def estimate():
+            estimates = [estimate_upload_rows(io.BytesIO(data), file_name, all_sheets=True) for file_name, data in files]
+            return None if None in estimates else sum(estimates)
+
+        def parse(job):
+            def on_part(rows):
+                job.rows += rows
+
+            return parse_uploads(files, schema, required, executor=executor, on_part=on_part)
+
+        return self._submit(key, estimate, parse)
+
+    def _submit(self, key, estimate, parse):
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None:
+            return job
+        # Schätzung (ganzes Blatt lesen bzw. Zeilen zählen) außerhalb der Sperre - get/pop anderer
+        # Sessions sollen nicht darauf warten
+        total_rows = estimate()
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                return job
+            job = UploadParseJob(key, total_rows=total_rows)
+            self._jobs[key] = job
+        self._pool.submit(self._run, job, parse)
+        return job
+
+    def _run(self, job, parse):
+        try:
+            df, report = parse(job)
+            report["content_hash"] = job.key[0]
+            job.rows = len(df)
+            if self.cache is not None and self.cache.put(job.key, df, report):
+                # Ergebnis liegt im Cache - der Job hält keinen DataFrame mehr
+                self.pop(job.key)
+            else:
+                job.result = (df, report)
+            job.status = "done"
+        except Exception as e:
+            job.error = e
+            job.status = "error"
+        finally:
+            job.finished = time.perf_counter()
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def pop(self, key):
+        """Entfernt einen (fertigen) Job, das Ergebnis bleibt im Cache"""
+        with self._lock:
+            return self._jobs.pop(key, None)
+
+
+# ============ MEHRERE DATEIEN & TABELLENBLÄTTER ============
+
+# Herkunftsspalten, die parse_uploads jeder Zeile mitgibt (für Fehlerberichte)
+PROVENANCE_COLUMNS = ("source_file", "source_sheet", "source_row")
+
+# Worker-Prozesse für das parallele Einlesen mehrerer Dateien/Blätter
+UPLOAD_PROCESS_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def list_upload_sheets(source, file_name=None):
+    """Namen aller Tabellenblätter eines xlsx-Uploads; [None] für CSV/TSV/Parquet"""
+    if detect_upload_format(source, file_name) != "xlsx":
+        return [None]
+    workbook = openpyxl.load_workbook(_rewind(source), read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+        _rewind(source)
+
+
+def make_upload_process_pool(max_workers=UPLOAD_PROCESS_WORKERS):
+    """
+    Prozess-Pool für parse_uploads.
+
+    Startet die Worker per "spawn", damit keine Threads oder Sperren des Elternprozesses
+    (z.B. des Streamlit-Servers) per fork in die Worker kopiert werden.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _parse_upload_part(file_name, data, sheet_name, schema, required):
+    """Worker: liest und normalisiert ein Blatt einer Datei und ergänzt die Herkunftsspalten"""
+    df, report = parse_and_normalize(io.BytesIO(data), file_name, schema, required, sheet_name=sheet_name)
+    df["source_file"] = file_name or ""
+    df["source_sheet"] = sheet_name or ""
+    df["source_row"] = df.index + 2  # Zeilennummer in der Datei (Kopfzeile = 1)
+    return df, report
+
+
+def parse_uploads(files, schema=None, required=(), executor=None, on_part=None):
+    """
+    Liest mehrere Dateien mit allen Tabellenblättern ein und führt sie zu einem DataFrame zusammen.
+
+    Jedes Blatt wird einzeln gelesen und über dasselbe Schema normalisiert - mit `executor`
+    (siehe make_upload_process_pool) parallel. Die Zeilen folgen der Reihenfolge der Dateien
+    und Blätter, jede Zeile trägt ihre Herkunft in PROVENANCE_COLUMNS. Blätter ohne Datenzeilen
+    oder ohne Pflichtspalten werden übersprungen und im Report aufgeführt.
+
+    Args:
+        files: Liste von (Dateiname, Bytes)
+        executor: Optionaler Executor; fällt ein Prozess-Pool aus, wird im aktuellen Prozess weitergelesen
+        on_part: Optionaler Callback mit der Zeilenzahl jedes fertigen Blatts
+
+    Returns:
+        tuple: (DataFrame, Spalten-Report wie bei parse_and_normalize + "parts" und "skipped_parts")
+    """
+    schema = schema or LISTING_SCHEMA
+    required = list(required)
+    parts = [
+        (file_name, data, sheet_name)
+        for file_name, data in files
+        for sheet_name in list_upload_sheets(io.BytesIO(data), file_name)
+    ]
+    futures = None
+    if executor is not None and len(parts) > 1:
+        futures = [executor.submit(_parse_upload_part, *part, schema, required) for part in parts]
+
+    results = []
+    for index, (file_name, data, sheet_name) in enumerate(parts):
+        result = None
+        try:
+            if futures is not None:
+                try:
+                    result = futures[index].result()
+                except BrokenProcessPool:
+                    futures = None
+            if result is None:
+                result = _parse_upload_part(file_name, data, sheet_name, schema, required)
+        except Exception as e:
+            origin = f"{file_name} › {sheet_name}" if sheet_name else file_name
+            raise ValueError(f"{origin}: {e}") from e
+        results.append(result)
+        if on_part:
+            on_part(len(result[0]))
+
+    frames = []
+    merged = {"mapping": {}, "found": [], "unmapped": [], "duplicates": {}, "missing": [],
+              "source_columns": [], "parts": [], "skipped_parts": []}
+    found = set()
+    for (file_name, _, sheet_name), (df, report) in zip(parts, results):
+        part = {"file": file_name, "sheet": sheet_name, "rows": len(df)}
+        if df.empty or report["missing"]:
+            part["reason"] = "Keine Datenzeilen" if df.empty else f"Fehlende Spalten: {', '.join(report['missing'])}"
+            part["missing"] = report["missing"]
+            merged["skipped_parts"].append(part)
+            continue
+        merged["parts"].append(part)
+        frames.append(df)
+        found.update(report["found"])
+        merged["mapping"].update(report["mapping"])
+        for key in ("unmapped", "source_columns"):
+            merged[key].extend(col for col in report[key] if col not in merged[key])
+        for target, cols in report["duplicates"].items():
+            known = merged["duplicates"].setdefault(target, [])
+            known.extend(col for col in cols if col not in known)
+
+    merged["found"] = [col for col in schema if col in found]
+    if not frames:
+        # Kein Blatt verwendbar: fehlende Pflichtspalten aller Blätter melden
+        missing = {col for part in merged["skipped_parts"] for col in part["missing"]}
+        merged["missing"] = [col for col in required if col in missing]
+        return pd.DataFrame(columns=list(schema) + list(PROVENANCE_COLUMNS)), merged
+    return pd.concat(frames, ignore_index=True), merged
+
+
+def source_row_labels(df):
+    """Ortsangabe je Zeile für Meldungen, z.B. "datei.xlsx › Blatt1, Zeile 5" oder "Zeile 5" """
+    if "source_row" not in df.columns:
+        return [f"Zeile {index + 2}" for index in df.index]
+    labels = []
+    for file_name, sheet_name, row in zip(df["source_file"], df["source_sheet"], df["source_row"]):
+        origin = f"{file_name} › {sheet_name}" if sheet_name else file_name
+        labels.append(f"{origin}, Zeile {row}")
+    return labels
+
+
+# ============ DUPLIKATE & SCHREIBPLAN ============
+
+# Felder, die beim Speichern als Listing-Daten an die Datenbank gehen
+SAVE_DATA_FIELDS = [
+    "Product", "Titel", "Bullet1", "Bullet2", "Bullet3", "Bullet4", "Bullet5",
+    "Description", "SearchTerms", "Keywords", "name", "image", "comments",
+]
+
+
+def number_duplicate_keys(keys, key_counts=None, seen=None):
+    """
+    Nummeriert mehrfach vorkommende Kennungen durch: A, A, B -> A-1, A-2, B (vektorisiert).
+    Leere Kennungen bleiben unverändert.
+
+    Für chunkweise Verarbeitung (siehe iter_ingest_chunks):
+        key_counts: Anzahl je Kennung in der ganzen Datei (siehe scan_key_counts)
+        seen: Dict mit den in vorherigen Chunks vergebenen Nummern (wird fortgeschrieben)
+
+    Returns:
+        tuple: (nummerierte Series, Anzahl Zeilen mit duplizierter Kennung)
+    """
+    keys = keys.astype(str)
+    grouped = keys.groupby(keys, sort=False)
+    if key_counts is None:
+        counts = grouped.transform("size")
+    else:
+        counts = keys.map(key_counts).fillna(0)
+    occurrence = grouped.cumcount() + 1
+    if seen is not None:
+        occurrence = occurrence + keys.map(seen).fillna(0).astype(int)
+        for key, count in keys.value_counts().items():
+            seen[key] = seen.get(key, 0) + int(count)
+    is_duplicate = (keys != "") & (counts > 1)
+    numbered = keys.where(~is_duplicate, keys + "-" + occurrence.astype(str))
+    return numbered, int(is_duplicate.sum())
+
+
+def plan_listing_writes(frame, lookup_existing, overwrite, prefer_existing_original=False, key_counts=None, seen=None):
+    """
+    Erstellt vor dem Schreiben einen Plan (insert/update/skip/error) für jede Zeile.
+
+    Duplikate innerhalb des Uploads werden durchnummeriert (ASIN-1, ASIN-2). Die Existenz
+    aller Kandidaten (ASIN, MP) wird mit einem einzigen Aufruf von `lookup_existing`
+    geprüft, statt pro Zeile eine Abfrage zu schicken.
+
+    Args:
+        frame: Normalisierter DataFrame mit den Spalten asin_ean_sku und mp
+        lookup_existing: Callable, das eine Liste von (asin, mp)-Paaren bekommt und
+            {(asin, mp): id} für alle vorhandenen Einträge zurückgibt
+        overwrite: Bestehende Einträge aktualisieren (sonst überspringen)
+        prefer_existing_original: Existiert die nicht nummerierte ASIN bereits in der DB,
+            wird sie statt der nummerierten verwendet (Verhalten von "Alle Listings speichern")
+        key_counts, seen: Für chunkweise Verarbeitung, siehe number_duplicate_keys
+
+    Returns:
+        tuple: (Plan-DataFrame mit asin, mp, listing_id, action; Anzahl duplizierter Zeilen)
+    """
+    raw = frame["asin_ean_sku"].astype(str)
+    mp = frame["mp"].astype(str)
+    numbered, duplicate_count = number_duplicate_keys(raw, key_counts=key_counts, seen=seen)
+
+    valid = (raw != "") & (mp != "")
+    candidates = set(zip(numbered[valid], mp[valid]))
+    if prefer_existing_original:
+        candidates |= set(zip(raw[valid], mp[valid]))
+    existing = lookup_existing(sorted(candidates)) if candidates else {}
+
+    final = numbered
+    if prefer_existing_original and existing:
+        raw_exists = pd.Series([(a, m) in existing for a, m in zip(raw, mp)], index=frame.index)
+        final = numbered.where(~raw_exists, raw)
+
+    listing_id = pd.Series([existing.get((a, m)) for a, m in zip(final, mp)], index=frame.index, dtype=object)
+    exists = listing_id.notna()
+    action = pd.Series("insert", index=frame.index, dtype=object)
+    action = action.mask(exists, "update" if overwrite else "skip")
+    action = action.mask(~valid, "error")
+
+    plan = pd.DataFrame({"asin": final, "mp": mp, "listing_id": listing_id, "action": action}, index=frame.index)
+    return plan, duplicate_count
+
+
+def plan_to_save_records(frame, plan):
+    """Baut aus normalisiertem Frame + Plan die Einträge für batch_save_listings_to_db"""
+    data_fields = [f for f in SAVE_DATA_FIELDS if f in frame.columns]
+    records = frame_to_listing_records(frame, data_fields + ["account", "project"])
+    save_records = []
+    for record, asin, mp, listing_id, action in zip(
+        records, plan["asin"].tolist(), plan["mp"].tolist(), plan["listing_id"].tolist(), plan["action"].tolist()
+    ):
+        data = {field: record[field] for field in data_fields}
+        data["image"] = data.get("image") or None
+        data["comments"] = data.get("comments") or None
+        save_records.append({
+            "data": data,
+            "asin": asin,
+            "mp": mp,
+            "account": record["account"] or None,
+            "project": record["project"] or None,
+            "action": action,
+            "listing_id": listing_id,
+        })
+    return save_records
+
+
+# ============ INGEST-PIPELINE ============
+
+# Anzahl Chunks, die zwischen zwei Pipeline-Stufen warten dürfen (Backpressure)
+INGEST_QUEUE_SIZE = 2
+
+_PIPELINE_DONE = object()
+
+
+class _PipelineError:
+    """Transportiert eine Exception aus einem Pipeline-Thread zum Verbraucher"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put_until_stopped(target_queue, item, stop):
+    """Legt `item` in die Queue und wartet bei voller Queue, bis Platz ist oder abgebrochen wird"""
+    while not stop.is_set():
+        try:
+            target_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def scan_key_counts(source, file_name=None, schema=None, key="asin_ean_sku", sheet_name=None, required=()):
+    """
+    Vorab-Durchlauf: zählt, wie oft jede Kennung in der ganzen Datei vorkommt.
+
+    Wird für die Duplikat-Nummerierung (ASIN-1, ASIN-2) gebraucht, wenn die Datei danach nur
+    noch chunkweise verarbeitet wird. Gehalten wird nur die Zählung, nicht die Zeilen.
+    Fehlen Spalten aus `required`, wird ValueError geworfen.
+
+    Returns:
+        pd.Series: Anzahl je Kennung
+    """
+    counts = pd.Series(dtype="int64")
+    for chunk in iter_upload_chunks(source, file_name=file_name, sheet_name=sheet_name):
+        normalized, report = normalize_listing_frame(chunk, schema or LISTING_SCHEMA, required)
+        if report["missing"]:
+            _rewind(source)
+            raise ValueError(f"Fehlende erforderliche Spalten: {', '.join(report['missing'])}")
+        keys = normalized[key].astype(str)
+        counts = counts.add(keys[keys != ""].value_counts(), fill_value=0)
+    _rewind(source)
+    return counts.astype("int64")
+
+
+def iter_ingest_chunks(source, file_name=None, schema=None, required=REQUIRED_SAVE_FIELDS, limits=None,
+                       chunk_size=READ_CHUNK_ROWS, queue_size=INGEST_QUEUE_SIZE, sheet_name=None):
+    """
+    Liest, normalisiert und validiert einen Upload als überlappende Pipeline.
+
+    Ein Thread liest Chunks, ein zweiter normalisiert und validiert sie; der Aufrufer
+    (z.B. der Datenbank-Writer) verarbeitet derweil den vorherigen Chunk. Zwischen den
+    Stufen liegen Queues mit `queue_size` Plätzen: Ist der Writer langsamer, warten die
+    vorderen Stufen, statt die ganze Datei in den Speicher zu lesen.
+
+    Yields:
+        tuple: (normalisierter Chunk, Fehler-DataFrame, Zusammenfassung) - siehe validate_listing_frame
+    """
+    stop = threading.Event()
+    raw_chunks = queue.Queue(maxsize=queue_size)
+    ready_chunks = queue.Queue(maxsize=queue_size)
+
+    def read():
+        try:
+            for chunk in iter_upload_chunks(source, file_name=file_name, chunk_size=chunk_size, sheet_name=sheet_name):
+                if not _put_until_stopped(raw_chunks, chunk, stop):
+                    return
+            _put_until_stopped(raw_chunks, _PIPELINE_DONE, stop)
+        except Exception as e:
+            _put_until_stopped(raw_chunks, _PipelineError(e), stop)
+
+    def prepare():
+        while not stop.is_set():
+            try:
+                item = raw_chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _PIPELINE_DONE or isinstance(item, _PipelineError):
+                _put_until_stopped(ready_chunks, item, stop)
+                return
+            try:
+                chunk, column_report = normalize_listing_frame(item, schema or LISTING_SCHEMA, required=required)
+                errors, summary = validate_listing_frame(chunk, limits, required)
+                summary["column_report"] = column_report
+            except Exception as e:
+                _put_until_stopped(ready_chunks, _PipelineError(e), stop)
+                return
+            if not _put_until_stopped(ready_chunks, (chunk, errors, summary), stop):
+                return
+
+    threads = [
+        threading.Thread(target=read, name="ingest-read", daemon=True),
+        threading.Thread(target=prepare, name="ingest-prepare", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = ready_chunks.get()
+            if item is _PIPELINE_DONE:
+                return
+            if isinstance(item, _PipelineError):
+                raise item.error
+            yield item
+    finally:
+        # Auch bei Abbruch durch den Aufrufer die Threads beenden
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+
+# ============ BENCHMARKS ============
+
+def _benchmark_frame(rows):
+    """Erzeugt einen synthetischen Listing-Katalog für Benchmarks"""
+    return pd.DataFrame({
+        "ASIN / EAN / SKU": [f"B{i:09d}" for i in range(rows)],
+        "EAN": [f"{4000000000000 + i:013d}" for i in range(rows)],
+        "MP": ["DE", "FR", "UK", "IT"] * (rows // 4) + ["DE"] * (rows % 4),
+        "Titel": [f"Markenname Produkt {i}, Edelstahl, spülmaschinenfest, 1,2 L, Silber" for i in range(rows)],
+        "Bullet1": ["AUSLAUFSICHER: Der Deckel schließt dicht, damit nichts in der Tasche landet"] * rows,
+        "Bullet2": ["LANGLEBIG: Hochwertiger Edelstahl 18/10 ohne Beschichtung"] * rows,
+        "Description": ["Beschreibung " * 60] * rows,
+        "SearchTerms": ["brotdose lunchbox meal prep"] * rows,
+    })
+
+
+def benchmark_ingest(rows=50000, repeat=1):
+    """
+    Vergleicht die Einlesezeit je Upload-Format (xlsx, CSV, TSV, Parquet) für `rows` Zeilen.
+
+    Returns:
+        list: Dicts mit format, bytes, seconds, rows_per_sec
+    """
+    frame = _benchmark_frame(rows)
+    files = {}
+    xlsx_buffer = io.BytesIO()
+    frame.to_excel(xlsx_buffer, index=False, engine="xlsxwriter")
+    files["xlsx"] = xlsx_buffer.getvalue()
+    files["csv"] = frame.to_csv(index=False, sep=";").encode("utf-8")
+    files["tsv"] = frame.to_csv(index=False, sep="\t").encode("utf-8")
+    if _HAS_PYARROW:
+        parquet_buffer = io.BytesIO()
+        frame.to_parquet(parquet_buffer, index=False)
+        files["parquet"] = parquet_buffer.getvalue()
+
+    cases = [(f"{fmt}", lambda data: read_upload_frame(io.BytesIO(data))) for fmt in files]
+    cases.append(("xlsx (pd.read_excel)", lambda data: pd.read_excel(io.BytesIO(data))))
+
+    results = []
+    for label, reader in cases:
+        data = files[label.split(" ")[0]]
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = reader(data)
+            elapsed = time.perf_counter() - started
+            assert len(result) == rows
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({"format": label, "bytes": len(data), "seconds": best, "rows_per_sec": rows / best if best else 0})
+    return results
+
+
+def benchmark_normalize(rows=100000):
+    """Misst normalize_listing_frame + frame_to_listing_records und validate_listing_frame für `rows` Zeilen"""
+    frame = read_upload_frame(io.BytesIO(_benchmark_frame(rows).to_csv(index=False).encode("utf-8")), "bench.csv")
+    started = time.perf_counter()
+    normalized, _ = normalize_listing_frame(frame)
+    normalize_seconds = time.perf_counter() - started
+    frame_to_listing_records(normalized)
+    total_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    validate_listing_frame(normalized)
+    validate_seconds = time.perf_counter() - started
+    return [
+        {"case": "normalize_listing_frame", "seconds": normalize_seconds, "rows_per_sec": rows / normalize_seconds},
+        {"case": "+ frame_to_listing_records", "seconds": total_seconds, "rows_per_sec": rows / total_seconds},
+        {"case": "validate_listing_frame", "seconds": validate_seconds, "rows_per_sec": rows / validate_seconds},
+    ]
+
+
+def benchmark_export(sizes=(1000, 10000, 100000), measure_memory=False):
+    """
+    Vergleicht pd.ExcelWriter (openpyxl, BytesIO) mit write_xlsx_stream und dem Flat-File-Export
+    (Amazon-Layout).
+
+    Mit `measure_memory` wird jeder Fall ein zweites Mal unter tracemalloc ausgeführt
+    (tracemalloc bremst stark und wird deshalb nicht für die Zeitmessung verwendet).
+
+    Returns:
+        list: Dicts mit case, bytes, seconds, rows_per_sec (und peak_mb)
+    """
+    import tracemalloc
+
+    results = []
+    for rows in sizes:
+        listings, _ = normalize_listing_frame(_benchmark_frame(rows))
+        listings = frame_to_listing_records(listings)
+
+        def openpyxl_export():
+            output = io.BytesIO()
+            with pd.ExcelWriter(output, engine="openpyxl") as writer:
+                pd.DataFrame([listing_to_amazon_row(l) for l in listings]).to_excel(writer, index=False, sheet_name="Amazon Export")
+            return output.getvalue()
+
+        def stream_export():
+            output, _ = export_listings_xlsx(listings, layout="amazon")
+            return read_export(output)
+
+        def flat_file_export(file_format):
+            output, _ = export_listings_file(listings, layout="amazon", file_format=file_format)
+            return read_export(output)
+
+        cases = (
+            ("openpyxl", openpyxl_export),
+            ("xlsxwriter constant_memory", stream_export),
+            ("flat-file tsv", lambda: flat_file_export("tsv")),
+            ("flat-file tsv.gz", lambda: flat_file_export("tsv.gz")),
+        )
+        for label, export in cases:
+            started = time.perf_counter()
+            data = export()
+            elapsed = time.perf_counter() - started
+            result = {"case": f"{rows:>7} {label}", "bytes": len(data), "seconds": elapsed, "rows_per_sec": rows / elapsed}
+            if measure_memory:
+                tracemalloc.start()
+                data = export()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                # Die fertige Datei selbst zählt nicht zum Arbeitsspeicher des Exports
+                result["peak_mb"] = (peak - len(data)) / 1e6
+            results.append(result)
+    return results
+
+
+def _print_benchmark(title, results):
+    print(title)
+    for r in results:
+        label = r.get("format") or r.get("case")
+        size = f"  {r['bytes'] / 1e6:8.1f} MB" if "bytes" in r else ""
+        peak = f"  Peak {r['peak_mb']:8.1f} MB" if "peak_mb" in r else ""
+        print(f"  {label:<36} {r['seconds']:8.3f} s  {r['rows_per_sec']:>12,.0f} Zeilen/s{size}{peak}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks für Upload/Export des Amazon Listing Editors")
+    parser.add_argument("benchmark", choices=["ingest", "normalize", "export"])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--memory", action="store_true", help="Spitzen-Speicherverbrauch messen (langsam)")
+    args = parser.parse_args()
+
+    if args.benchmark == "ingest":
+        _print_benchmark(f"Einlesen von {args.rows} Zeilen je Format:", benchmark_ingest(args.rows, args.repeat))
+    elif args.benchmark == "normalize":
+        _print_benchmark(f"Normalisieren von {args.rows} Zeilen:", benchmark_normalize(args.rows))
+    elif args.benchmark == "export":
+        _print_benchmark("Export (Amazon-Layout):", benchmark_export(args.sizes, args.memory))